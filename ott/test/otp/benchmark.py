@@ -0,0 +1,289 @@
+"""
+Runner overhead benchmark
+
+Runs generated USFPlanner lines through the same phases as test_runner.py, in-process
+and against a synthetic responder (stub_server's planner, no sockets), so what is left
+is the runner's own cost: building suites, copying params per test method, parsing and
+checking responses, writing records and rendering the report.
+
+Every size runs in a fresh interpreter, so the peak memory (ru_maxrss) is that size's own.
+
+    python benchmark.py                         1k and 10k lines
+    python benchmark.py --sizes 100000          100k lines, several GB of memory
+    python benchmark.py --sizes 1000 --workers 4
+    python benchmark.py --startup               startup time budget check, exits 1 when over
+
+The startup check times a fresh interpreter importing test_runner, which is all a local
+CSV run or an --add pays before its first request, and fails if that import loaded the
+report or remote sheet libraries.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import resource
+import tempfile
+import argparse
+import threading
+import subprocess
+
+# so the runner's modules import from any working directory
+HERE = os.path.dirname(os.path.abspath(__file__))
+if HERE not in sys.path: sys.path.insert(0, HERE)
+
+
+class SyntheticClient(object):
+    """ http_client.HTTPClient stand-in answering from stub_server's synthetic responses """
+
+    def __init__(self):
+        import stub_server
+        self.stub_server = stub_server
+
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.elapsed = 0.0
+
+    def get(self, url, headers=None, timeout=None):
+        import urlparse
+
+        start = time.time()
+        parts = urlparse.urlsplit(url)
+        accept = (headers or {}).get('Accept', '')
+        type = 'json' if 'json' in accept else 'xml' if 'xml' in accept else None
+
+        status, ctype, body = self.stub_server.synthetic(parts.path, dict(urlparse.parse_qsl(parts.query)), type)
+
+        with self.lock:
+            self.requests += 1
+            self.elapsed += time.time() - start
+
+        return status, body
+
+    def close(self):
+        pass
+
+
+def generate(count, seed=0):
+    """
+    count USFPlanner CSV rows, every one a distinct request, with a typical mix of checks
+
+    The expectations are taken from stub_server's synthetic plan for the row, so every
+    check passes and the benchmark times normal test runs.  Trips whose plan
+    test_result_too_small would reject are drawn again, rows whose itineraries are too far
+    apart for one expected duration or distance go without that check.
+    """
+    import stub_server
+
+    rnd = random.Random(seed)
+    modes = ['TRANSIT,WALK', 'BUS,WALK', 'BICYCLE', 'WALK', 'CAR']
+
+    rows = []
+    while len(rows) < count:
+        mode = rnd.choice(modes)
+        row = {'description': "generated %d" % len(rows),
+               'fromPlace': "%.6f,%.6f" % (27.9 + rnd.random() * 0.3, -82.6 + rnd.random() * 0.3),
+               'toPlace': "%.6f,%.6f" % (27.9 + rnd.random() * 0.3, -82.6 + rnd.random() * 0.3),
+               'mode': mode, 'maxWalkDistance': str(rnd.choice([500, 750, 1000, 1500])),
+               'arriveBy': 'false', 'showIntermediateStops': 'false',
+               'invalid_modes': "['CAR']" if mode != 'CAR' else "['BUS']",
+               'max_walk': str(rnd.choice([750, 1000])), 'not_expected': 'error'}
+        if 'WALK' in mode and mode != 'WALK': row['mode_exists'] = "['BUS']"
+
+        query = dict((k, row[k]) for k in ('fromPlace', 'toPlace', 'mode', 'arriveBy'))
+        if len(stub_server.plan(query, 'xml')[2]) <= 1000: continue
+        itineraries = json.loads(stub_server.plan(query, 'json')[2])['plan']['itineraries']
+
+        # test_trip_duration and test_trip_distance allow 20% either way of the expected value
+        durations = [it['duration'] for it in itineraries]
+        if max(durations) <= 1.5 * min(durations): row['duration'] = str((min(durations) + max(durations)) / 2)
+        distances = [sum(leg['distance'] for leg in it['legs']) for it in itineraries]
+        if max(distances) <= 1.5 * min(distances): row['distance'] = "%.1f" % ((min(distances) + max(distances)) / 2)
+
+        legs = [len(it['legs']) for it in itineraries]
+        row['num_legs'] = "%d|%d" % (min(legs), max(legs))
+        rows.append(row)
+
+    return rows
+
+
+def peak_memory():
+    """ peak resident memory of this process in MB (ru_maxrss is kB on Linux, bytes on OS X) """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024.0 * 1024.0) if sys.platform == 'darwin' else peak / 1024.0
+
+
+def run(count, workers=1, template=None):
+    """ one benchmark run of count lines, returns {phase: seconds, ...} """
+
+    import logging
+    logging.basicConfig(level=logging.ERROR)
+
+    res = {'rows': count, 'workers': workers, 'phases': {}, 'peak_after': {}}
+    phases = res['phases']
+
+    start = time.time()
+    import test_runner
+    import http_client
+    import report_writer
+    phases['import'] = time.time() - start
+    res['peak_after']['import'] = peak_memory()
+
+    client = http_client.install(SyntheticClient())
+    tmp = tempfile.mkdtemp(prefix="otp_benchmark")
+
+    try:
+        otp_url = "http://localhost:8080/otp/"
+        suites = [{'file': 'generated.csv', 'name': 'USFPlanner', 'cls': test_runner.USFPlanner,
+                   'data': generate(count)}]
+
+        start = time.time()
+        lines = list(test_runner.load_lines(suites, {'otp_url': otp_url}, {}, []))
+        phases['load'] = time.time() - start
+        res['peak_after']['load'] = peak_memory()
+
+        start = time.time()
+        test_runner._dependencies.resolve([(s['cls'], row) for s, i, row in lines], workers)
+        phases['dependencies'] = time.time() - start
+        res['peak_after']['dependencies'] = peak_memory()
+
+        start = time.time()
+        results_path = os.path.join(tmp, "results.jsonl")
+        writer = report_writer.ResultWriter(results_path, os.path.join(tmp, "progress.html"))
+        for rec in test_runner.workers.imap(lambda line: test_runner.run_line(*line), lines, workers):
+            writer.write(rec)
+        writer.close()
+        phases['run'] = time.time() - start
+        res['peak_after']['run'] = peak_memory()
+
+        start = time.time()
+        report = test_runner.Report()
+        for rec in report_writer.load_records(results_path):
+            report.add(rec)
+        phases['report'] = time.time() - start
+        res['peak_after']['report'] = peak_memory()
+
+        if template is not None:
+            start = time.time()
+            html = report.render(template, fetch_stats=test_runner._fetch_stats.summary())
+            phases['render'] = time.time() - start
+            res['peak_after']['render'] = peak_memory()
+            res['report_bytes'] = len(html)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    res['requests'] = client.requests
+    res['responder'] = client.elapsed
+    res['total'] = sum(phases.values())
+    res['overhead'] = res['total'] - phases['import'] - client.elapsed
+    res['per_row_ms'] = res['overhead'] / count * 1000 if count > 0 else 0
+    res['peak_mb'] = peak_memory()
+
+    return res
+
+
+# only needed for remote sheets or the final report, importing test_runner must not load them
+LAZY_MODULES = ('mako', 'gdata', 'oauth2client', 'httplib2')
+
+STARTUP = """
+import sys, time
+start = time.time()
+sys.path.insert(0, %r)
+import test_runner
+print time.time() - start
+print ','.join(m for m in %r if m in sys.modules)
+"""
+
+
+def startup(repeat=5):
+    """
+    Median wall time of a fresh interpreter importing test_runner, the median of the import
+    alone, and the LAZY_MODULES that import loaded anyway
+    """
+
+    walls = []
+    imports = []
+    eager = set()
+    for n in xrange(repeat):
+        start = time.time()
+        out = subprocess.Popen([sys.executable, '-c', STARTUP % (HERE, LAZY_MODULES)],
+                               stdout=subprocess.PIPE).communicate()[0]
+        walls.append(time.time() - start)
+
+        lines = out.strip().split('\n')
+        imports.append(float(lines[0]))
+        if len(lines) > 1 and lines[1]: eager.update(lines[1].split(','))
+
+    median = lambda v: sorted(v)[len(v) / 2]
+    return {'wall': median(walls), 'import': median(imports), 'eager': sorted(eager)}
+
+
+def table(results):
+    phases = ['import', 'load', 'dependencies', 'run', 'report', 'render']
+
+    out = ["%8s %7s" % ("rows", "workers") + ''.join("%13s" % p for p in phases) +
+           "%12s %10s %10s" % ("responder s", "ms/row", "peak MB")]
+    for r in results:
+        out.append("%8d %7d" % (r['rows'], r['workers']) +
+                   ''.join("%13s" % ("%.3f" % r['phases'][p] if p in r['phases'] else "-") for p in phases) +
+                   "%12.3f %10.3f %10.1f" % (r['responder'], r['per_row_ms'], r['peak_mb']))
+
+    return '\n'.join(out)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the OTP test runner's own overhead")
+
+    parser.add_argument('--sizes', help="Comma-delimited numbers of generated lines (default 1000,10000)")
+    parser.add_argument('-w', '--workers', type=int, help="Lines run concurrently (default 1)")
+    parser.add_argument('-t', '--template-path',
+                        help="Report template to time rendering with (default templates/simple_template.html, "
+                             "empty to skip)")
+    parser.add_argument('--json', dest='json_path', help="Write the results as JSON to this path")
+    parser.add_argument('--startup', action='store_true',
+                        help="Only check the startup time of a local run against --startup-budget")
+    parser.add_argument('--startup-budget', type=float,
+                        help="Max seconds for a fresh interpreter to import test_runner (default 0.5)")
+    parser.add_argument('--child', type=int, help=argparse.SUPPRESS)
+
+    parser.set_defaults(sizes="1000,10000", workers=1, startup_budget=0.5,
+                        template_path=os.path.join(HERE, 'templates', 'simple_template.html'))
+
+    args = parser.parse_args(sys.argv[1:])
+
+    if args.child is not None:
+        print json.dumps(run(args.child, args.workers, args.template_path or None))
+        sys.exit(0)
+
+    if args.startup:
+        res = startup()
+        print "startup: %.3fs wall, %.3fs importing test_runner (budget %.3fs)" % (res['wall'], res['import'],
+                                                                               args.startup_budget)
+
+        failed = False
+        if res['wall'] > args.startup_budget:
+            print "FAIL: startup is over budget"
+            failed = True
+        if len(res['eager']) > 0:
+            print "FAIL: importing test_runner loaded %s" % ', '.join(res['eager'])
+            failed = True
+
+        sys.exit(1 if failed else 0)
+
+    results = []
+    for size in [int(s) for s in args.sizes.split(',')]:
+        cmd = [sys.executable, os.path.abspath(__file__), '--child', str(size), '--workers', str(args.workers)]
+        cmd += ['--template-path', args.template_path or '']
+
+        out = subprocess.Popen(cmd, stdout=subprocess.PIPE).communicate()[0]
+        results.append(json.loads(out.strip().split('\n')[-1]))
+
+        print table(results[-1:]) if len(results) == 1 else table(results[-1:]).split('\n')[-1]
+        sys.stdout.flush()
+
+    if args.json_path is not None:
+        fp = open(args.json_path, "w")
+        json.dump(results, fp, indent=1, sort_keys=True)
+        fp.close()
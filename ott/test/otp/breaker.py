@@ -0,0 +1,161 @@
+"""
+Circuit breaker and adaptive timeouts for the OTP test runner's fetches
+
+CircuitBreaker counts consecutive failures (connection errors, timeouts and 5xx
+responses) per host.  After 'threshold' of them the host's circuit opens and every
+further request to it fails at once with EndpointUnavailable instead of waiting for
+its own timeout.  After 'cooldown' seconds one request is let through as a probe, a
+success closes the circuit again, a failure or a probe cut short by its adaptive timeout
+keeps it open for another cooldown.
+
+AdaptiveTimeout gives every endpoint (URL without the query string) a timeout of a
+multiple of its observed p99 latency, never more than the configured --timeout, so a
+hung request to a normally fast endpoint gives up long before the global limit.  It is
+off unless a multiplier is set (--timeout-multiplier), and a request it cut short is
+not a failure for the CircuitBreaker: a slow answer doesn't mean the host is down.
+"""
+
+import time
+import socket
+import threading
+import collections
+import urlparse
+
+import metrics
+import http_client
+
+
+class EndpointUnavailable(Exception):
+    """ raised instead of calling a host whose circuit is open """
+
+    def __init__(self, url, host, error):
+        super(EndpointUnavailable, self).__init__("%s unavailable (%s), not calling %s" % (host, error, url))
+        self.url = url
+        self.host = host
+        self.error = error
+
+
+def host(url):
+    parts = urlparse.urlsplit(url)
+    return parts.netloc or parts.path
+
+
+def is_failure(ex):
+    """ True if ex means the server is down or broken, an HTTP 4xx is the request's fault """
+    if isinstance(ex, http_client.HTTPError):
+        try:
+            return int(ex.status) >= 500
+        except (TypeError, ValueError):
+            return True
+
+    return not isinstance(ex, EndpointUnavailable)
+
+
+def is_timeout(ex):
+    return isinstance(ex, socket.timeout)
+
+
+class CircuitBreaker(object):
+    """ per-host consecutive failure counter, threshold 0 never opens """
+
+    def __init__(self, threshold=5, cooldown=60):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.lock = threading.Lock()
+        self.hosts = {}  # host -> {'failures', 'opened', 'probing', 'trips', 'rejected', 'error'}
+
+    def _state(self, h):
+        return self.hosts.setdefault(h, {'failures': 0, 'opened': None, 'probing': False, 'trips': 0,
+                                         'rejected': 0, 'error': None})
+
+    def check(self, url):
+        """ raises EndpointUnavailable if the host's circuit is open, lets one probe through after cooldown """
+        if self.threshold <= 0: return
+
+        h = host(url)
+        with self.lock:
+            st = self._state(h)
+            if st['opened'] is None: return
+
+            if not st['probing'] and time.time() - st['opened'] >= self.cooldown:
+                st['probing'] = True
+                return
+
+            st['rejected'] += 1
+            error = st['error']
+
+        raise EndpointUnavailable(url, h, error)
+
+    def success(self, url):
+        with self.lock:
+            st = self._state(host(url))
+            st['failures'] = 0
+            st['opened'] = None
+            st['probing'] = False
+
+    def failure(self, url, ex):
+        if not is_failure(ex): return self.success(url)
+
+        with self.lock:
+            st = self._state(host(url))
+            st['failures'] += 1
+            st['error'] = str(ex)
+
+            if st['probing']:
+                # the probe failed, stay open for another cooldown
+                st['opened'] = time.time()
+                st['probing'] = False
+            elif st['opened'] is None and 0 < self.threshold <= st['failures']:
+                st['opened'] = time.time()
+                st['trips'] += 1
+
+    def release(self, url):
+        """ a request that proved nothing about the host, e.g. one cut short by its adaptive timeout """
+        with self.lock:
+            st = self._state(host(url))
+            if st['probing']:
+                # the probe gave no answer, stay open for another cooldown and let the next one through then
+                st['opened'] = time.time()
+                st['probing'] = False
+
+    def unavailable(self):
+        """ [{'host', 'failures', 'trips', 'rejected', 'error', 'open'}] of every host whose circuit ever opened """
+        with self.lock:
+            return [{'host': h, 'failures': st['failures'], 'trips': st['trips'], 'rejected': st['rejected'],
+                     'error': st['error'], 'open': st['opened'] is not None}
+                    for h, st in sorted(self.hosts.items()) if st['trips'] > 0]
+
+
+class AdaptiveTimeout(object):
+    """
+    Per-endpoint timeout of multiplier x the p99 of its last 'window' latencies, between
+    'floor' and 'cap' seconds.  Until an endpoint has min_samples latencies it gets cap,
+    multiplier 0 (the default) always gives cap.
+    """
+
+    def __init__(self, cap=45, multiplier=0, floor=2.0, min_samples=10, window=200):
+        self.cap = cap
+        self.multiplier = multiplier
+        self.floor = floor
+        self.min_samples = min_samples
+        self.window = window
+        self.lock = threading.Lock()
+        self.samples = {}  # endpoint -> deque of latencies
+
+    def add(self, url, elapsed):
+        with self.lock:
+            self.samples.setdefault(metrics.endpoint(url), collections.deque(maxlen=self.window)).append(elapsed)
+
+    def timeout(self, url):
+        if self.multiplier <= 0: return self.cap
+
+        with self.lock:
+            lat = self.samples.get(metrics.endpoint(url))
+            if lat is None or len(lat) < self.min_samples: return self.cap
+            p99 = metrics.percentile(sorted(lat), 99)
+
+        return min(self.cap, max(self.floor, p99 * self.multiplier))
+
+    def cut_short(self, ex, timeout):
+        """ True if ex is the timeout of a request given less than cap seconds by timeout() """
+        return is_timeout(ex) and timeout < self.cap
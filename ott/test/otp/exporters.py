@@ -0,0 +1,141 @@
+"""
+Machine-readable result exports for the OTP test runner
+
+Both writers consume the same line records as report_writer.ResultWriter, one
+record at a time while the run is going, so no copy of the report data is built:
+
+JUnitWriter         JUnit XML, one <testsuite> per CSV file, one <testcase> per test
+                    method and CSV line
+CompactJSONWriter   a single JSON document with one short entry per CSV line
+"""
+
+import json
+from xml.sax.saxutils import escape, quoteattr
+
+
+STATUS_CODES = {'pass': 'p', 'failures': 'f', 'errors': 'e', 'skipped': 's', 'expectedFailures': 'x'}
+
+
+def _text(value):
+    if value is None:
+        return u''
+    if isinstance(value, str):
+        return value.decode('utf-8', 'replace')
+    return unicode(value)
+
+
+def _round(seconds):
+    return round(seconds, 3) if seconds is not None else None
+
+
+def reported_tests(rec):
+    """ the tests of a record with a final status, without the 'run' placeholders """
+    return [t for t in rec['tests'] if t['status'] != 'run']
+
+
+class JUnitWriter(object):
+    """
+    Streams JUnit XML
+
+    Records of one CSV file arrive together, so only the <testcase> elements of the
+    current file are held until its <testsuite> (whose attributes need the totals) is
+    written.
+    """
+
+    def __init__(self, path):
+        self.fp = open(path, "w")
+        self.fp.write('<?xml version="1.0" encoding="UTF-8"?>\n<testsuites>\n')
+
+        self.file = None
+        self.cases = []
+        self.totals = None
+
+    def write(self, rec):
+        if rec['run'] == 0: return
+
+        if rec['file'] != self.file:
+            self._flush()
+            self.file = rec['file']
+            self.totals = {'tests': 0, 'failures': 0, 'errors': 0, 'skipped': 0, 'time': 0.0}
+
+        for t in reported_tests(rec):
+            self.totals['tests'] += 1
+            self.totals['time'] += t.get('time', 0)
+
+            name = u"%s [line %d]" % (_text(t['name']), rec['line'])
+            case = u'  <testcase classname=%s name=%s time="%.3f" line="%d">\n' % (
+                quoteattr(_text(rec['name'])), quoteattr(name), t.get('time', 0), rec['line'])
+
+            # no response_time property when the line's url was never fetched from the network
+            case += u'   <properties>'
+            if rec.get('response_time') is not None:
+                case += u'<property name="response_time" value="%.3f"/>' % rec['response_time']
+            case += u'<property name="url" value=%s/></properties>\n' % quoteattr(_text(rec.get('url')))
+
+            output = _text(t['output'])
+            if t['status'] == 'failures':
+                self.totals['failures'] += 1
+                case += u'   <failure message=%s>%s</failure>\n' % (quoteattr(output.split('\n')[-1]), escape(output))
+            elif t['status'] == 'errors':
+                self.totals['errors'] += 1
+                case += u'   <error message=%s>%s</error>\n' % (quoteattr(output.split('\n')[-1]), escape(output))
+            elif t['status'] == 'skipped':
+                self.totals['skipped'] += 1
+                case += u'   <skipped message=%s/>\n' % quoteattr(output)
+
+            self.cases.append(case + u'  </testcase>\n')
+
+    def _flush(self):
+        if self.file is None: return
+
+        self.fp.write((u' <testsuite name=%s tests="%d" failures="%d" errors="%d" skipped="%d" time="%.3f">\n' % (
+            quoteattr(_text(self.file)), self.totals['tests'], self.totals['failures'], self.totals['errors'],
+            self.totals['skipped'], self.totals['time'])).encode('utf-8'))
+        for case in self.cases:
+            self.fp.write(case.encode('utf-8'))
+        self.fp.write(' </testsuite>\n')
+        self.fp.flush()
+
+        self.file = None
+        self.cases = []
+
+    def close(self):
+        self._flush()
+        self.fp.write('</testsuites>\n')
+        self.fp.close()
+
+
+class CompactJSONWriter(object):
+    """
+    Streams {"version": 1, "lines": [...]} with one entry per CSV line:
+
+    {"file", "class", "line", "desc", "time", "response_time", "url",
+     "tests": [[name, status, time, message], ...]}
+
+    status is one of p(ass), f(ailure), e(rror), s(kipped) or x (expected failure),
+    message is null for passing tests, response_time is the network time of the line's
+    url in this run (lines with the same url share it), null if it was never fetched from
+    the network.
+    """
+
+    def __init__(self, path):
+        self.fp = open(path, "w")
+        self.fp.write('{"version":1,"lines":[')
+        self.count = 0
+
+    def write(self, rec):
+        if rec['run'] == 0: return
+
+        line = {'file': rec['file'], 'class': rec['name'], 'line': rec['line'], 'desc': rec['desc'],
+                'time': round(rec.get('time', 0), 3), 'response_time': _round(rec.get('response_time')),
+                'url': rec.get('url'),
+                'tests': [[t['name'], STATUS_CODES[t['status']], round(t.get('time', 0), 3), t['output']]
+                          for t in reported_tests(rec)]}
+
+        self.fp.write((',\n' if self.count > 0 else '\n') + json.dumps(line, separators=(',', ':')))
+        self.fp.flush()
+        self.count += 1
+
+    def close(self):
+        self.fp.write('\n]}\n')
+        self.fp.close()
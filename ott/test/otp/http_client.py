@@ -0,0 +1,161 @@
+"""
+Shared keep-alive HTTP client for the OTP test runner
+
+Connections are pooled per (scheme, host, port) and reused across requests and
+worker threads, and every request carries its own timeout instead of relying on
+socket.setdefaulttimeout().
+"""
+
+import socket
+import threading
+import urlparse
+import httplib
+import logging
+
+
+class HTTPError(Exception):
+    """ raised for responses with a status >= 400 """
+
+    def __init__(self, url, status, reason):
+        super(HTTPError, self).__init__("HTTP %s %s for %s" % (status, reason, url))
+        self.url = url
+        self.status = status
+        self.reason = reason
+
+
+class HTTPClient(object):
+    """
+    Minimal GET-only HTTP/1.1 client with a bounded connection pool per host
+    """
+
+    max_redirects = 5
+
+    def __init__(self, pool_size=4, timeout=45):
+        self.pool_size = max(1, int(pool_size))
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.idle = {}  # (scheme, host, port) -> [HTTPConnection, ...]
+        self.slots = {}  # (scheme, host, port) -> BoundedSemaphore(pool_size)
+
+    def _host(self, key):
+        with self.lock:
+            if key not in self.slots:
+                self.slots[key] = threading.BoundedSemaphore(self.pool_size)
+                self.idle[key] = []
+            return self.slots[key]
+
+    def _acquire(self, key, timeout):
+        """ returns (connection, reused) - caller must hold a slot for key """
+        with self.lock:
+            if len(self.idle[key]) > 0:
+                conn = self.idle[key].pop()
+                if conn.sock is not None: conn.sock.settimeout(timeout)
+                return conn, True
+
+        scheme, host, port = key
+        cls = httplib.HTTPSConnection if scheme == 'https' else httplib.HTTPConnection
+        return cls(host, port, timeout=timeout), False
+
+    def _release(self, key, conn, reuse):
+        if not reuse:
+            conn.close()
+            return
+
+        with self.lock:
+            self.idle[key].append(conn)
+
+    def get(self, url, headers=None, timeout=None):
+        """ GET url and return (status, body), following redirects """
+
+        for i in xrange(self.max_redirects + 1):
+            status, body, location = self._get(url, headers or {}, timeout or self.timeout)
+            if location is None:
+                return status, body
+            url = urlparse.urljoin(url, location)
+
+        raise HTTPError(url, status, "too many redirects")
+
+    def _get(self, url, headers, timeout):
+        parts = urlparse.urlsplit(url)
+        scheme = parts.scheme or 'http'
+        port = parts.port or (443 if scheme == 'https' else 80)
+        key = (scheme, parts.hostname, port)
+
+        path = parts.path or '/'
+        if parts.query: path += '?' + parts.query
+
+        slot = self._host(key)
+        slot.acquire()
+        try:
+            conn, reused = self._acquire(key, timeout)
+            try:
+                res = self._request(conn, path, headers)
+            except (httplib.HTTPException, socket.error):
+                conn.close()
+                if not reused: raise
+
+                # the server dropped an idle keep-alive connection, retry once on a fresh one
+                logging.debug("http_client: stale connection to %s:%s, reconnecting" % (key[1], key[2]))
+                conn, reused = self._acquire(key, timeout)
+                try:
+                    res = self._request(conn, path, headers)
+                except:
+                    conn.close()
+                    raise
+
+            try:
+                body = res.read()
+            except:
+                conn.close()
+                raise
+            self._release(key, conn, not res.will_close)
+        finally:
+            slot.release()
+
+        if res.status in (301, 302, 303, 307, 308) and res.getheader('location'):
+            return res.status, body, res.getheader('location')
+
+        if res.status >= 400:
+            raise HTTPError(url, res.status, res.reason)
+
+        return res.status, body, None
+
+    def _request(self, conn, path, headers):
+        conn.request("GET", path, None, headers)
+        return conn.getresponse()
+
+    def close(self):
+        with self.lock:
+            for key in self.idle:
+                for conn in self.idle[key]:
+                    conn.close()
+                self.idle[key] = []
+
+
+_client = HTTPClient()
+
+
+def configure(pool_size=4, timeout=45):
+    """ replace the shared client, e.g. after command-line parsing """
+    global _client
+
+    old = _client
+    _client = HTTPClient(pool_size, timeout)
+    old.close()
+
+    return _client
+
+
+def install(client):
+    """ replace the shared client with any object with get(url, headers, timeout), e.g. an in-process responder """
+    global _client
+
+    old = _client
+    _client = client
+    old.close()
+
+    return _client
+
+
+def get_client():
+    return _client
@@ -0,0 +1,87 @@
+"""
+Bulk test row ingestion (test_runner.py --add-file)
+
+Streams an OTP request log, or any text file with one plan URL per line, and turns
+every plan request into the params of a new CSV row.  Rows whose normalized params
+are already in the suite, or earlier in the log, are dropped, so only distinct
+requests end up in the one CSV write or batched sheet update.
+"""
+
+import re
+import gzip
+import urllib
+import urlparse
+
+import response_cache
+
+
+# anything ending in /plan?... up to whitespace or a quote, with or without scheme and host
+PLAN_URL = re.compile(r'''(?:https?://[^\s"'/]+)?/\S*?/plan\?[^\s"']+''')
+
+# params that say nothing about the request itself, the server, the row's description
+# and the columns holding the row's expected results
+IGNORED = ('otp_url', 'description', 'duration', 'distance', 'num_legs', 'max_legs', 'max_walk', 'depart_time',
+           'arrive_time', 'invalid_modes', 'mode_exists', 'use_bus_route', 'not_expected', 'expected_output')
+
+
+def open_log(path):
+    """ file object for a (possibly gzipped) log, '-' reads stdin """
+    if path == '-':
+        import sys
+        return sys.stdin
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    return open(path, 'r')
+
+
+def extract_queries(lines):
+    """ yields the query string of every plan URL found in an iterable of log lines """
+    for l in lines:
+        for m in PLAN_URL.finditer(l):
+            yield urlparse.urlsplit(m.group(0)).query
+
+
+def _value(k, v):
+    """ the planner request's spelling of a param (see response_cache.canonical_url), '' if it changes nothing """
+    if isinstance(v, list): v = ','.join(str(x) for x in v)
+    v = response_cache.canonical_param(k, urllib.unquote_plus(str(v)), plan=True)
+    return v.lower() if v is not None else ''
+
+
+def param_key(params):
+    """ order, encoding and spelling independent identity of a row's request params """
+    values = ((k, _value(k, v)) for k, v in params.items() if k not in IGNORED)
+    return tuple(sorted((k, v) for k, v in values if v != ''))
+
+
+class Ingest(object):
+    """
+    cls is the test class (its valid_url_parameters filters the params), base the params
+    every row starts from (like --add, the command-line otp_url and date), existing the
+    suite's current rows to dedupe against
+    """
+
+    def __init__(self, cls, base=None, existing=()):
+        self.cls = cls
+        self.base = base or {}
+        self.seen = set(param_key(cls.valid_url_parameters(row)) for row in existing)
+
+        self.found = 0
+        self.duplicates = 0
+
+    def rows(self, lines):
+        """ yields the params of every new, distinct plan request in lines """
+        for query in extract_queries(lines):
+            self.found += 1
+
+            p = dict(self.base)
+            p.update(urlparse.parse_qs(query))
+            params = self.cls.valid_url_parameters(p)
+
+            key = param_key(params)
+            if len(key) == 0 or key in self.seen:
+                self.duplicates += 1
+                continue
+
+            self.seen.add(key)
+            yield params
@@ -0,0 +1,89 @@
+"""
+Run manifest for incremental re-runs (--changed-only, --failed-only)
+
+For every CSV line the manifest keeps a digest of the line's effective params (after
+literal conversion and command-line overrides), the identity of the OTP server and graph
+it last ran against (only looked up by incremental runs, None otherwise) and the line's
+last result record.  A later run can then re-run
+only the lines whose digest changed or that did not pass, and reuse the stored records
+for everything else, so its reports still cover every line.
+"""
+
+import os
+import json
+import hashlib
+import logging
+
+
+def row_digest(cls_name, row, identity=None):
+    """ stable digest of a CSV line's effective params and the server identity """
+    blob = json.dumps({'class': cls_name, 'params': row, 'server': identity}, sort_keys=True, default=repr)
+    return hashlib.sha1(blob).hexdigest()
+
+
+def server_identity(fetch, otp_url):
+    """
+    digest of the OTP serverInfo and routers/default/metadata responses, None if unavailable
+
+    fetch is test_runner.fetch, so replay mode and the caches apply
+    """
+    h = hashlib.sha1()
+    try:
+        for url in (otp_url, otp_url + "routers/default/metadata"):
+            body, elapsed = fetch(url, 'json', 'manifest')
+            h.update(json.dumps(json.loads(body), sort_keys=True))
+    except Exception as ex:
+        logging.warning("manifest: could not identify the OTP server at %s - %s" % (otp_url, str(ex)))
+        return None
+
+    return h.hexdigest()
+
+
+def passed(rec):
+    """ True if the record's line ran and had no failures or errors """
+    if rec is None or rec['run'] == 0: return False
+    return not any(t['status'] in ('failures', 'errors') for t in rec['tests'])
+
+
+class Manifest(object):
+    """ {"file:line": {"digest", "record"}} stored as JSON """
+
+    def __init__(self, path):
+        self.path = path
+        self.rows = {}
+
+        if os.path.exists(path):
+            try:
+                fp = open(path, "r")
+                self.rows = json.load(fp).get('rows', {})
+                fp.close()
+            except ValueError as ex:
+                logging.warning("manifest: ignoring unreadable %s - %s" % (path, str(ex)))
+
+    @staticmethod
+    def key(file, line):
+        return "%s:%d" % (file, line)
+
+    def record(self, file, line):
+        entry = self.rows.get(self.key(file, line))
+        return entry['record'] if entry is not None else None
+
+    def changed(self, file, line, digest, server=None):
+        """ True unless the line has the same digest and last ran against the same, known server """
+        entry = self.rows.get(self.key(file, line))
+        return entry is None or entry['digest'] != digest or server is None or entry.get('server') != server
+
+    def failed(self, file, line):
+        return not passed(self.record(file, line))
+
+    def update(self, rec, digest, server=None):
+        """ store the line's new record, reused records keep the digest and server they last ran with """
+        if rec.get('reused'): return
+        self.rows[self.key(rec['file'], rec['line'])] = {'digest': digest, 'server': server, 'record': rec}
+
+    def save(self):
+        tmp = self.path + ".tmp"
+        fp = open(tmp, "w")
+        json.dump({'rows': self.rows}, fp, sort_keys=True)
+        fp.close()
+        os.rename(tmp, self.path)
@@ -0,0 +1,139 @@
+"""
+Fetch timing for the OTP test runner
+
+Every fetch is recorded with its endpoint (URL without the query string), the test
+class (suite) that asked for it, the elapsed time, the bytes transferred and whether
+it was served from a cache.  Latency histograms only count real network fetches, so
+cache hits don't drag the numbers towards 0.
+"""
+
+import json
+import math
+import bisect
+import threading
+import urlparse
+
+
+# histogram bucket upper bounds in milliseconds, the last bucket is open ended
+BUCKETS = [10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000]
+
+
+def percentile(values, p):
+    """ nearest-rank percentile of a sorted list, None if empty """
+    if len(values) == 0:
+        return None
+
+    k = int(math.ceil(p / 100.0 * len(values))) - 1
+    return values[min(max(k, 0), len(values) - 1)]
+
+
+def endpoint(url):
+    parts = urlparse.urlsplit(url)
+    return urlparse.urlunsplit((parts.scheme, parts.netloc, parts.path, '', ''))
+
+
+class Histogram(object):
+    """ latency samples (seconds) and bytes of network fetches plus cache hit and error counters """
+
+    def __init__(self):
+        self.samples = []
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.bytes = 0
+        self.hits = 0
+        self.errors = 0
+
+    def add(self, elapsed, size=0, hit=False, error=None):
+        if error is not None:
+            self.errors += 1
+            return
+
+        if hit:
+            self.hits += 1
+            return
+
+        self.bytes += size
+        self.samples.append(elapsed)
+        self.buckets[bisect.bisect_left(BUCKETS, elapsed * 1000)] += 1
+
+    def summary(self):
+        lat = sorted(self.samples)
+        return {'fetches': len(lat), 'hits': self.hits, 'errors': self.errors, 'bytes': self.bytes,
+                'mean': sum(lat) / len(lat) if len(lat) > 0 else None,
+                'p50': percentile(lat, 50), 'p90': percentile(lat, 90), 'p99': percentile(lat, 99),
+                'max': lat[-1] if len(lat) > 0 else None,
+                'histogram': [{'le': b, 'count': c} for b, c in zip(BUCKETS + [None], self.buckets)]}
+
+
+class FetchRecorder(object):
+    """
+    thread-safe per-endpoint, per-suite and per-url fetch statistics
+
+    With log=True every record() call is also kept as a picklable tuple until take_log(),
+    so a worker process can send its fetches to the parent's recorder (see replay()).
+    """
+
+    def __init__(self, log=False):
+        self.lock = threading.Lock()
+        self.endpoints = {}
+        self.suites = {}
+        self.urls = {}  # url -> {'suite', 'elapsed', 'bytes', 'hits', 'error'} of the network fetch
+        self.log = [] if log else None
+
+    def record(self, url, suite=None, elapsed=0, size=0, hit=False, error=None):
+        with self.lock:
+            if self.log is not None:
+                self.log.append((url, suite, elapsed, size, hit, str(error) if error is not None else None))
+
+            self.endpoints.setdefault(endpoint(url), Histogram()).add(elapsed, size, hit, error)
+            self.suites.setdefault(suite or "-", Histogram()).add(elapsed, size, hit, error)
+
+            u = self.urls.setdefault(url, {'suite': suite, 'elapsed': None, 'bytes': 0, 'hits': 0, 'error': None})
+            if hit:
+                u['hits'] += 1
+            elif error is not None:
+                u['error'] = str(error)
+            else:
+                u['elapsed'] = elapsed
+                u['bytes'] = size
+
+    def take_log(self):
+        """ the record() calls logged since the last take_log() """
+        with self.lock:
+            log, self.log = self.log, []
+        return log
+
+    def replay(self, log):
+        """ record the calls of another recorder's take_log() """
+        for args in log:
+            self.record(*args)
+
+    def elapsed(self, url):
+        """ seconds the network fetch of url took, None if it was never fetched from the network """
+        with self.lock:
+            u = self.urls.get(url)
+            return u['elapsed'] if u is not None else None
+
+    def slowest(self, n=10):
+        with self.lock:
+            urls = [dict(url=k, **v) for k, v in self.urls.items() if v['elapsed'] is not None]
+
+        return sorted(urls, key=lambda u: -u['elapsed'])[:n]
+
+    def summary(self, slowest=10):
+        """ dict for the report templates and the json sidecar """
+        with self.lock:
+            res = {'endpoints': dict((k, v.summary()) for k, v in self.endpoints.items()),
+                   'suites': dict((k, v.summary()) for k, v in self.suites.items())}
+
+        res['slowest'] = self.slowest(slowest)
+        return res
+
+    def write_json(self, path):
+        """ machine-readable sidecar with the summary plus every fetched url """
+        res = self.summary()
+        with self.lock:
+            res['urls'] = dict((k, dict(v)) for k, v in self.urls.items())
+
+        fp = open(path, "w")
+        json.dump(res, fp, indent=1, sort_keys=True)
+        fp.close()
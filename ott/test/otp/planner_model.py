@@ -0,0 +1,171 @@
+"""
+Parsed model of an OTP planner (routers/default/plan) response
+
+The XML response is read with cElementTree.iterparse, and every itinerary is
+cleared as soon as it has been converted, so a large response with
+showIntermediateStops=true never exists as a full DOM.  JSON responses are
+decoded with the json module.  Either way, the test methods get the same
+PlannerResponse.
+"""
+
+import json
+import time
+import StringIO
+
+try:
+    import xml.etree.cElementTree as ElementTree
+except ImportError:
+    import xml.etree.ElementTree as ElementTree
+
+
+class Leg(object):
+    __slots__ = ('mode', 'route', 'distance', 'start_time', 'end_time')
+
+    def __init__(self, mode=None, route=None, distance=0.0, start_time=None, end_time=None):
+        self.mode = mode
+        self.route = route
+        self.distance = distance
+        self.start_time = start_time
+        self.end_time = end_time
+
+
+class Itinerary(object):
+    __slots__ = ('duration', 'start_time', 'end_time', 'walk_distance', 'legs')
+
+    def __init__(self):
+        self.duration = None
+        self.start_time = None
+        self.end_time = None
+        self.walk_distance = None
+        self.legs = []
+
+    @property
+    def distance(self):
+        """ total distance of all legs """
+        return sum(leg.distance for leg in self.legs)
+
+    @property
+    def modes(self):
+        return [leg.mode for leg in self.legs]
+
+
+class PlannerResponse(object):
+    """ itineraries, legs and errors from one planner response """
+
+    def __init__(self):
+        self.itineraries = []
+        self.errors = []  # (id, msg) tuples returned by OTP
+        self.parse_error = None  # set when the body could not be parsed at all
+
+    @property
+    def legs(self):
+        return [leg for it in self.itineraries for leg in it.legs]
+
+    @property
+    def modes(self):
+        """ mode of every leg across all itineraries """
+        return [leg.mode for leg in self.legs]
+
+    def routes(self, mode=None):
+        """ route of every leg (optionally only legs of 'mode') across all itineraries """
+        return [leg.route for leg in self.legs if mode is None or leg.mode == mode]
+
+
+def clock(value):
+    """ (hour, minute, second) of a startTime/endTime value, local server time for XML strings """
+
+    if value is None:
+        return None
+
+    if isinstance(value, basestring) and 'T' in value:
+        t = time.strptime(value[:19], "%Y-%m-%dT%H:%M:%S")  # XXX timezone
+    else:
+        t = time.localtime(float(value) / 1000)
+
+    return t.tm_hour, t.tm_min, t.tm_sec
+
+
+def _number(text, cast=float):
+    try:
+        return cast(text)
+    except (TypeError, ValueError):
+        return None
+
+
+def _local(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+def _child(elem, name):
+    for c in elem:
+        if _local(c.tag) == name: return c.text
+    return None
+
+
+def _xml_itinerary(elem):
+    it = Itinerary()
+    it.duration = _number(_child(elem, 'duration'), int)
+    it.start_time = _child(elem, 'startTime')
+    it.end_time = _child(elem, 'endTime')
+    it.walk_distance = _number(_child(elem, 'walkDistance'))
+
+    for legs in elem:
+        if _local(legs.tag) != 'legs': continue
+        for leg in legs:
+            it.legs.append(Leg(leg.get('mode'), leg.get('route'), _number(_child(leg, 'distance')) or 0.0,
+                               _child(leg, 'startTime'), _child(leg, 'endTime')))
+
+    return it
+
+
+def parse_xml(body):
+    res = PlannerResponse()
+
+    try:
+        for event, elem in ElementTree.iterparse(StringIO.StringIO(body), events=('end',)):
+            tag = _local(elem.tag)
+            if tag == 'itinerary':
+                res.itineraries.append(_xml_itinerary(elem))
+                elem.clear()
+            elif tag == 'error':
+                res.errors.append((_child(elem, 'id'), _child(elem, 'msg')))
+                elem.clear()
+    except SyntaxError as ex:
+        res.parse_error = str(ex)
+
+    return res
+
+
+def parse_json(body):
+    res = PlannerResponse()
+
+    try:
+        d = json.loads(body)
+    except ValueError as ex:
+        res.parse_error = str(ex)
+        return res
+
+    if d.get('error') is not None:
+        res.errors.append((d['error'].get('id'), d['error'].get('msg')))
+
+    for i in (d.get('plan') or {}).get('itineraries', []):
+        it = Itinerary()
+        it.duration = i.get('duration')
+        it.start_time = i.get('startTime')
+        it.end_time = i.get('endTime')
+        it.walk_distance = i.get('walkDistance')
+        for leg in i.get('legs', []):
+            it.legs.append(Leg(leg.get('mode'), leg.get('route'), leg.get('distance') or 0.0,
+                               leg.get('startTime'), leg.get('endTime')))
+        res.itineraries.append(it)
+
+    return res
+
+
+def parse(body, type='xml'):
+    """ build a PlannerResponse from a planner response body """
+
+    if type == 'json':
+        return parse_json(body)
+
+    return parse_xml(body)
@@ -0,0 +1,53 @@
+"""
+Worker side of the --processes pool
+
+A pool worker finds the function it runs by module and name, so the worker entry points
+live here instead of in test_runner's __main__, which only a forked worker could
+resolve.  Each worker imports test_runner as a module of its own, init() gives that
+copy its own HTTP client, response store connection, breaker and caches.  The parent
+sends work items built by test_runner.line_item() and gets back the line record plus the
+worker's fetches, which it adds to its own fetch statistics.
+"""
+
+import metrics
+import http_client
+
+
+_runner = None  # the worker's test_runner module
+
+
+def init(store_path, store_mode, store_ttl, cache_bytes, breaker_config, failures_config):
+    """ worker process setup, runs once in each worker """
+    global _runner
+    import test_runner
+    _runner = test_runner
+
+    # the forked copies belong to the parent, sockets and sqlite connections can't be shared
+    http_client.configure(pool_size=1, timeout=getattr(http_client.get_client(), 'timeout', 45))
+    if store_path is not None: _runner.open_store(store_path, store_mode, store_ttl)
+    _runner.configure_cache(cache_bytes)
+    _runner.configure_breaker(*breaker_config)
+    _runner.configure_failures(*failures_config)
+    _runner._fetch_stats = metrics.FetchRecorder(log=True)
+
+
+def process_line(item):
+    """ work item from test_runner.line_item() -> (line record, fetches for FetchRecorder.replay()) """
+
+    deps = _runner._dependencies
+    with deps.lock:
+        deps.outcomes.update((key, outcome) for key, outcome in item['dependencies'] if outcome is not None)
+
+    s = {'file': item['file'], 'name': item['name'], 'cls': _runner.find_test_class(item['cls'])}
+
+    body = item['body']
+    if body is None and item['url'] is not None and _runner._store is not None:
+        body = _runner._store.get(item['url'], item['type'], expire=False)
+
+    if item['url'] is not None:
+        key = _runner.response_cache.canonical_url(item['url'])
+        if body is not None: _runner.cache_set(key, body)
+        elif item['error'] is not None: _runner._failures.set(key, item['error'])
+
+    rec = _runner.run_line(s, item['line'], item['row'], item['debug'])
+    return rec, _runner._fetch_stats.take_log()
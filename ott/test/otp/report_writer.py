@@ -0,0 +1,115 @@
+"""
+Incremental result output for the OTP test runner
+
+Every finished CSV line record (see test_runner.line_record) is appended to a JSONL
+results file and to a plain HTML page as soon as it arrives, both flushed right
+away.  If the run dies, both files still hold every line finished so far.  The
+final Mako report is then rendered from the JSONL file, so the records don't have
+to be kept in memory while the run is going.
+"""
+
+import cgi
+import json
+import time
+import logging
+
+
+HTML_HEAD = """<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="utf-8" />
+    <title>OpenTripPlanner Test Results (in progress)</title>
+    <style>
+      span.pass { color: green; }
+      span.fail { color: red; }
+      td { vertical-align: top; padding: 2px 8px; }
+    </style>
+</head>
+<body>
+<h2>OpenTripPlanner Test Results - started %s</h2>
+<p>This page is written while the tests run, it is replaced by the full report when the run completes.</p>
+<table>
+<tr><th>CSV</th><th>line</th><th>pass</th><th>fail</th><th>error</th><th>skip</th><th>details</th></tr>
+"""
+
+HTML_FOOT = """</table>
+<p>%d lines finished %s</p>
+</body>
+</html>
+"""
+
+
+def counts(rec):
+    """ {status: number of tests} of a line record """
+    res = {'pass': 0, 'failures': 0, 'errors': 0, 'skipped': 0, 'expectedFailures': 0}
+    for t in rec['tests']:
+        if t['status'] in res: res[t['status']] += 1
+    return res
+
+
+def safe_record(obj):
+    """
+    copy of a line record with every byte string decoded as UTF-8, undecodable bytes (e.g.
+    binary responses in debug output) replaced, so it always serializes to JSON
+    """
+    if isinstance(obj, str): return obj.decode('utf-8', 'replace')
+    if isinstance(obj, dict): return dict((safe_record(k), safe_record(v)) for k, v in obj.items())
+    if isinstance(obj, (list, tuple)): return [safe_record(v) for v in obj]
+    return obj
+
+
+class ResultWriter(object):
+    """ appends line records to a JSONL file and, optionally, a progressive HTML page """
+
+    def __init__(self, results_path, html_path=None):
+        self.results_path = results_path
+        self.count = 0
+
+        self.results = open(results_path, "w")
+
+        self.html = None
+        if html_path is not None:
+            self.html = open(html_path, "w")
+            self.html.write(HTML_HEAD % time.strftime("%m.%d.%Y @ %I:%M %p"))
+            self.html.flush()
+
+    def write(self, rec):
+        rec = safe_record(rec)
+        self.results.write(json.dumps(rec, sort_keys=True, ensure_ascii=True) + "\n")
+        self.results.flush()
+        self.count += 1
+
+        if self.html is not None and rec['run'] > 0:
+            c = counts(rec)
+            details = [u"<span class=fail>%s</span>: %s" % (t['name'], cgi.escape(t['output'] or u''))
+                       for t in rec['tests'] if t['status'] in ('failures', 'errors')]
+
+            row = u"<tr><td>%s</td><td>%s</td><td><span class=pass>%d</span></td><td>%d</td><td>%d</td>" \
+                  u"<td>%d</td><td>%s</td></tr>\n" % (cgi.escape(rec['file']), cgi.escape(rec['desc']),
+                                                     c['pass'], c['failures'], c['errors'],
+                                                     c['skipped'], u'<br>'.join(details))
+            self.html.write(row.encode('utf-8'))
+            self.html.flush()
+
+    def close(self):
+        self.results.close()
+
+        if self.html is not None:
+            self.html.write(HTML_FOOT % (self.count, time.strftime("%m.%d.%Y @ %I:%M %p")))
+            self.html.close()
+            self.html = None
+
+
+def load_records(path):
+    """ yields the line records of a JSONL results file, ignoring a truncated last line """
+
+    fp = open(path, "r")
+    try:
+        for n, l in enumerate(fp):
+            if len(l.strip()) == 0: continue
+            try:
+                yield json.loads(l)
+            except ValueError:
+                logging.warning("%s:%d - skipping unreadable result line" % (path, n + 1))
+    finally:
+        fp.close()
@@ -0,0 +1,348 @@
+"""
+Response caches for the OTP test runner
+
+LRUCache is the in-process cache every fetch goes through, bounded by the total size
+of the stored bodies and keyed by canonical_url(), so the same request spelled with
+another param order, coordinate precision or explicit defaults is fetched only once.
+DiskCache keeps responses in a sqlite file under the same canonical URL and the
+requested Accept type, so a run can be recorded once (--record) and then replayed
+any number of times without touching the network (--replay), whichever spelling of
+a request the replayed run reaches first.
+"""
+
+import time
+import zlib
+import sqlite3
+import threading
+import collections
+import urllib
+import urlparse
+
+
+class ReplayMiss(Exception):
+    """ raised in replay mode when a response was never recorded """
+
+    def __init__(self, url, type=None):
+        super(ReplayMiss, self).__init__("no recorded response for %s (%s)" % (url, type or "any"))
+        self.url = url
+        self.type = type
+
+
+class CachedFailure(Exception):
+    """ raised for a URL whose last fetch failed less than NegativeCache.ttl seconds ago """
+
+    def __init__(self, url, error_type, status, error):
+        super(CachedFailure, self).__init__("%s (cached %s)" % (error, error_type))
+        self.url = url
+        self.error_type = error_type
+        self.status = status
+        self.error = error
+
+
+# OTP planner defaults, a param left at its default asks for the same plan as no param at all
+PLAN_DEFAULTS = {'arriveBy': 'false', 'showIntermediateStops': 'false', 'wheelchair': 'false',
+                 'optimize': 'QUICK', 'mode': 'TRANSIT,WALK'}
+
+# "lat,lon" params and the decimals they are rounded to (6 is about 0.1 m)
+COORDINATE_PARAMS = ('fromPlace', 'toPlace')
+COORDINATE_DIGITS = 6
+
+
+def _coordinate(value):
+    """ "[name::]lat,lon" with lat and lon rounded to COORDINATE_DIGITS, value if it isn't one """
+    name, sep, place = value.rpartition('::')
+    try:
+        lat, lon = [float(v) for v in place.split(',')]
+    except ValueError:
+        return value
+
+    return "%s%s%.*f,%.*f" % (name, sep, COORDINATE_DIGITS, lat, COORDINATE_DIGITS, lon)
+
+
+def canonical_param(name, value, plan=False):
+    """ canonical_url()'s spelling of a query param's value, None for a planner param at its default """
+    value = value.strip()
+    if name in COORDINATE_PARAMS: value = _coordinate(value)
+    if plan and name == 'mode': value = ','.join(sorted(m.strip().upper() for m in value.split(',')))
+    if plan and name in PLAN_DEFAULTS and value.lower() == PLAN_DEFAULTS[name].lower(): return None
+    return value
+
+
+def canonical_url(url):
+    """
+    One key for every spelling of the same request: lower-case scheme/host, sorted query
+    parameters, fromPlace/toPlace rounded to COORDINATE_DIGITS and, for the planner, the
+    modes sorted and params at their PLAN_DEFAULTS value dropped
+    """
+
+    parts = urlparse.urlsplit(url)
+    plan = parts.path.endswith('/plan')
+
+    query = []
+    for k, v in urlparse.parse_qsl(parts.query, keep_blank_values=True):
+        v = canonical_param(k, v, plan)
+        if v is not None: query.append((k, v))
+
+    return urlparse.urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path,
+                                urllib.urlencode(sorted(query)), ''))
+
+
+def cache_key(url, type=None):
+    return "%s %s" % (type or "*", canonical_url(url))
+
+
+class LRUCache(object):
+    """
+    Thread-safe LRU cache of response bodies
+
+    max_bytes bounds the total size of the stored values (after compression), least
+    recently used entries are evicted first.  ttl (seconds, None never expires) is the
+    default lifetime of an entry and can be overridden per set().  With compress=True
+    bodies of at least compress_min bytes are stored zlib compressed.
+    """
+
+    compress_min = 1024
+
+    def __init__(self, max_bytes=256 * 1024 * 1024, ttl=None, compress=False):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.compress = compress
+        self.lock = threading.Lock()
+
+        self.entries = collections.OrderedDict()  # key -> (expires, compressed, value)
+        self.bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+
+    def get(self, key, count=True):
+        """ the value of key, None if missing or expired; count=False leaves the hit and miss counters alone """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                if count: self.misses += 1
+                return None
+
+            if entry[0] is not None and entry[0] < time.time():
+                self._drop(key)
+                self.expired += 1
+                if count: self.misses += 1
+                return None
+
+            # move to the most recently used end
+            del self.entries[key]
+            self.entries[key] = entry
+            if count: self.hits += 1
+
+        return zlib.decompress(entry[2]) if entry[1] else entry[2]
+
+    def set(self, key, val, ttl=None):
+        compressed = self.compress and isinstance(val, str) and len(val) >= self.compress_min
+        if compressed: val = zlib.compress(val, 1)
+
+        ttl = ttl if ttl is not None else self.ttl
+        expires = time.time() + ttl if ttl is not None else None
+
+        with self.lock:
+            if key in self.entries: self._drop(key)
+
+            if self.max_bytes is not None and len(val) > self.max_bytes:
+                return
+
+            self.entries[key] = (expires, compressed, val)
+            self.bytes += len(val)
+
+            while self.max_bytes is not None and self.bytes > self.max_bytes:
+                self._drop(next(iter(self.entries)))
+                self.evictions += 1
+
+    def _drop(self, key):
+        entry = self.entries.pop(key)
+        self.bytes -= len(entry[2])
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def stats(self):
+        return {'entries': len(self.entries), 'bytes': self.bytes, 'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'expired': self.expired}
+
+    def summary(self):
+        return "Response cache: %(entries)d entries, %(bytes)d bytes, %(hits)d hits, %(misses)d misses, " \
+               "%(evictions)d evictions, %(expired)d expired" % self.stats()
+
+
+class NegativeCache(object):
+    """
+    Thread-safe record of failed fetches, so a URL that errored is not requested again
+    by every test method of its line
+
+    Entries keep the error type, HTTP status (None for connection errors) and message
+    and expire after ttl seconds (None never expires, 0 disables the cache).
+    """
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = {}  # key -> (expires, {'type', 'status', 'error'})
+
+    @staticmethod
+    def entry(ex):
+        """ picklable description of the exception ex """
+        if isinstance(ex, CachedFailure):
+            return {'type': ex.error_type, 'status': ex.status, 'error': ex.error}
+        return {'type': ex.__class__.__name__, 'status': getattr(ex, 'status', None), 'error': str(ex)}
+
+    def get(self, key):
+        """ CachedFailure for key, None if it didn't fail or the entry expired """
+        with self.lock:
+            item = self.entries.get(key)
+            if item is None: return None
+
+            if item[0] is not None and item[0] < time.time():
+                del self.entries[key]
+                return None
+
+        e = item[1]
+        return CachedFailure(key, e['type'], e['status'], e['error'])
+
+    def set(self, key, ex):
+        """ remember the failure ex (an exception or an entry() dict) """
+        if self.ttl is not None and self.ttl <= 0: return
+
+        e = ex if isinstance(ex, dict) else self.entry(ex)
+        with self.lock:
+            self.entries[key] = (time.time() + self.ttl if self.ttl is not None else None, e)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class ParsedCache(object):
+    """
+    Small LRU memo of objects parsed from response bodies (planner models, decoded JSON)
+
+    Entries are keyed by (kind, url) and remember which body they were built from, so a
+    re-fetched body is parsed again instead of returning a stale object.
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()  # (kind, url) -> (len, hash, value)
+
+    def get(self, kind, url, body, parser):
+        """ returns parser(body), parsing at most once per (kind, url, body) """
+
+        key = (kind, url)
+        sig = (len(body), hash(body))
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0:2] == sig:
+                del self.entries[key]
+                self.entries[key] = entry
+                return entry[2]
+
+        value = parser(body)
+
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = sig + (value,)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class DiskCache(object):
+    """
+    sqlite-backed response store shared by all worker threads
+
+    ttl is in seconds, None never expires
+    """
+
+    def __init__(self, path, ttl=None):
+        self.path = path
+        self.ttl = ttl
+        self.lock = threading.Lock()
+
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.text_factory = str
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, url TEXT, type TEXT, "
+                        "status INTEGER, fetched REAL, body BLOB)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+        self.db.commit()
+
+    def get_meta(self, name):
+        """ value saved with set_meta(), None if never set """
+        with self.lock:
+            row = self.db.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return row[0] if row is not None else None
+
+    def set_meta(self, name, value):
+        """ remember a setting of the recording run next to its responses """
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)", (name, value))
+            self.db.commit()
+
+    def get(self, url, type=None, expire=True):
+        """ returns the stored body, or None if missing or older than ttl (unless expire is False) """
+
+        with self.lock:
+            row = self.db.execute("SELECT fetched, body FROM responses WHERE key = ?",
+                                  (cache_key(url, type),)).fetchone()
+
+        if row is None:
+            return None
+
+        if expire and self.ttl is not None and time.time() - row[0] > self.ttl:
+            return None
+
+        return str(row[1])
+
+    def set(self, url, type, body, status=200):
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO responses (key, url, type, status, fetched, body) "
+                            "VALUES (?, ?, ?, ?, ?, ?)",
+                            (cache_key(url, type), url, type, status, time.time(), sqlite3.Binary(body)))
+            self.db.commit()
+
+    def delete(self, url, keep=None):
+        """ drop the responses stored for url (exactly as passed to set()), except the one of type keep """
+        with self.lock:
+            cur = self.db.execute("DELETE FROM responses WHERE url = ? AND type IS NOT ?", (url, keep))
+            self.db.commit()
+
+        return cur.rowcount
+
+    def purge(self):
+        """ drop expired entries """
+        if self.ttl is None: return 0
+
+        with self.lock:
+            cur = self.db.execute("DELETE FROM responses WHERE fetched < ?", (time.time() - self.ttl,))
+            self.db.commit()
+
+        return cur.rowcount
+
+    def __len__(self):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.db.close()
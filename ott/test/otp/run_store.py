@@ -0,0 +1,167 @@
+"""
+Run history for the OTP test runner (--history-db, --compare)
+
+Every run is stored in a sqlite database with the OTP version it ran against, and per
+CSV line its pass/fail, network latency and, for planner lines, the itinerary count and
+the shortest itinerary duration and distance.  compare() lines two runs up by CSV file,
+line number and params and flags the lines that got slower, lost itineraries, got
+longer trips or stopped passing.
+"""
+
+import json
+import time
+import sqlite3
+import threading
+import logging
+
+import manifest
+
+
+# latency changes below this many seconds are noise, whatever the threshold
+MIN_LATENCY_DELTA = 0.05
+
+
+def otp_version(fetch, otp_url):
+    """ version string from OTP's serverInfo, None if unavailable (fetch is test_runner.fetch) """
+    try:
+        body, elapsed = fetch(otp_url, 'json', 'history')
+        info = json.loads(body).get('serverVersion', {})
+    except Exception as ex:
+        logging.warning("history: could not get the OTP version from %s - %s" % (otp_url, str(ex)))
+        return None
+
+    if 'version' in info: return info['version']
+    if 'major' in info: return "%s.%s.%s" % (info.get('major'), info.get('minor'), info.get('incremental', 0))
+    return None
+
+
+class Regression(object):
+
+    def __init__(self, file, line, desc, metric, baseline, current):
+        self.file = file
+        self.line = line
+        self.desc = desc
+        self.metric = metric
+        self.baseline = baseline
+        self.current = current
+
+    def __str__(self):
+        fmt = lambda v: "%.3f" % v if isinstance(v, float) else str(v)
+        return "%s:%s %-11s %s -> %s" % (self.file, self.desc, self.metric, fmt(self.baseline), fmt(self.current))
+
+
+class RunStore(object):
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("CREATE TABLE IF NOT EXISTS runs (id INTEGER PRIMARY KEY AUTOINCREMENT, started REAL, "
+                        "finished REAL, otp_url TEXT, otp_version TEXT, lines INTEGER, passed INTEGER)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS lines (run INTEGER, file TEXT, line INTEGER, digest TEXT, "
+                        "description TEXT, class TEXT, passed INTEGER, latency REAL, itineraries INTEGER, "
+                        "duration REAL, distance REAL, PRIMARY KEY (run, file, line))")
+        self.db.commit()
+
+    def start(self, otp_url=None, version=None):
+        """ returns the id of a new run """
+        with self.lock:
+            cur = self.db.execute("INSERT INTO runs (started, otp_url, otp_version, lines, passed) "
+                                  "VALUES (?, ?, ?, 0, 0)", (time.time(), otp_url, version))
+            self.db.commit()
+            return cur.lastrowid
+
+    def add(self, run, rec, latency=None):
+        """ stores a line record, latency is the network time of its request (None if it was cached) """
+        # records reused from an earlier run (--changed-only, --failed-only) are not results of this one
+        if rec['run'] == 0 or rec.get('reused'): return
+
+        m = rec.get('metrics') or {}
+        # the same line against another server is still the same line
+        params = dict((k, v) for k, v in rec['param'].items() if k != 'otp_url')
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO lines VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                            (run, rec['file'], rec['line'], manifest.row_digest(rec['name'], params),
+                             rec['desc'], rec['name'], 1 if manifest.passed(rec) else 0, latency,
+                             m.get('itineraries'), m.get('duration'), m.get('distance')))
+
+    def finish(self, run):
+        with self.lock:
+            self.db.execute("UPDATE runs SET finished = ?, lines = (SELECT COUNT(*) FROM lines WHERE run = ?), "
+                            "passed = (SELECT COUNT(*) FROM lines WHERE run = ? AND passed = 1) WHERE id = ?",
+                            (time.time(), run, run, run))
+            self.db.commit()
+
+    def runs(self, limit=20):
+        """ [(id, started, otp_url, otp_version, lines, passed)] of the latest finished runs """
+        with self.lock:
+            return self.db.execute("SELECT id, started, otp_url, otp_version, lines, passed FROM runs "
+                                   "WHERE finished IS NOT NULL ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+
+    def previous(self, run):
+        """ id of the last finished run before run, None if there is none """
+        with self.lock:
+            row = self.db.execute("SELECT MAX(id) FROM runs WHERE id < ? AND finished IS NOT NULL",
+                                  (run,)).fetchone()
+        return row[0]
+
+    def compare(self, baseline, run, threshold=0.2):
+        """
+        Regressions of run against baseline for the lines both ran with the same params
+
+        latency, duration and distance regress when they grow by more than threshold
+        (a fraction), itineraries when the count drops by more than threshold, and
+        passed when a passing line fails
+        """
+
+        with self.lock:
+            pairs = self.db.execute(
+                "SELECT c.file, c.line, c.description, b.passed, c.passed, b.latency, c.latency, "
+                "b.itineraries, c.itineraries, b.duration, c.duration, b.distance, c.distance "
+                "FROM lines c JOIN lines b ON b.run = ? AND b.file = c.file AND b.line = c.line "
+                "AND b.digest = c.digest WHERE c.run = ? ORDER BY c.file, c.line", (baseline, run)).fetchall()
+
+        res = []
+        for row in pairs:
+            file, line, desc = row[0:3]
+            add = lambda metric, b, c: res.append(Regression(file, line, desc, metric, b, c))
+
+            if row[3] == 1 and row[4] == 0: add('passed', True, False)
+
+            b, c = row[5], row[6]
+            if b is not None and c is not None and c > b * (1 + threshold) and c - b > MIN_LATENCY_DELTA:
+                add('latency', b, c)
+
+            b, c = row[7], row[8]
+            if b is not None and c is not None and c < b * (1 - threshold):
+                add('itineraries', b, c)
+
+            for metric, b, c in (('duration', row[9], row[10]), ('distance', row[11], row[12])):
+                if b is not None and c is not None and c > b * (1 + threshold):
+                    add(metric, b, c)
+
+        return res
+
+    def close(self):
+        with self.lock:
+            self.db.commit()
+            self.db.close()
+
+
+class HistoryWriter(object):
+    """
+    Result writer (see report_writer.ResultWriter) storing the records of one run,
+    latency(rec) gives the network time of the record's request
+    """
+
+    def __init__(self, store, run, latency=None):
+        self.store = store
+        self.run = run
+        self.latency = latency or (lambda rec: None)
+
+    def write(self, rec):
+        self.store.add(self.run, rec, self.latency(rec))
+
+    def close(self):
+        self.store.finish(self.run)
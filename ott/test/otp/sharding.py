@@ -0,0 +1,62 @@
+"""
+Splitting a run across processes or hosts (--shard K/N) and merging the results (--merge)
+
+A CSV line belongs to shard K of N by a stable hash of its test class, CSV file name and
+line number, so every host given the same suites picks the same lines, whatever its
+working directory or CSV path.  Each shard writes its own JSONL results file (see
+report_writer), --merge reads them back into one report.
+"""
+
+import os
+import hashlib
+
+import report_writer
+
+
+def parse(value):
+    """ (k, n) from "K/N", k from 1 to n """
+    try:
+        k, n = [int(v) for v in value.split('/')]
+    except (AttributeError, ValueError):
+        raise ValueError("shard must be K/N, e.g. 1/4")
+
+    if n < 1 or k < 1 or k > n:
+        raise ValueError("shard %s out of range, K must be from 1 to N" % value)
+
+    return k, n
+
+
+def key(s, i):
+    """ stable identity of line i of suite s (or of a line record's name and file) """
+    return "%s/%s:%d" % (s['name'], os.path.basename(s['file']), i)
+
+
+def shard(s, i, n):
+    """ the shard (1 to n) line i of suite s belongs to """
+    return int(hashlib.md5(key(s, i)).hexdigest()[:12], 16) % n + 1
+
+
+def select(lines, k, n):
+    """ yields the (suite, line number, params) lines of shard k of n """
+    return ((s, i, row) for s, i, row in lines if shard(s, i, n) == k)
+
+
+def merged_records(paths):
+    """
+    line records of every results file, ordered by CSV file and line
+
+    Lines are identified by key(), like the shards picking them, so a line found in more
+    than one file (e.g. a shard that was re-run) keeps its last record even if the shards
+    ran from different paths.  The records of one suite all get the 'file' of the first
+    record read for it, so the suite is reported once.
+    """
+
+    files = {}
+    records = {}
+    for path in paths:
+        for rec in report_writer.load_records(path):
+            f = files.setdefault(key(rec, 0), rec['file'])
+            records[key(rec, rec['line'])] = rec if rec['file'] == f else dict(rec, file=f)
+
+    for rec in sorted(records.values(), key=lambda r: (r['file'], r['line'])):
+        yield rec
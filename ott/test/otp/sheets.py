@@ -0,0 +1,201 @@
+"""
+Google Sheets suite loading for csv_remote
+
+SheetLoader turns the worksheets of one spreadsheet into the same suite dicts the local
+CSV loader builds.  The client only needs the two gdata SpreadsheetsClient calls used here:
+
+    get_worksheets(url, auth_token=token)       feed with one entry per worksheet
+    get_cells(url, worksheet_id, auth_token=token)
+
+so a local stand-in serving canned feeds, like LocalSheets, can take its place.  The
+cells of every worksheet are fetched concurrently, and each worksheet's rows are kept in
+an optional SheetCache keyed by the worksheet's etag (or updated timestamp), so a sheet
+that did not change since the last run is not downloaded again.
+"""
+
+import json
+import logging
+import collections
+
+import workers
+import response_cache
+
+
+def worksheet_version(entry):
+    """ etag of a worksheet entry, or its updated timestamp if the feed has no etags """
+    etag = getattr(entry, 'etag', None)
+    if etag: return etag
+
+    updated = getattr(entry, 'updated', None)
+    return updated.text if updated is not None else None
+
+
+def rows_from_cells(entries):
+    """
+    list of {header: value} dicts from a cells feed, in one pass over the cells
+
+    Row 1 holds the column names.  Cells missing from the feed (blank) and the "-"
+    placeholders used to keep cells from being blank are both read as "".
+    """
+
+    header = {}
+    grid = {}
+    for e in entries:
+        r, c = int(e.cell.row), int(e.cell.col)
+        text = e.cell.text if e.cell.text not in (None, "-") else ""
+
+        if r == 1:
+            header[c] = text
+        else:
+            grid.setdefault(r, {})[c] = text
+
+    return [dict((name, grid[r].get(c, "")) for c, name in header.items()) for r in sorted(grid)]
+
+
+class SheetCache(object):
+    """
+    worksheet rows stored as JSON in a response_cache.DiskCache, keyed by worksheet and
+    version, only the latest version of a worksheet is kept
+    """
+
+    def __init__(self, path):
+        self.store = response_cache.DiskCache(path)
+
+    @staticmethod
+    def key(url, worksheet_id):
+        return "sheet:%s/%s" % (url, worksheet_id)
+
+    def get(self, url, worksheet_id, version):
+        if version is None: return None
+
+        body = self.store.get(self.key(url, worksheet_id), version)
+        if body is None: return None
+
+        # json gives unicode back, the suites expect the str values gdata returns
+        encode = lambda v: v.encode('utf-8') if isinstance(v, unicode) else v
+        return [dict((encode(k), encode(v)) for k, v in row.items()) for row in json.loads(body)]
+
+    def set(self, url, worksheet_id, version, rows):
+        if version is None: return
+        self.store.set(self.key(url, worksheet_id), version, json.dumps(rows))
+        self.store.delete(self.key(url, worksheet_id), keep=version)
+
+    def close(self):
+        self.store.close()
+
+
+class SheetLoader(object):
+
+    def __init__(self, client, token=None, concurrency=4, cache=None):
+        self.client = client
+        self.token = token
+        self.concurrency = concurrency
+        self.cache = cache
+
+        self.downloaded = 0
+        self.cached = 0
+
+    def load(self, url, find_class):
+        """
+        Returns (suites, {worksheet title: worksheet id}) for the worksheets whose title
+        names a test class, find_class maps a title to the class or None
+        """
+
+        feed = self.client.get_worksheets(url, auth_token=self.token)
+
+        suites = []
+        ids = {}
+        for entry in feed.entry:
+            id = entry.get_worksheet_id()
+            title = entry.title.text
+
+            logging.info("Sheet %s (%s)" % (title, id))
+
+            cls = find_class(title)
+            if cls is None: continue
+
+            ids[title] = id
+            suites.append({"worksheet_id": id, "data": [], 'cls': cls, 'file': title, 'name': title,
+                           'version': worksheet_version(entry), 'empty': self._empty(entry)})
+
+        for s, (rows, hit) in zip(suites, workers.imap(lambda s: self._rows(url, s), suites, self.concurrency)):
+            if hit:
+                self.cached += 1
+            else:
+                self.downloaded += 1
+
+            s['data'] = rows
+            del s['version']
+
+        return [s for s in suites if not s.pop('empty')], ids
+
+    @staticmethod
+    def _empty(entry):
+        try:
+            return int(entry.row_count.text) <= 0 or int(entry.col_count.text) <= 0
+        except (AttributeError, TypeError, ValueError):
+            return False
+
+    def _rows(self, url, s):
+        """ (rows, True if they came from the cache) of one worksheet """
+        if s['empty']: return [], True
+
+        if self.cache is not None:
+            rows = self.cache.get(url, s['worksheet_id'], s['version'])
+            if rows is not None: return rows, True
+
+        # have to get column names via get_cells because the listfeed auto-changes names
+        rows = rows_from_cells(self.client.get_cells(url, s['worksheet_id'], auth_token=self.token).entry)
+
+        if self.cache is not None: self.cache.set(url, s['worksheet_id'], s['version'], rows)
+        return rows, False
+
+
+class _Entry(object):
+    def __init__(self, **kw):
+        self.__dict__.update(kw)
+
+
+class LocalSheets(object):
+    """
+    In-memory stand-in for the gdata SpreadsheetsClient calls SheetLoader makes, for
+    running a sheet suite without Google
+
+    worksheets is a list of (title, rows), rows a list of lists of cell values with the
+    column names first.  Blank cells are left out of the cells feed like gdata does.
+    Every worksheet has an etag that changes with set_rows(), get_cells counts the cells
+    feeds served.
+    """
+
+    def __init__(self, worksheets=()):
+        self.worksheets = collections.OrderedDict()  # id -> {'title', 'rows', 'version'}
+        self.get_cells_calls = 0
+
+        for title, rows in worksheets:
+            self.worksheets["od%d" % (len(self.worksheets) + 6)] = {'title': title, 'rows': rows, 'version': 1}
+
+    def set_rows(self, title, rows):
+        for ws in self.worksheets.values():
+            if ws['title'] == title:
+                ws['rows'] = rows
+                ws['version'] += 1
+                return
+
+        raise KeyError(title)
+
+    def get_worksheets(self, url, auth_token=None):
+        entries = []
+        for id, ws in self.worksheets.items():
+            cols = max([len(r) for r in ws['rows']] + [0])
+            entries.append(_Entry(get_worksheet_id=lambda id=id: id, title=_Entry(text=ws['title']),
+                                  etag='W/"%s.%d"' % (id, ws['version']),
+                                  row_count=_Entry(text=str(len(ws['rows']))), col_count=_Entry(text=str(cols))))
+
+        return _Entry(entry=entries)
+
+    def get_cells(self, url, worksheet_id, auth_token=None):
+        self.get_cells_calls += 1
+
+        rows = self.worksheets[worksheet_id]['rows']
+        return _Entry(entry=[_Entry(cell=_Entry(row=str(r + 1), col=str(c + 1), text=v, input_value=v))
+                             for r, row in enumerate(rows) for c, v in enumerate(row) if v != ""])
@@ -0,0 +1,135 @@
+"""
+Load testing for the OTP planner (test_runner.py --stress)
+
+Replays a list of planner requests against the server with the response caches
+bypassed, from 'concurrency' threads, for a number of iterations or a fixed
+duration, and summarizes throughput, error rate and latency percentiles per
+suite and per CSV line.
+"""
+
+import time
+import threading
+import logging
+
+import http_client
+from metrics import percentile
+
+
+class Stats(object):
+    """ latencies and errors of one group of requests """
+
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+
+    @property
+    def count(self):
+        return len(self.latencies) + self.errors
+
+    def summary(self, elapsed):
+        lat = sorted(self.latencies)
+        return {'requests': self.count,
+                'errors': self.errors,
+                'error_rate': float(self.errors) / self.count if self.count else 0.0,
+                'throughput': self.count / elapsed if elapsed > 0 else 0.0,
+                'p50': percentile(lat, 50), 'p90': percentile(lat, 90), 'p99': percentile(lat, 99),
+                'max': lat[-1] if len(lat) > 0 else None}
+
+
+class StressRun(object):
+    """
+    requests is a list of dicts with 'suite', 'line', 'url' and 'type' keys.
+
+    Every request is sent 'iterations' times, or round-robin until 'duration' seconds
+    have passed when duration is set.
+    """
+
+    def __init__(self, requests, concurrency=4, iterations=1, duration=None, timeout=None):
+        self.requests = requests
+        self.concurrency = max(1, concurrency)
+        self.iterations = iterations
+        self.duration = duration
+        self.timeout = timeout
+
+        self.lock = threading.Lock()
+        self.next = 0
+        self.total = Stats()
+        self.suites = {}
+        self.lines = {}
+        self.elapsed = 0
+
+    def _job(self, deadline):
+        with self.lock:
+            if deadline is not None:
+                if time.time() >= deadline: return None
+            elif self.next >= len(self.requests) * self.iterations:
+                return None
+
+            req = self.requests[self.next % len(self.requests)]
+            self.next += 1
+            return req
+
+    def _record(self, req, latency):
+        with self.lock:
+            for stats in (self.total, self.suites.setdefault(req['suite'], Stats()),
+                          self.lines.setdefault((req['suite'], req['line']), Stats())):
+                if latency is None:
+                    stats.errors += 1
+                else:
+                    stats.latencies.append(latency)
+
+    def _work(self, deadline):
+        client = http_client.get_client()
+        while True:
+            req = self._job(deadline)
+            if req is None: break
+
+            headers = {'Accept': 'application/%s' % req['type']} if req.get('type') else {}
+            start = time.time()
+            try:
+                client.get(req['url'], headers, self.timeout)
+                self._record(req, time.time() - start)
+            except Exception as ex:
+                logging.info("stress: %s failed - %s" % (req['url'], str(ex)))
+                self._record(req, None)
+
+    def run(self):
+        if len(self.requests) == 0:
+            return self
+
+        start = time.time()
+        deadline = start + self.duration if self.duration else None
+
+        threads = [threading.Thread(target=self._work, args=(deadline,)) for i in xrange(self.concurrency)]
+        for t in threads:
+            t.daemon = True
+            t.start()
+        for t in threads:
+            while t.is_alive(): t.join(0.5)
+
+        self.elapsed = time.time() - start
+        return self
+
+    def report(self):
+        """ plain text summary for the console """
+
+        def fmt(name, s):
+            ms = lambda v: "%8.1f" % (v * 1000) if v is not None else "       -"
+            return "%-40s %7d %6.1f%% %8.2f %s %s %s %s" % (name[-40:], s['requests'], s['error_rate'] * 100,
+                                                            s['throughput'], ms(s['p50']), ms(s['p90']),
+                                                            ms(s['p99']), ms(s['max']))
+
+        out = ["%-40s %7s %7s %8s %8s %8s %8s %8s" % ("", "reqs", "errors", "req/s", "p50 ms", "p90 ms",
+                                                      "p99 ms", "max ms")]
+        out.append(fmt("TOTAL (%.1fs, %d threads)" % (self.elapsed, self.concurrency),
+                       self.total.summary(self.elapsed)))
+
+        out.append("")
+        for suite in sorted(self.suites):
+            out.append(fmt(suite, self.suites[suite].summary(self.elapsed)))
+
+        out.append("")
+        for key in sorted(self.lines):
+            out.append(fmt("%s:%d" % key, self.lines[key].summary(self.elapsed)))
+
+        return '\n'.join(out)
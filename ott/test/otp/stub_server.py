@@ -0,0 +1,400 @@
+"""
+Local OTP / OneBusAway stand-in for offline, deterministic runs
+
+Serves every endpoint the test classes call, from one port:
+
+/otp/                                   serverInfo
+/otp/routers/default                    router (graph polygon)
+/otp/routers/default/metadata           graph metadata
+/otp/routers/default/plan?...           planner, XML or JSON depending on the Accept header
+/otp/routers/default/bike_rental?...    bike rental stations
+/otp-geocoder/geocode?address=...       geocoder
+/trip-updates?debug                     GTFS-rt debug feeds (OneBusAway)
+/vehicle-positions?debug
+/__stub__/stats                         request counters of the stub itself (JSON)
+
+Responses are synthetic and derived from the request only, so the same request always
+gets the same answer.  With a response store (see test_runner.py --record) recorded
+responses are served first, for the URL as recorded from --origin.
+
+Latency (with jitter) and failures can be injected: error responses, dropped connections
+and requests that hang.  The injection is driven by a seeded random generator, so two
+runs with the same seed and request order see the same failures.
+
+    python stub_server.py -p 8080 --latency 50 --error-rate 0.05
+    python test_runner.py -o http://localhost:8080/otp/
+
+or in-process:
+
+    stub = StubServer(latency=0.01).start()
+    ... stub.otp_url ...
+    stub.stop()
+"""
+
+import sys
+import json
+import math
+import time
+import random
+import socket
+import hashlib
+import urlparse
+import argparse
+import threading
+import BaseHTTPServer
+import SocketServer
+
+import response_cache
+
+
+SERVER_VERSION = {'major': 1, 'minor': 0, 'incremental': 0, 'version': '1.0.0', 'qualifier': 'stub'}
+
+# every synthetic response is dated at this time, so recorded stores and digests don't change between runs
+TIMESTAMP = 1404733294
+
+BOUNDS = {'lowerLeftLatitude': 27.6, 'lowerLeftLongitude': -82.9,
+          'upperRightLatitude': 28.4, 'upperRightLongitude': -82.1}
+
+
+def _seed(*values):
+    """ stable random generator for a request, so the same request always gets the same response """
+    return random.Random(int(hashlib.md5('|'.join(str(v) for v in values)).hexdigest()[:8], 16))
+
+
+def _place(value, rnd):
+    try:
+        lat, lng = [float(v) for v in value.split(',')[:2]]
+        return lat, lng
+    except (AttributeError, ValueError):
+        return BOUNDS['lowerLeftLatitude'] + rnd.random() * 0.8, BOUNDS['lowerLeftLongitude'] + rnd.random() * 0.8
+
+
+def _distance(a, b):
+    """ meters between two (lat, lng), equirectangular is plenty at city scale """
+    x = math.radians(b[1] - a[1]) * math.cos(math.radians((a[0] + b[0]) / 2))
+    y = math.radians(b[0] - a[0])
+    return math.sqrt(x * x + y * y) * 6371000
+
+
+# SYNTHETIC RESPONSES - (status, content type, body)
+
+def plan(query, type='xml'):
+    """ 1-3 itineraries, each a walk leg followed by one leg of the first requested non-walk mode """
+
+    rnd = _seed(query.get('fromPlace'), query.get('toPlace'), query.get('mode'), query.get('arriveBy'))
+    origin = _place(query.get('fromPlace'), rnd)
+    dest = _place(query.get('toPlace'), rnd)
+
+    requested = (query.get('mode') or 'TRANSIT,WALK').upper().split(',')
+    transit = [m for m in requested if m in ('BUS', 'TRAM', 'RAIL', 'SUBWAY', 'FERRY')]
+    if 'TRANSIT' in requested and len(transit) == 0: transit = ['BUS']
+    street = [m for m in requested if m in ('BICYCLE', 'CAR')]
+
+    # transit trips walk to the first transit mode, street trips are one leg of the first street mode
+    mode = transit[0] if len(transit) > 0 else street[0] if len(street) > 0 else 'WALK'
+
+    total = max(_distance(origin, dest) * 1.3, 100.0)
+    start = 7 * 3600 + 30 * 60
+
+    itineraries = []
+    for n in xrange(rnd.randint(1, 3)):
+        walk = round(min(total, 200 + rnd.random() * 400), 1) if len(transit) > 0 or mode == 'WALK' else 0.0
+        ride = round(total - walk, 1)
+        speed = {'WALK': 1.4, 'BICYCLE': 4.5, 'CAR': 12.0}.get(mode, 7.0)
+        duration = int(walk / 1.4 + ride / speed) + 60 * n
+        depart = start + 600 * n
+
+        legs = [{'mode': 'WALK', 'route': '', 'distance': walk}] if walk > 0 else []
+        if ride > 0 and mode != 'WALK':
+            legs.append({'mode': mode, 'route': str(rnd.choice([1, 2, 5, 6, 9, 12])) if mode == 'BUS' else '',
+                         'distance': ride})
+
+        # real responses carry an encoded polyline per leg, which makes up most of their size
+        for leg in legs:
+            points = ''.join(chr(rnd.randint(63, 126)) for i in xrange(40 + int(leg['distance'] / 50) % 400))
+            leg['legGeometry'] = {'points': points.replace('<', '?').replace('&', '?'), 'length': len(points) / 4}
+
+        itineraries.append({'duration': duration, 'walkDistance': walk, 'legs': legs,
+                            'startTime': "2014-07-07T%02d:%02d:%02d-04:00" % (depart / 3600, depart / 60 % 60,
+                                                                             depart % 60),
+                            'endTime': "2014-07-07T%02d:%02d:%02d-04:00" % ((depart + duration) / 3600,
+                                                                           (depart + duration) / 60 % 60,
+                                                                           (depart + duration) % 60)})
+
+    if type == 'json':
+        return 200, 'application/json', json.dumps({'requestParameters': query, 'error': None,
+                                                    'plan': {'date': TIMESTAMP * 1000, 'itineraries': itineraries}})
+
+    body = ['<?xml version="1.0" encoding="UTF-8" standalone="yes"?><response><requestParameters/><plan>'
+            '<date>%d</date><itineraries>' % (TIMESTAMP * 1000)]
+    for it in itineraries:
+        body.append('<itinerary><duration>%d</duration><startTime>%s</startTime><endTime>%s</endTime>'
+                    '<walkDistance>%.1f</walkDistance><legs>' % (it['duration'], it['startTime'], it['endTime'],
+                                                                 it['walkDistance']))
+        for leg in it['legs']:
+            body.append('<leg mode="%s" route="%s"><distance>%.1f</distance><legGeometry><length>%d</length>'
+                        '<points>%s</points></legGeometry></leg>' % (leg['mode'], leg['route'], leg['distance'],
+                                                                     leg['legGeometry']['length'],
+                                                                     leg['legGeometry']['points']))
+        body.append('</legs></itinerary>')
+    body.append('</itineraries></plan></response>')
+
+    return 200, 'application/xml', ''.join(body)
+
+
+def bike_rental(query):
+    rnd = _seed('bike_rental')
+    stations = [{'id': str(n), 'name': 'Station %d' % n, 'bikesAvailable': rnd.randint(1, 12),
+                 'spacesAvailable': rnd.randint(0, 12),
+                 'lat': round(28.05 + rnd.random() * 0.03, 6), 'lng': round(-82.43 + rnd.random() * 0.03, 6)}
+                for n in xrange(40)]
+    return 200, 'application/json', json.dumps({'stations': stations})
+
+
+def geocode(query):
+    address = query.get('address', '')
+    rnd = _seed('geocode', address)
+    results = [{'description': address, 'lat': round(28.06 + rnd.random() * 0.01, 6),
+                'lng': round(-82.41 + rnd.random() * 0.01, 6)}] if address else []
+    return 200, 'application/json', json.dumps({'count': len(results), 'error': None, 'results': results})
+
+
+def gtfs_rt(kind):
+    rnd = _seed(kind)
+    entities = []
+    for n in xrange(30):
+        if kind == 'trip-updates':
+            entities.append('entity {\n  id: "%d"\n  trip_update {\n    trip {\n      trip_id: "%d"\n    }\n'
+                            '    stop_time_update {\n      stop_sequence: %d\n      arrival {\n        delay: %d\n'
+                            '      }\n    }\n  }\n}\n' % (n, 1000 + n, rnd.randint(1, 40), rnd.randint(-60, 600)))
+        else:
+            entities.append('entity {\n  id: "%d"\n  vehicle {\n    position {\n      latitude: %.6f\n'
+                            '      longitude: %.6f\n    }\n  }\n}\n' % (n, 28.05 + rnd.random() * 0.05,
+                                                                      -82.45 + rnd.random() * 0.05))
+
+    header = 'header {\n  gtfs_realtime_version: "1.0"\n  timestamp: %d\n}\n' % TIMESTAMP
+    return 200, 'text/plain', header + ''.join(entities)
+
+
+def synthetic(path, query, type):
+    """ (status, content type, body) for a request, 404 for unknown endpoints """
+
+    p = path.rstrip('/')
+    if p.endswith('/routers/default/plan'): return plan(query, type)
+    if p.endswith('/routers/default/bike_rental'): return bike_rental(query)
+    if p.endswith('/routers/default/metadata'):
+        return 200, 'application/json', json.dumps(dict(BOUNDS, transitModes=['BUS', 'TRAM', 'RAIL']))
+    if p.endswith('/routers/default'):
+        polygon = [[BOUNDS['lowerLeftLongitude'] + 0.01 * n, BOUNDS['lowerLeftLatitude'] + 0.005 * n]
+                   for n in xrange(80)]
+        return 200, 'application/json', json.dumps({'routerId': 'default', 'polygon': polygon})
+    if p.endswith('/geocode'): return geocode(query)
+    if p.endswith('/trip-updates'): return gtfs_rt('trip-updates')
+    if p.endswith('/vehicle-positions'): return gtfs_rt('vehicle-positions')
+    if p.endswith('/otp'):
+        return 200, 'application/json', json.dumps({'serverVersion': SERVER_VERSION, 'cpuName': 'stub', 'nCores': 1})
+
+    return 404, 'text/plain', 'Not found: %s\n' % path
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    # headers and body leave in one segment, and without Nagle's delay
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        if self.server.stub.verbose: BaseHTTPServer.BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def do_GET(self):
+        stub = self.server.stub
+        path, _, query = self.path.partition('?')
+
+        if path == '/__stub__/stats':
+            return self.respond(200, 'application/json', json.dumps(stub.stats()))
+
+        accept = self.headers.get('Accept', '')
+        type = 'json' if 'json' in accept else 'xml' if 'xml' in accept else None
+
+        fault = stub.fault()
+        stub.count(path, fault)
+
+        if stub.latency > 0 or stub.jitter > 0:
+            time.sleep(max(0, stub.latency + stub.rnd_uniform(-stub.jitter, stub.jitter)))
+
+        if fault == 'drop':
+            self.close_connection = 1
+            self.connection.shutdown(socket.SHUT_RDWR)
+            return
+        if fault == 'hang':
+            time.sleep(stub.hang)
+        if fault == 'error':
+            return self.respond(stub.error_status, 'text/plain', 'Injected error\n')
+
+        body = stub.recorded(self.path, type)
+        if body is not None:
+            return self.respond(200, 'application/%s' % (type or 'octet-stream'), body)
+
+        status, ctype, body = synthetic(path, dict(urlparse.parse_qsl(query)), type)
+        self.respond(status, ctype, body)
+
+    def respond(self, status, ctype, body):
+        self.send_response(status)
+        self.send_header('Content-Type', ctype)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class _Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+    def process_request_thread(self, request, client_address):
+        # keep-alive connections block their thread until the client hangs up, stop() closes them
+        self.stub.track(request, threading.current_thread())
+        try:
+            SocketServer.ThreadingMixIn.process_request_thread(self, request, client_address)
+        finally:
+            self.stub.track(request, None)
+
+    def handle_error(self, request, client_address):
+        if not self.stub.stopping: SocketServer.ThreadingMixIn.handle_error(self, request, client_address)
+
+
+class StubServer(object):
+    """
+    latency and jitter in seconds; error_rate, drop_rate and hang_rate are probabilities per
+    request; store is a response_cache.DiskCache path with recorded responses, looked up as
+    origin + request path
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0, jitter=0, error_rate=0, error_status=500,
+                 drop_rate=0, hang_rate=0, hang=60, store=None, origin='http://localhost:8080', seed=0,
+                 verbose=False):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.drop_rate = drop_rate
+        self.hang_rate = hang_rate
+        self.hang = hang
+        self.origin = origin.rstrip('/')
+        self.verbose = verbose
+
+        self.store = response_cache.DiskCache(store) if store else None
+
+        self.lock = threading.Lock()
+        self.random = random.Random(seed)
+        self.requests = {}
+        self.faults = {}
+        self.connections = {}  # open request socket -> its handler thread
+        self.stopping = False
+
+        self.server = _Server((host, port), Handler)
+        self.server.stub = self
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return "http://%s:%d/" % (host, port)
+
+    @property
+    def otp_url(self):
+        return self.base_url + "otp/"
+
+    def rnd_uniform(self, a, b):
+        with self.lock:
+            return self.random.uniform(a, b)
+
+    def fault(self):
+        """ None, or the failure to inject into this request: 'error', 'drop' or 'hang' """
+        with self.lock:
+            r = self.random.random()
+
+        for kind, rate in (('error', self.error_rate), ('drop', self.drop_rate), ('hang', self.hang_rate)):
+            if r < rate: return kind
+            r -= rate
+        return None
+
+    def count(self, path, fault=None):
+        with self.lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+            if fault is not None: self.faults[fault] = self.faults.get(fault, 0) + 1
+
+    def stats(self):
+        with self.lock:
+            return {'requests': dict(self.requests), 'total': sum(self.requests.values()), 'faults': dict(self.faults)}
+
+    def track(self, request, thread):
+        with self.lock:
+            if thread is not None:
+                self.connections[request] = thread
+            else:
+                self.connections.pop(request, None)
+
+    def recorded(self, path, type):
+        if self.store is None: return None
+        return self.store.get(self.origin + path, type, expire=False)
+
+    def start(self):
+        """ serve from a daemon thread, returns self """
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self, wait=1.0):
+        """ stop serving and close the open connections, waiting up to 'wait' seconds for their handlers """
+        self.stopping = True
+        self.server.shutdown()
+
+        with self.lock:
+            connections = self.connections.items()
+        for request, thread in connections:
+            try:
+                request.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+        for request, thread in connections:
+            thread.join(wait)
+
+        self.server.server_close()
+        if self.store is not None: self.store.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local OTP / OneBusAway stand-in server")
+
+    parser.add_argument('-H', '--host', help="Address to listen on (default 127.0.0.1)")
+    parser.add_argument('-p', '--port', type=int, help="Port to listen on (default 8080)")
+    parser.add_argument('--latency', type=float, help="Added latency per request in milliseconds")
+    parser.add_argument('--jitter', type=float, help="Random +/- latency per request in milliseconds")
+    parser.add_argument('--error-rate', type=float, help="Fraction of requests answered with --error-status")
+    parser.add_argument('--error-status', type=int, help="HTTP status of injected errors (default 500)")
+    parser.add_argument('--drop-rate', type=float, help="Fraction of requests whose connection is closed unanswered")
+    parser.add_argument('--hang-rate', type=float, help="Fraction of requests that hang for --hang seconds first")
+    parser.add_argument('--hang', type=float, help="Seconds a hanging request waits (default 60)")
+    parser.add_argument('--store', help="Serve the responses recorded in this response store first")
+    parser.add_argument('--origin',
+                        help="Scheme and host the store's responses were recorded from (default http://localhost:8080)")
+    parser.add_argument('--seed', type=int, help="Seed of the fault and jitter generator (default 0)")
+    parser.add_argument('-v', '--verbose', action='store_true', help="Log every request")
+
+    parser.set_defaults(host='127.0.0.1', port=8080, latency=0, jitter=0, error_rate=0, error_status=500, drop_rate=0,
+                        hang_rate=0, hang=60, origin='http://localhost:8080', seed=0)
+
+    args = parser.parse_args(sys.argv[1:])
+
+    stub = StubServer(args.host, args.port, args.latency / 1000.0, args.jitter / 1000.0, args.error_rate,
+                      args.error_status, args.drop_rate, args.hang_rate, args.hang, args.store, args.origin,
+                      args.seed, args.verbose)
+
+    print "Serving OTP on %s and OneBusAway on %s" % (stub.otp_url, stub.base_url)
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
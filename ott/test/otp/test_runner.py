@@ -11,6 +11,7 @@ oauth2client
 
 import os
 import sys
+import copy
 import time
 import datetime
 import logging
@@ -18,19 +19,31 @@ import traceback
 
 import csv
 import re
-import socket
+import threading
 import urllib
 import urllib2
-from mako.template import Template
 
 import ast
+import itertools
 import argparse
 import unittest
 import json
 
-import gdata.spreadsheet
-import gdata.spreadsheets.client
-import gdata.gauth
+import workers
+import http_client
+import response_cache
+import planner_model
+import stress
+import metrics
+import report_writer
+import exporters
+import manifest
+import sheets
+import ingest
+import run_store
+import sharding
+import process_pool
+import breaker
 
 
 def envvar(name, defval=None, suffix=None):
@@ -45,35 +58,244 @@ def envvar(name, defval=None, suffix=None):
 # from tests import * # import Test base class and other child classes
 
 
-_cache = {}
+_cache = response_cache.LRUCache()  # see configure_cache()
 
-def cache_get(key):
-    """ basic dict accessor for global _cache """
+def configure_cache(max_bytes=None, ttl=None, compress=False):
+    """ replace the global _cache, e.g. after command-line parsing """
+    global _cache
 
-    if key in _cache:
-        return _cache[key]
+    _cache = response_cache.LRUCache(max_bytes, ttl, compress)
 
-    return None
+    return _cache
+
+
+def cache_get(key, count=True):
+    """ accessor for global _cache, None if missing or expired, count=False for lookups that aren't requests """
+
+    return _cache.get(key, count)
+
+
+def cache_set(key, val, ttl=None):
+    """ setter for global _cache, ttl (seconds) overrides the cache default """
+
+    _cache.set(key, val, ttl)
+
+
+_parsed = response_cache.ParsedCache()
+
+def parsed(kind, url, body, parser):
+    """ parser(body), built once per response and shared by every test method that asks for it """
+
+    return _parsed.get(kind, url, body, parser)
 
 
-def cache_set(key, val):
-    """ basic dict setter for global _cache """
+_fetch_stats = metrics.FetchRecorder()
+
+_breaker = breaker.CircuitBreaker()    # see configure_breaker()
+_timeouts = breaker.AdaptiveTimeout()
+
+def configure_breaker(threshold=5, cooldown=60, timeout=45, multiplier=0):
+    """ replace the global circuit breaker and adaptive timeouts, e.g. after command-line parsing """
+    global _breaker, _timeouts
+
+    _breaker = breaker.CircuitBreaker(threshold, cooldown)
+    _timeouts = breaker.AdaptiveTimeout(timeout, multiplier)
+
+    return _breaker
+
+
+_store = None       # response_cache.DiskCache, see open_store()
+_store_mode = None  # 'record', 'replay' or 'cache'
+_today = None       # day of the recording when replaying, see today()
+
+def today():
+    """ the day planner lines without a date plan for: the recording's day when replaying, else now """
+
+    return _today or datetime.datetime.now()
+
+
+def open_store(path, mode, ttl=None):
+    """
+    Enable the persistent response store
+
+    record: always call the server and save every response
+    replay: only serve saved responses (ignoring ttl), never touch the network
+    cache:  serve saved responses younger than ttl, save anything else that is fetched
+    """
+    global _store, _store_mode, _today
+
+    _store = response_cache.DiskCache(path, ttl)
+    _store_mode = mode
+
+    # planner lines without a date ask for the recording day's plans, or replay would miss them the next day
+    if mode == 'record':
+        _store.set_meta('date', datetime.datetime.now().strftime("%Y-%m-%d"))
+    elif mode == 'replay' and _store.get_meta('date') is not None:
+        _today = datetime.datetime.strptime(_store.get_meta('date'), "%Y-%m-%d")
+
+    return _store
+
+
+_failures = response_cache.NegativeCache()  # see configure_failures()
+_flights = workers.SingleFlight()
+_retries = 0
+_retry_backoff = 0.5
+
+def configure_failures(ttl=300, retries=0, backoff=0.5):
+    """
+    replace the global negative cache and set the retry policy: a fetch that fails with a
+    connection error, timeout or 5xx is tried up to 'retries' more times, waiting
+    backoff, 2x backoff, ... seconds in between, before its failure is cached for ttl seconds
+    """
+    global _failures, _retries, _retry_backoff
+
+    _failures = response_cache.NegativeCache(ttl)
+    _retries = retries
+    _retry_backoff = backoff
+
+    return _failures
+
+
+def fetch(url, type=None, suite=None):
+    """
+    GET url through the response cache(s) and the shared HTTP client
+
+    Returns (body, response_time), response_time is 0 for cache hits.  The memory caches
+    are keyed by response_cache.canonical_url(url), so one response serves every spelling
+    of a request.  Only one fetch per key is in flight at a time, concurrent callers share
+    its result.  Errors are raised to the caller and cached in _failures, later calls for
+    the url raise response_cache.CachedFailure until the entry expires.  A host whose
+    circuit is open (see _breaker) raises breaker.EndpointUnavailable without a request,
+    which isn't cached, so the url is fetched again as soon as the circuit closes.  Every
+    call is recorded in _fetch_stats under 'suite' (the test class name).
+    """
+
+    key = response_cache.canonical_url(url)
+
+    body = cache_get(key)
+    if body is not None:
+        _fetch_stats.record(url, suite, 0, len(body), hit=True)
+        return body, 0
+
+    failed = _failures.get(key)
+    if failed is not None:
+        _fetch_stats.record(url, suite, error=failed)
+        raise failed
+
+    flight = {}
+    try:
+        res, shared = _flights.do(key, _fetch, url, key, type, suite, flight)
+    except Exception as ex:
+        # the leader of the flight recorded its failure, every caller that waited for it records its own
+        if 'leader' not in flight: _fetch_stats.record(url, suite, error=ex)
+        raise
 
-    # XXX save time for expiration
+    if shared:
+        _fetch_stats.record(url, suite, 0, len(res[0]), hit=True)
+        return res[0], 0
 
-    _cache[key] = val
+    return res
+
+
+def _fetch(url, key, type, suite, flight):
+    """ fetch() of a url missing from the memory caches, failures end up in _failures """
+
+    flight['leader'] = True
+
+    # a concurrent flight may have finished between the cache lookups and this one, fetch()
+    # already counted this request's lookup
+    body = cache_get(key, count=False)
+    if body is not None:
+        _fetch_stats.record(url, suite, 0, len(body), hit=True)
+        return body, 0
+
+    try:
+        return _fetch_network(url, key, type, suite)
+    except breaker.EndpointUnavailable:
+        raise
+    except Exception as ex:
+        _failures.set(key, ex)
+        raise
+
+
+def _fetch_network(url, key, type, suite):
+    if _store is not None and _store_mode != 'record':
+        body = _store.get(url, type, expire=_store_mode != 'replay')
+        if body is not None:
+            cache_set(key, body)
+            _fetch_stats.record(url, suite, 0, len(body), hit=True)
+            return body, 0
+
+        if _store_mode == 'replay':
+            ex = response_cache.ReplayMiss(url, type)
+            _fetch_stats.record(url, suite, error=ex)
+            raise ex
+
+    headers = {'Accept': 'application/%s' % type} if type is not None else {}
+
+    attempt = 0
+    while True:
+        try:
+            _breaker.check(url)
+        except breaker.EndpointUnavailable as ex:
+            _fetch_stats.record(url, suite, error=ex)
+            raise
+
+        timeout = _timeouts.timeout(url)
+        start = time.time()
+        try:
+            status, body = http_client.get_client().get(url, headers, timeout)
+            break
+        except Exception as ex:
+            # a request cut short by its adaptive timeout was slow, not proof the host is down
+            if _timeouts.cut_short(ex, timeout):
+                _breaker.release(url)
+            else:
+                _breaker.failure(url, ex)
+            _fetch_stats.record(url, suite, time.time() - start, error=ex)
+            if attempt >= _retries or not breaker.is_failure(ex): raise
+
+        logging.info("fetch: retrying %s - %s" % (url, str(ex)))
+        time.sleep(_retry_backoff * 2 ** attempt)
+        attempt += 1
+
+    response_time = time.time() - start
+
+    _breaker.success(url)
+    _timeouts.add(url, response_time)
+
+    _fetch_stats.record(url, suite, response_time, len(body))
+
+    logging.info("fetch: response time of " + str(response_time) + " seconds for url " + url)
+    logging.debug("fetch: output for " + url)
+    logging.debug(body)
+
+    cache_set(key, body)
+    if _store is not None:
+        _store.set(url, type, body, status)
+
+    return body, response_time
 
 
 class TestResultSuccess(unittest.TestResult):
     """
-    TestResult class that also tracks successful tests
+    TestResult class that also tracks successful tests and the time each test took
     """
 
     def __init__(self, *args, **kwargs):
         self.success = []
+        self.times = {}  # test -> seconds
 
         super(TestResultSuccess, self).__init__(args, kwargs)
 
+    def startTest(self, test):
+        self.times[test] = time.time()
+        super(TestResultSuccess, self).startTest(test)
+
+    def stopTest(self, test):
+        super(TestResultSuccess, self).stopTest(test)
+        self.times[test] = time.time() - self.times[test]
+
     def addSuccess(self, test):
         self.success.append(test)
 
@@ -101,13 +323,15 @@ class Test(unittest.TestCase):
 	inspired by: http://eli.thegreenplace.net/2011/08/02/python-unit-testing-parametrized-test-cases/
 	"""
 
+    # params the outcome of this class' tests depends on, used to share req_ prerequisite
+    # results between CSV lines - None means every param
+    dependency_params = None
+
     def __init__(self, methodName="runTest", param=None):
         super(Test, self).__init__(methodName)
         self.param = param
         self.methodName = methodName
 
-    # XXX param req_TESTCLASS_TESTMETHOD and skip if fails
-
     @staticmethod
     def add_with_param(class_name, param=None):
         loader = unittest.TestLoader()
@@ -115,29 +339,8 @@ class Test(unittest.TestCase):
 
         suite = unittest.TestSuite()
 
-        # req_TESTNAME_TESTMETHOD conditional dependencies
-        reqsuite = unittest.TestSuite()
-        reqres = unittest.TestResult()
-        for key in param.keys():
-            if key[0:4] <> "req_": continue
-            depends = key.split("_")
-            if depends[1] == class_name: continue  # try to prevent circular dependencies
-            tmp_cls = find_test_class(depends[1])
-            # class is depends[1] (cannot contain '_')
-            methods = loader.getTestCaseNames(tmp_cls)
-            for m in methods:
-                if m <> param[key]: continue  # XXX should we do this, or run all tests?
-                reqsuite.addTest(tmp_cls(methodName=m, param=param))
-
-        for t in reqsuite:
-            t.run(reqres)
-
-        if reqres.testsRun > 0 and (reqres.errors > 0 or reqres.failures > 0):
-            skip_tests = True
-        else:
-            skip_tests = False
-
-        import copy
+        # req_TESTNAME_TESTMETHOD conditional dependencies, each distinct prerequisite only runs once per process
+        skip_tests = not _dependencies.passed(class_name, param)
 
         for name in names:
             logging.info(class_name)
@@ -167,6 +370,99 @@ class Test(unittest.TestCase):
         return False
 
 
+class Dependencies(object):
+    """
+    Memoized req_CLASSNAME=testMethod prerequisites
+
+    A CSV line with e.g. req_OTPVersion=test_version depends on OTPVersion.test_version
+    passing with that line's params.  Each prerequisite node is identified by
+    (class, method, dependency_params values), so lines that share a prerequisite
+    share its one run.  resolve() runs every node of a whole suite up front, passed()
+    looks the outcome up (running the node on demand if it wasn't resolved).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.outcomes = {}  # node key -> True if the prerequisite passed
+        self.flights = workers.SingleFlight()
+
+    @staticmethod
+    def nodes(cls, param):
+        """ [(key, prerequisite class, method)] required by a line of cls """
+        res = []
+        for key in param.keys():
+            if key[0:4] <> "req_": continue
+            depends = key.split("_")
+            # class is depends[1] (cannot contain '_')
+            tmp_cls = find_test_class(depends[1])
+            if tmp_cls is None or tmp_cls is cls: continue  # try to prevent circular dependencies
+
+            if param[key] not in unittest.TestLoader().getTestCaseNames(tmp_cls): continue
+
+            used = tmp_cls.dependency_params if tmp_cls.dependency_params is not None else param.keys()
+            ident = tuple(sorted((k, repr(param.get(k))) for k in used if not k.startswith("req_")))
+            res.append(((tmp_cls.__name__, param[key], ident), tmp_cls, param[key]))
+
+        return res
+
+    @staticmethod
+    def _run(node, param):
+        key, tmp_cls, method = node
+        res = unittest.TestResult()
+        tmp_cls(methodName=method, param=copy.copy(param)).run(res)
+
+        logging.info("dependency %s.%s: %d run, %d errors, %d failures" % (key[0], key[1], res.testsRun,
+                                                                          len(res.errors), len(res.failures)))
+
+        return res.testsRun == 0 or (len(res.errors) == 0 and len(res.failures) == 0)
+
+    def resolve(self, lines, concurrency=1):
+        """ run every distinct prerequisite of the (cls, param) lines once, 'concurrency' at a time """
+
+        todo = {}
+        for cls, param in lines:
+            for node in self.nodes(cls, param):
+                if node[0] not in self.outcomes and node[0] not in todo:
+                    todo[node[0]] = (node, param)
+
+        def run(item):
+            return item[0][0], self._run(item[0], item[1])
+
+        for key, outcome in workers.imap(run, todo.values(), concurrency):
+            with self.lock:
+                self.outcomes[key] = outcome
+
+        return len(todo)
+
+    def passed(self, cls, param):
+        """ True if every prerequisite of this line passed """
+
+        ok = True
+        for node in self.nodes(cls, param):
+            with self.lock:
+                outcome = self.outcomes.get(node[0])
+            if outcome is None:
+                # lines running concurrently wait for the one running the prerequisite
+                outcome, shared = self.flights.do(node[0], self._resolve, node, param)
+            ok = ok and outcome
+
+        return ok
+
+    def _resolve(self, node, param):
+        with self.lock:
+            outcome = self.outcomes.get(node[0])
+        if outcome is not None: return outcome
+
+        outcome = self._run(node, param)
+        with self.lock:
+            self.outcomes[node[0]] = outcome
+
+        return outcome
+
+
+_dependencies = Dependencies()
+
+
 class UITest(Test):
     """ Selenium-based tests for client-side functions """
 
@@ -208,7 +504,20 @@ class OneBusAway(Test):
 
         super(OneBusAway, self).__init__(methodName, param)
 
+    def prepare(self):
+        """ finalize self.url before calling the API, subclasses append their endpoint here """
+        pass
+
+    def request(self):
+        """ returns the (url, accept type) this test will fetch without calling the API """
+        if not getattr(self, 'prepared', False):
+            self.prepare()
+            self.prepared = True
+
+        return self.url, None
+
     def run(self, result=None):
+        self.request()
 
         self.call_api(self.url)
 
@@ -221,29 +530,12 @@ class OneBusAway(Test):
 
         logging.debug("call_api: %s" % url)
 
-        if cache_get(url) is not None:
-            self.api_response = cache_get(url)
+        self.api_response = None
+        try:
+            self.api_response, self.response_time = fetch(url, None, self.__class__.__name__)
+        except Exception as ex:
+            self.api_response = ""
             self.response_time = 0
-        else:
-            self.api_response = None
-            try:
-                start = time.time()
-                socket.setdefaulttimeout(45)  # XXX params ?
-                req = urllib2.Request(url, None, {})
-                res = urllib2.urlopen(req)
-                self.api_response = res.read()
-                res.close()
-                end = time.time()
-                self.response_time = end - start
-
-                logging.info("call_api: response time of " + str(self.response_time) + " seconds for url " + url)
-                logging.debug("call_api: API output for " + url)
-                logging.debug(self.api_response)
-
-                cache_set(self.url, self.api_response)
-            except Exception as ex:
-                self.api_response = ""
-                self.response_time = 0
             # self.fail(msg="{0} failed - Exception: {1}".format(url, str(ex)))
 
         self.assertLessEqual(self.response_time, 30, msg="%s took *longer than 30 seconds*" % url)
@@ -276,13 +568,29 @@ class OTPTest(Test):
 
         super(OTPTest, self).__init__(methodName, param)
 
+    def prepare(self):
+        """ finalize self.url and self.type before calling OTP, subclasses append their parameters here """
+        pass
+
+    def request(self):
+        """ returns the (url, accept type) this test will fetch without calling OTP """
+        if not getattr(self, 'prepared', False):
+            self.prepare()
+            self.prepared = True
+
+        return self.url, self.type
+
     def run(self, result=None):
-        self.url = self.url  # + self.url_params(self.param)
+        self.request()
 
         self.call_otp(self.url)
 
         super(OTPTest, self).run(result)
 
+    def otp_json(self):
+        """ self.otp_response decoded once per response, the same object is shared by every test method """
+        return parsed('json', self.url, self.otp_response, json.loads)
+
     def setResponse(self, type):
         """ Allow JSON or XML responses """
         self.type = type if type in ['json', 'xml'] else 'json'
@@ -294,29 +602,12 @@ class OTPTest(Test):
 
         logging.debug("call_otp: %s" % url)
 
-        if cache_get(self.url) is not None:
-            self.otp_response = cache_get(self.url)
+        self.otp_response = None
+        try:
+            self.otp_response, self.response_time = fetch(url, self.type, self.__class__.__name__)
+        except Exception as ex:
+            self.otp_response = ""
             self.response_time = 0
-        else:
-            self.otp_response = None
-            try:
-                start = time.time()
-                socket.setdefaulttimeout(45)  # XXX params ?
-                req = urllib2.Request(url, None, {'Accept': 'application/%s' % self.type})
-                res = urllib2.urlopen(req)
-                self.otp_response = res.read()
-                res.close()
-                end = time.time()
-                self.response_time = end - start
-
-                logging.info("call_otp: response time of " + str(self.response_time) + " seconds for url " + url)
-                logging.debug("call_otp: OTP output for " + url)
-                logging.debug(self.otp_response)
-
-                cache_set(self.url, self.otp_response)
-            except Exception as ex:
-                self.otp_response = ""
-                self.response_time = 0
             # self.fail(msg="{0} failed - Exception: {1}".format(url, str(ex)))
 
         self.assertLessEqual(self.response_time, 30, msg="%s took *longer than 30 seconds*" % url)
@@ -345,16 +636,16 @@ class OTPTest(Test):
 
 
 class GTFSVehiclePositions(OneBusAway):
+    dependency_params = ['otp_url']
+
     def __init__(self, methodName='runTest', param=None):
         self.methodName = methodName
         self.param = param
         super(GTFSVehiclePositions, self).__init__(methodName, param)
 
-    def run(self, result=None):
+    def prepare(self):
         self.url = self.url + "vehicle-positions?debug"
 
-        super(GTFSVehiclePositions, self).run(result)
-
     def test_vehicles_available(self):
         t = re.findall("entity {", self.api_response)
 
@@ -364,16 +655,16 @@ class GTFSVehiclePositions(OneBusAway):
 
 
 class GTFSTripUpdates(OneBusAway):
+    dependency_params = ['otp_url']
+
     def __init__(self, methodName='runTest', param=None):
         self.methodName = methodName
         self.param = param
         super(GTFSTripUpdates, self).__init__(methodName, param)
 
-    def run(self, result=None):
+    def prepare(self):
         self.url = self.url + "trip-updates?debug"
 
-        super(GTFSTripUpdates, self).run(result)
-
     def test_trips_available(self):
         t = re.findall("entity {", self.api_response)
 
@@ -383,6 +674,8 @@ class GTFSTripUpdates(OneBusAway):
 class OTPVersion(OTPTest):
     """ Check /otp/ serverInfo endpoint for various information """
 
+    dependency_params = ['otp_url', 'major', 'minor']
+
     def __init__(self, methodName='runTest', param=None):
         self.methodName = methodName
         self.param = param
@@ -395,14 +688,13 @@ class OTPVersion(OTPTest):
         # can self.skipTest(reason) here
         pass
 
-    def run(self, result=None):
+    def prepare(self):
         self.setResponse("json")
-        super(OTPVersion, self).run(result)
 
     def test_version(self):
         if not self.check_param('major') or not self.check_param('minor'): self.skipTest("suppress")
 
-        d = json.loads(self.otp_response)
+        d = self.otp_json()
 
         t = int(self.param['major']) == d['serverVersion']['major'] and int(self.param['minor']) == d['serverVersion'][
             'minor']
@@ -419,6 +711,8 @@ class USFGeocoder(OTPTest):
 	@TODO org.otp.geocoder.ws.geocoderserver missing from 1.0.x
 	"""
 
+    dependency_params = ['otp_url', 'address', 'location']
+
     def __init__(self, methodName='runTest', param=None):
         self.param = param
         self.url = "/otp-geocoder/geocode?"
@@ -426,16 +720,14 @@ class USFGeocoder(OTPTest):
         if methodName == 'test_result_too_small':
             setattr(self, 'test_result_too_small', unittest.case.expectedFailure(self.test_result_too_small))
 
-    def run(self, result=None):
+    def prepare(self):
         self.setResponse("json")
 
         self.url += self.url_params(self.param)
 
-        super(USFGeocoder, self).run(result)
-
     def test_count(self):
         try:
-            d = json.loads(self.otp_response)
+            d = self.otp_json()
             self.assertGreaterEqual(d['count'], 1, msg="{0} returned no geocode results".format(self.url))
         except:
             logging.debug(self.otp_response)
@@ -445,7 +737,7 @@ class USFGeocoder(OTPTest):
         if not self.check_param('address'): self.skipTest('suppress')
 
         try:
-            d = json.loads(self.otp_response)
+            d = self.otp_json()
         except Exception as ex:
             logging.debug("\n\n%s = %s\n\n" % (str(ex), self.otp_response))
             self.fail("No JSON object returned - %s" % self.url)
@@ -459,7 +751,7 @@ class USFGeocoder(OTPTest):
 
     def test_no_error(self):
         try:
-            d = json.loads(self.otp_response)
+            d = self.otp_json()
             self.assertEqual(d['error'], None, msg="{0} returned an error {1}".format(self.url, d['error']))
         except:
             logging.debug(self.otp_response)
@@ -472,7 +764,7 @@ class USFGeocoder(OTPTest):
 
         try:
             loc = urllib2.unquote(self.param['location']).split(',')
-            d = json.loads(self.otp_response)
+            d = self.otp_json()
             for res in d['results']:
                 # only check my exact address in case another was returned also
                 if res['description'] <> self.param['address']: continue
@@ -491,6 +783,8 @@ class USFGeocoder(OTPTest):
 class USFGraphMetaData(OTPTest):
     """ Checks /otp/routers/default/metadata """
 
+    dependency_params = ['otp_url', 'modes', 'coords']
+
     def __init__(self, methodName='runTest', param=None):
         self.param = param
         self.url = "routers/default/metadata"
@@ -499,14 +793,13 @@ class USFGraphMetaData(OTPTest):
             setattr(self, 'test_result_too_small',
                     unittest.case.expectedFailure(self.test_result_too_small))  # because serverInfo is a small result
 
-    def run(self, result=None):
+    def prepare(self):
         self.setResponse("json")
-        super(USFGraphMetaData, self).run(result)
 
     def test_transit_modes(self):
         if not self.check_param('modes'): self.skipTest('suppress')
 
-        d = json.loads(self.otp_response)
+        d = self.otp_json()
         self.assertTrue(self.param['modes'] in d['transitModes'], msg="Transit mode not found in metadata")
 
     def test_bounds(self):
@@ -521,7 +814,7 @@ class USFGraphMetaData(OTPTest):
         high[1] = float(self.param['coords'][1]) * (1 + error)
         low[1] = float(self.param['coords'][1]) * (1 - error)
 
-        d = json.loads(self.otp_response)
+        d = self.otp_json()
         t = (row['lowerLeftLatitude'] >= low[0] and row['upperRightLatitude'] <= high[0])
         t = t and (row['lowerLeftLongitude'] >= low[1] and row['upperRightLongitude'] <= high[1])
 
@@ -531,6 +824,8 @@ class USFGraphMetaData(OTPTest):
 class USFRouters(OTPTest):
     """ Checks /otp/routers/default """
 
+    dependency_params = ['otp_url']
+
     def __init__(self, methodName='runTest', param=None):
         self.param = param
         self.url = "routers/default"
@@ -538,12 +833,11 @@ class USFRouters(OTPTest):
         if methodName == 'test_result_too_small':
             setattr(self, 'test_result_too_small', unittest.case.expectedFailure(self.test_result_too_small))
 
-    def run(self, result=None):
+    def prepare(self):
         self.setResponse("json")
-        super(USFRouters, self).run(result)
 
     def test_not_empty(self):
-        d = json.loads(self.otp_response)
+        d = self.otp_json()
         self.assertNotEqual(len(d['polygon']), 0, msg="Graph polygon returned was empty")
 
 
@@ -572,6 +866,9 @@ class USFPlanner(OTPTest):
         if 'fromPlace' not in self.param or 'toPlace' not in self.param: self.fail(
             msg="{0} missing to or from coordinates".format(self.url))
 
+        super(USFPlanner, self).run(result)
+
+    def prepare(self):
         if 'date' not in self.param or len(self.param['date']) <= 0:
             svc = self.param['service'] if 'service' in self.param else None
             if svc == 'Saturday':
@@ -579,14 +876,25 @@ class USFPlanner(OTPTest):
             elif svc == 'Sunday':
                 self.param['date'] = self.url_service_next_sunday()
             else:
-                self.param['date'] = datetime.datetime.now().strftime("%Y-%m-%d")
+                self.param['date'] = today().strftime("%Y-%m-%d")
 
         self.url += self.url_params(self.param)
 
-        super(USFPlanner, self).run(result)
+    def planner_response(self):
+        """ planner_model.PlannerResponse for self.otp_response, parsed once per response """
+        return parsed('planner', self.url, self.otp_response, lambda body: planner_model.parse(body, self.type))
+
+    def response_metrics(self):
+        """ itinerary count and shortest itinerary duration and distance, kept in the run history """
+        itineraries = self.planner_response().itineraries
+        durations = [float(it.duration) for it in itineraries if it.duration is not None]
+
+        return {'itineraries': len(itineraries),
+                'duration': min(durations) if len(durations) > 0 else None,
+                'distance': min(it.distance for it in itineraries) if len(itineraries) > 0 else None}
 
     def url_service_next_saturday(self):
-        date = datetime.datetime.now()
+        date = today()
         day = date.weekday()
         if day == 6:
             date = date + datetime.timedelta(days=6)
@@ -596,7 +904,7 @@ class USFPlanner(OTPTest):
         return date
 
     def url_service_next_sunday(self):
-        date = datetime.datetime.now()
+        date = today()
         day = date.weekday()
         date = date + datetime.timedelta(days=6 - day)
         date = date.strftime("%Y-%m-%d")
@@ -631,7 +939,8 @@ class USFPlanner(OTPTest):
     def test_trip_duration(self):
         if not self.check_param('duration'): self.skipTest('suppress')
 
-        durations = re.findall('<itinerary>.*?<duration>(.*?)</duration>.*?</itinerary>', self.otp_response)
+        durations = [it.duration for it in self.planner_response().itineraries]
+        self.assertNotIn(None, durations, msg="An itinerary has no duration.")
         error = 0.2
         high = float(self.param['duration']) * (1 + error)
         low = float(self.param['duration']) * (1 - error)
@@ -647,27 +956,27 @@ class USFPlanner(OTPTest):
     def test_trip_distance(self):
         if not self.check_param('distance'): self.skipTest('suppress')
 
-        distances = re.findall('<itinerary>.*?<distance>(.*?)</distance>.*?</itinerary>', self.otp_response)
+        distances = [it.distance for it in self.planner_response().itineraries]
         error = 0.2
         high = float(self.param['distance']) * (1 + error)
         low = float(self.param['distance']) * (1 - error)
         for distance in distances:
-            t = int(distance) < low or int(distance) > high
+            t = distance < low or distance > high
             self.assertFalse(t, msg="An itinerary distance was different than expected by more than {0}%.".format(
                 error * 100))
 
     def test_trip_num_legs(self):
         if not self.check_param('num_legs'): self.skipTest('suppress')
 
-        legs = self.param['num_legs'].split("|")
+        # OTPTest.__init__ url-quotes string params, min|max arrives as min%7Cmax
+        legs = urllib2.unquote(self.param['num_legs']).split("|")
         if len(legs) <> 2: raise ValueError("num_legs must be in min|max format")
         values = [int(i) for i in legs]
 
         min_legs = values[0]
         max_legs = values[1]
-        all_legs = re.findall('<itinerary>.*?<legs>(.*?)</legs>.*?</itinerary>', self.otp_response)
-        for legs in all_legs:
-            num_legs = len(re.findall('<leg .*?>', legs))
+        for it in self.planner_response().itineraries:
+            num_legs = len(it.legs)
             t = num_legs > max_legs or num_legs < min_legs
             self.assertFalse(t,
                              msg="An itinerary returned was not between {0} and {1} legs.".format(min_legs, max_legs))
@@ -677,7 +986,7 @@ class USFPlanner(OTPTest):
 
         if not self.check_param('invalid_modes'): self.skipTest('suppress')
 
-        all_modes = re.findall('<leg mode="(.*?)" route', self.otp_response)
+        all_modes = self.planner_response().modes
         bad = list(set(all_modes) & set(self.param['invalid_modes']))  # intersection
 
         self.assertEqual(len(bad), 0, msg="Invalid modes ({0}) found in itinerary.".format(', '.join(bad)))
@@ -691,7 +1000,7 @@ class USFPlanner(OTPTest):
         else:
             l = self.param['mode_exists']
 
-        all_modes = re.findall('<leg mode="(.*?)" route', self.otp_response)
+        all_modes = self.planner_response().modes
         bad = list(set(all_modes) & set(l))  # intersection
 
         self.assertNotEqual(len(bad), 0, msg="Mode ({0}) NOT found in ({1}) itinerary.".format(self.param['mode'],
@@ -700,9 +1009,9 @@ class USFPlanner(OTPTest):
     def test_no_errors(self):
         """ Ensure no errors were returned """
 
-        regres = re.findall("<error><id>(.*)</id>", self.otp_response)
+        regres = self.planner_response().errors
         if len(regres) > 0:
-            errnum = regres[0]
+            errnum = regres[0][0]
         else:
             errnum = ''
 
@@ -716,7 +1025,7 @@ class USFPlanner(OTPTest):
         if not isinstance(self.param['use_bus_route'], list): self.param['use_bus_route'] = list(
             self.param['use_bus_route'])
 
-        all_modes = re.findall('<leg mode="BUS" route="(.*?)"', self.otp_response)
+        all_modes = self.planner_response().routes('BUS')
         found = list(set(all_modes) & set(self.param['use_bus_route']))
 
         self.assertGreater(len(found), 0,
@@ -730,7 +1039,7 @@ class USFPlanner(OTPTest):
 
         if not self.check_param('max_legs'): self.skipTest('suppress')
 
-        all_modes = re.findall('<leg mode="(.*)" route', self.otp_response)
+        all_modes = self.planner_response().modes
 
         # sum each mode and check against max_legs
         for m in all_modes:
@@ -745,15 +1054,12 @@ class USFPlanner(OTPTest):
         if not self.check_param('arrive_time'): self.skipTest('suppress')
         if self.param['arriveBy'] == "false": self.skipTest("did not request arrival time")
 
-        all_times = re.findall('<endTime>(.*)<\/endTime>', self.otp_response)
-
-        import time
+        all_times = [it.end_time for it in self.planner_response().itineraries]
 
         dt = time.strptime(self.param['arrive_time'], "%H:%M:%S")
 
         for m in all_times:
-            mt = time.strptime(m[:-6], "%Y-%m-%dT%H:%M:%S")  # XXX timezone
-            t = (mt["tm_hour"] == dt["tm_hour"]) and (mt["tm_min"] == dt["tm_min"]) and (mt["tm_sec"] == dt["tm_sec"])
+            t = planner_model.clock(m) == (dt.tm_hour, dt.tm_min, dt.tm_sec)
             self.assertTrue(t, msg="{0} did not arrive at specified time: {1} != {2}".format(self.url,
                                                                                              self.param['arrive_time'],
                                                                                              m))
@@ -764,15 +1070,12 @@ class USFPlanner(OTPTest):
         if not self.check_param('depart_time'): self.skipTest('suppress')
         if self.param['arriveBy'] <> "false": self.skipTest("did not request departure time")
 
-        all_times = re.findall('<startTime>(.*)<\/startTime>', self.otp_response)
-
-        import time
+        all_times = [it.start_time for it in self.planner_response().itineraries]
 
         dt = time.strptime(self.param['depart_time'], "%H:%M:%S")
 
         for m in all_times:
-            mt = time.strptime(m[:-6], "%Y-%m-%dT%H:%M:%S")  # XXX timezone
-            t = (mt["tm_hour"] == dt["tm_hour"]) and (mt["tm_min"] == dt["tm_min"]) and (mt["tm_sec"] == dt["tm_sec"])
+            t = planner_model.clock(m) == (dt.tm_hour, dt.tm_min, dt.tm_sec)
             self.assertTrue(t, msg="{0} did not start at specified time: {1} != {2}".format(self.url,
                                                                                             self.param['depart_time'],
                                                                                             m))
@@ -782,12 +1085,12 @@ class USFPlanner(OTPTest):
 
         if not self.check_param('max_walk'): self.skipTest('suppress')
 
-        all_walk = re.findall('<walkDistance>(.*?)<\/walkDistance>', self.otp_response)
+        all_walk = [it.walk_distance for it in self.planner_response().itineraries if it.walk_distance is not None]
 
         t = False
         w = 0
         for m in all_walk:
-            if m < self.param['max_walk']: t = True
+            if m < float(self.param['max_walk']): t = True
             if w < m: w = m
 
         self.assertTrue(t, msg="{0} exceeded max_walk distance: {1} < {2}".format(self.url, self.param['max_walk'], w))
@@ -803,21 +1106,22 @@ class USFPlanner(OTPTest):
 class USFBikeRental(OTPTest):
     """ Perform various tests on bike_rental API """
 
+    dependency_params = ['otp_url', 'station_coordinates']
+
     def __init__(self, methodName='runTest', param=None):
         self.url = "routers/default/bike_rental?"
         self.param = param
         super(USFBikeRental, self).__init__(methodName, param)
 
-    def run(self, result=None):
+    def prepare(self):
         self.setResponse("json")
-        super(USFBikeRental, self).run(result)
 
     def test_not_empty(self):
-        d = json.loads(self.otp_response)
+        d = self.otp_json()
         self.assertGreater(len(d["stations"]), 0, msg="{0} - stations is empty".format(self.url))
 
     def test_bikes_available(self):
-        d = json.loads(self.otp_response)
+        d = self.otp_json()
         for row in d["stations"]:
             self.assertGreater(row['bikesAvailable'], 0, msg="{0} - has no bikes available".format(row['name']))
             break  # at least one has to pass XXX
@@ -832,7 +1136,7 @@ class USFBikeRental(OTPTest):
         high[1] = float(self.param['station_coordinates'][1]) * (1 + error)
         low[1] = float(self.param['station_coordinates'][1]) * (1 - error)
 
-        d = json.loads(self.otp_response)
+        d = self.otp_json()
         for row in d["stations"]:
             t = (row['lat'] >= low[0] and row['lat'] <= high[0])
             t = t and (row['lng'] >= low[1] and row['lng'] <= high[1])
@@ -842,22 +1146,35 @@ class USFBikeRental(OTPTest):
 # XXX abstract local csv loading into class too
 
 def add_test_row(path, cls, params):
+	add_test_rows(path, cls, [params])
+
+def add_test_rows(path, cls, rows):
+	"""
+	Adds rows (dicts of params) to the first CSV of cls in one write, returns the number added
+
+	The rows are appended when the CSV header already has all their columns, otherwise
+	the file is rewritten once with the new columns added to the header.
+	"""
+
 	p = "%s%s/*.csv" % (path, cls.__name__)
 	import glob
 	files = glob.glob(p)
 	if len(files) <= 0: 
 		print "No files found to add to."
-		return
+		return 0
 
 	file = files[0]
-	if os.path.exists(file):
-		# read current csv lines
-		fp = open(file, 'r')
-            	reader = csv.DictReader(fp)
-            	fn = reader.fieldnames
-		data = []
-		for row in reader: data.append(row)
+	if not os.path.exists(file):
+		print "No local CSV found for class '%s'" % cls
+		return 0
+
+	# read the current header
+	fp = open(file, 'r')
+	reader = csv.DictReader(fp)
+	fn = list(reader.fieldnames or [])
+	cols = len(fn)
 
+	for params in rows:
 		for col in params.keys():
 			# add column to header
 			if col not in fn: fn.append(col)
@@ -865,18 +1182,360 @@ def add_test_row(path, cls, params):
 			val = params[col]
 			if type(val) == list: val = val[0]
 			params[col] = str(val)
-			
-		data.append(params)
 
-		fp = open(file, "w+")
-		w = csv.DictWriter(fp, fieldnames=fn)
-		w.writeheader()
-		for row in data:
-			for col in fn:
-				if col not in row: row[col] = ""
-			w.writerow(row)
+	if len(fn) == cols:
+		# header unchanged, append after the last line
+		fp.seek(0, os.SEEK_END)
+		newline = fp.tell() > 0
+		if newline:
+			fp.seek(-1, os.SEEK_END)
+			newline = fp.read(1) not in ("\n", "\r")
+		fp.close()
+
+		fp = open(file, "a")
+		if newline: fp.write("\r\n")
+		data = rows
 	else:
-		print "No local CSV found for class '%s'" % cls
+		# rewrite with the new columns
+		data = [row for row in reader] + list(rows)
+		fp.close()
+
+		fp = open(file, "w+")
+
+	w = csv.DictWriter(fp, fieldnames=fn, restval="")
+	if len(fn) != cols: w.writeheader()
+	w.writerows(data)
+	fp.close()
+
+	return len(rows)
+
+def line_request(cls, param):
+    """ (url, accept type) a CSV line of cls will fetch, None for classes that don't call a server """
+
+    if not hasattr(cls, 'request'): return None
+
+    # every test method of a line asks for the same url, the first one is enough
+    names = unittest.TestLoader().getTestCaseNames(cls)
+    if len(names) == 0: return None
+
+    return cls(methodName=names[0], param=copy.copy(param)).request()
+
+
+def stress_requests(lines):
+    """ stress.StressRun requests for the USFPlanner lines among the given (suite, csv line number, params) """
+
+    requests = []
+    for s, i, row in lines:
+        if not issubclass(s['cls'], USFPlanner): continue
+        req = line_request(s['cls'], row)
+        requests.append({'suite': s['file'], 'line': i, 'url': req[0], 'type': req[1]})
+
+    return requests
+
+
+def prefetch(lines, concurrency=8):
+    """
+    Fetch every distinct request the given (suite, csv line number, params) lines will make,
+    'concurrency' at a time, so the test methods only run their checks against the response cache.
+    Requests are distinct by response_cache.canonical_url(), identical trips from different
+    suites or CSV files are fetched once.
+    """
+
+    requests = []
+    seen = set()
+    duplicates = 0
+    for s, i, row in lines:
+        if not _dependencies.passed(s['cls'], row): continue
+
+        req = line_request(s['cls'], row)
+        if req is None: continue
+
+        key = response_cache.canonical_url(req[0])
+        if key in seen:
+            duplicates += 1
+            continue
+
+        seen.add(key)
+        requests.append(req + (s['cls'].__name__,))
+
+    def fetch_one(req):
+        try:
+            fetch(req[0], req[1], req[2])
+        except Exception as ex:
+            # cached in _failures, the test methods report it without calling the server again
+            logging.info("prefetch: %s failed - %s" % (req[0], str(ex)))
+
+    start = time.time()
+    for r in workers.imap(fetch_one, requests, concurrency): pass
+
+    logging.info("prefetch: %d urls (%d duplicates) in %.2f seconds" % (len(requests), duplicates,
+                                                                        time.time() - start))
+
+    return len(requests)
+
+
+# RUN CSV LINES - load row -> build suite -> run -> compact result record -> report
+
+def load_lines(test_suites, params, defaults, skip_class, only_class=False):
+    """
+    Yields (suite, csv line number, params) for every CSV line that should run
+
+    params (from the command-line) override the CSV values unless they are still the defaults.
+    """
+
+    for s in test_suites:
+        i = 0
+        for row in s['data']:
+            i += 1
+
+            # Skip test class if user chose to
+            if s['name'].lower() in skip_class: continue
+
+            # If user specified ONLY classes, skip anything not provided
+            if only_class is not False and s['name'].lower() not in only_class:
+                skip_class.append(s['name'].lower())
+                continue
+
+            row = dict(row)
+
+            # Override CSV parameters with cmd-line (unless they are defaults), and perform other initialization
+            for k in params:
+                if k in row and not params[k] == defaults.get(k):
+                    row[k] = params[k]  # XXX ENVVAR will now be 'default' and not override csv ...
+                elif k not in row:
+                    row[k] = params[k]
+
+            # Convert strings into python literals where applicable (lists)
+            for k in row:
+                if isinstance(row[k], str) and len(row[k]) > 0 and row[k][0] == '[': row[k] = ast.literal_eval(row[k])
+
+            yield s, i, row
+
+
+def run_line(s, i, row, debug=False):
+    """ build and run the TestSuite for one CSV line, returns its compact result record """
+
+    suite = USFTestSuite()
+    result = TestResultSuccess()
+
+    # s.addTests( OTPVersion.add_with_param(OTPVersion, {'major':1, 'minor':0}) )
+    suite.addTests(s['cls'].add_with_param(s['cls'], row))
+
+    start = time.time()
+    suite.run(result)
+
+    return line_record(s, i, row, suite, result, time.time() - start, debug)
+
+
+# PROCESS POOL - responses are fetched by threads in the main process, the CPU-bound checks
+# of each line run in worker processes (--processes), see process_pool
+
+def line_item(s, i, row, debug=False):
+    """
+    Compact, picklable work item for one CSV line
+
+    The line's response is fetched here (through the caches) and sent along, unless the
+    worker can read it from the response store itself.  A failed fetch sends its
+    negative cache entry instead, and the outcomes of the line's prerequisites are sent
+    too, so workers never call the servers or run prerequisites again.
+    """
+
+    passed = _dependencies.passed(s['cls'], row)
+
+    item = {'file': s['file'], 'name': s['name'], 'cls': s['cls'].__name__, 'line': i, 'row': row,
+            'debug': debug, 'url': None, 'type': None, 'body': None, 'error': None,
+            'dependencies': [(node[0], _dependencies.outcomes.get(node[0])) for node in
+                             _dependencies.nodes(s['cls'], row)]}
+
+    if not passed: return item
+
+    req = line_request(s['cls'], row)
+    if req is None: return item
+
+    item['url'], item['type'] = req
+    try:
+        body = fetch(req[0], req[1], s['cls'].__name__)[0]
+        if _store_mode not in ('replay', 'cache'): item['body'] = body
+    except Exception as ex:
+        logging.info("%s:%d - %s failed - %s" % (s['file'], i, req[0], str(ex)))
+        item['error'] = response_cache.NegativeCache.entry(ex)
+
+    return item
+
+
+def run_lines_in_processes(lines, processes, fetchers=8, debug=False):
+    """
+    records of the (suite, line number, params, reused record or None) lines in order, the
+    lines without a reused record are validated on a process pool
+    """
+
+    # the pool runs ahead of the ordered output by at most its window, tee buffers no more than that
+    ordered, todo = itertools.tee(lines)
+    pending = ((s, i, row) for s, i, row, rec in todo if rec is None)
+
+    # fork before any fetch thread is started.  The workers' failures never expire: they
+    # only hold the parent's failed fetches, which must not be retried in the worker even
+    # with --failure-ttl 0
+    results = workers.process_imap(process_pool.process_line,
+                                   workers.imap(lambda line: line_item(line[0], line[1], line[2], debug),
+                                                pending, fetchers), processes,
+                                   initializer=process_pool.init,
+                                   initargs=(_store.path if _store is not None else None, _store_mode,
+                                             _store.ttl if _store is not None else None, 16 * 1024 * 1024,
+                                             (_breaker.threshold, _breaker.cooldown, _timeouts.cap,
+                                              _timeouts.multiplier),
+                                             (None, _retries, _retry_backoff)))
+
+    for s, i, row, rec in ordered:
+        if rec is None:
+            rec, fetches = results.next()
+            _fetch_stats.replay(fetches)
+        yield rec
+
+
+def line_record(s, i, row, suite, result, elapsed=0, debug=False):
+    """
+    Compact, JSON-serializable summary of a finished CSV line
+
+    Only this record outlives the line, the TestSuite, TestCases and responses can be dropped.
+    """
+
+    rec = {'file': s['file'], 'name': s['name'], 'line': i, 'param': row, 'run': result.testsRun,
+           'time': elapsed, 'url': None, 'response_time': None, 'test_param': None, 'metrics': None, 'tests': []}
+
+    rec['desc'] = "%d (%s)" % (i, row['description']) if 'description' in row else "%d" % i
+
+    # shouldStop, testsRun, unexpectedSuccesses
+    for status in ['errors', 'failures', 'skipped', 'expectedFailures']:
+        for test in getattr(result, status):
+            # tuple - test class, traceback
+
+            name = test[0].id().split('.')[-1]  # get the test name from the full python path (__file__.class.methodName)
+            # get the data to output - either the full traceback, or the last line (assertionerror)
+            if not debug:
+                output = test[1].strip().split('\n')[-1]
+            else:
+                output = test[1]
+
+            rec['tests'].append({'name': name, 'status': status, 'output': output,
+                                 'time': result.times.get(test[0], 0)})
+
+    for t in suite:
+        if rec['test_param'] is None: rec['test_param'] = t.param
+        if rec['url'] is None and hasattr(t, 'url'): rec['url'] = t.url
+
+        if rec['metrics'] is None and hasattr(t, 'response_metrics') and getattr(t, 'otp_response', None):
+            try:
+                rec['metrics'] = t.response_metrics()
+            except Exception as ex:
+                logging.debug("%s line %d - no response metrics: %s" % (s['file'], i, str(ex)))
+
+        rec['tests'].append({'name': t.methodName, 'status': 'pass' if t.success else 'run', 'output': None,
+                             'time': result.times.get(t, 0)})
+
+    return rec
+
+
+class Report(object):
+    """
+    Accumulates line records into the report_data (per CSV file) and data (per test class)
+    dicts the Mako templates render
+    """
+
+    def __init__(self):
+        self.report_data = {}
+        self.data = {}
+        self.failures = 0
+
+    def add(self, rec):
+        # only lines that actually had tests to run are reported
+        if rec['run'] == 0: return
+
+        if rec['file'] not in self.report_data:
+            self.report_data[rec['file']] = {'run': 0, 'total': 0, 'skipped': {}, 'failures': {}, 'errors': {},
+                                             'pass': {}, 'param': {}, 'tests': set()}
+        if rec['name'] not in self.data:
+            self.data[rec['name']] = {'suite': {'file': rec['file'], 'name': rec['name']}, 'tests': [],
+                                      'stats': {'run': 0, 'total': 0, 'skipped': 0, 'failures': 0, 'errors': 0,
+                                                'pass': 0}}
+
+        rd = self.report_data[rec['file']]
+        row = self.data[rec['name']]
+
+        row['stats']['run'] += rec['run']
+        rd['total'] += rec['run']
+        rd['run'] += rec['run']
+
+        for t in rec['tests']:
+            if t['status'] == 'run':
+                # every test of the line, passing or not - build distinct set of tests run for template
+                rd['tests'].add(t['name'])
+                continue
+
+            if t['status'] == 'pass':
+                rd['tests'].add(t['name'])
+                rd['pass']["%s:%s" % (rec['line'], t['name'])] = {"param": rec['test_param']}
+                output = {'param': rec['test_param']}
+                # XXX abstract this to the test class so e.g USFPlanner can output a link to view itinerary
+            else:
+                output = t['output']
+                if t['status'] in rd and type(rd[t['status']]) == dict:
+                    rd[t['status']]["%s:%s" % (rec['desc'], t['name'])] = output
+
+            row['tests'].append({'name': t['name'], 'output': output, 'status': t['status'],
+                                 'line_number': rec['line']})
+
+        rd['param'] = rec['param']
+
+    def summary(self):
+        """
+        JSON-serializable pass/fail counts per CSV file and per test class, with the
+        test_suites (report_data) and data dicts the templates render
+        """
+        files = {}
+        for f, rd in self.report_data.items():
+            files[f] = {'run': rd['run'], 'pass': len(rd['pass']), 'failures': len(rd['failures']),
+                        'errors': len(rd['errors']), 'skipped': len(rd['skipped']), 'tests': sorted(rd['tests'])}
+
+        classes = {}
+        for name, row in self.data.items():
+            classes[name] = {'run': row['stats']['run'], 'pass': 0, 'failures': 0, 'errors': 0, 'skipped': 0,
+                             'expectedFailures': 0}
+            for t in row['tests']:
+                classes[name][t['status']] += 1
+
+        test_suites = dict((f, dict(rd, tests=sorted(rd['tests']))) for f, rd in self.report_data.items())
+
+        return {'files': files, 'classes': classes, 'test_suites': test_suites, 'data': self.data}
+
+    def render(self, template_path, **kwargs):
+        """ render the report template, or mako's error page if the template fails """
+        from mako.lookup import TemplateLookup
+        from mako import exceptions
+
+        # templates include their shared parts (e.g. response_times.html) from their own directory
+        lookup = TemplateLookup(directories=[os.path.dirname(os.path.abspath(template_path))])
+        report_template = lookup.get_template(os.path.basename(template_path))
+        kwargs.setdefault('fetch_stats', None)
+        kwargs.setdefault('unavailable', None)
+
+        try:
+            r = report_template.render(data=self.data, test_suites=self.report_data,
+                                       all_passed=True if self.failures <= 0 else False, **kwargs)
+        except:
+            r = exceptions.html_error_template().render()
+
+        # records read back from the results file hold unicode strings
+        return r.encode('utf-8') if isinstance(r, unicode) else r
+
+
+def print_regressions(history, baseline, run, threshold):
+    regressions = history.compare(baseline, run, threshold)
+
+    print "Run %d against run %d: %d regressions (threshold %d%%)" % (run, baseline, len(regressions), threshold * 100)
+    for r in regressions:
+        print "  %s" % r
+
 
 # DISCOVER/LOAD PARAMS FROM CSV, spawn a new suite and generate a new report
 def find_tests(path, tests):
@@ -908,14 +1567,31 @@ def find_test_class(cls):
     return None
 
 
-from oauth2client.file import Storage
-from oauth2client.client import flow_from_clientsecrets
-from oauth2client.tools import run_flow, argparser
-import httplib2
-
 class csv_remote(object):
 
-	def __init__(self, args="", parser=None):
+	def __init__(self, args="", parser=None, client=None, token=None, cache_path=None, concurrency=4):
+		"""
+		client and token default to a gdata SpreadsheetsClient and the OAuth2 token from creds.dat,
+		pass both to load from something else (see sheets.SheetLoader).  cache_path is a
+		sheets.SheetCache database, None disables the cache
+		"""
+
+		self.sheets = {}
+		self.cache = sheets.SheetCache(cache_path) if cache_path else None
+		self.concurrency = concurrency
+
+		if client is not None:
+			self.g = client
+			self.token = token
+			return
+
+		# only remote runs need the Google API and OAuth libraries, local runs don't pay for importing them
+		import httplib2
+		import gdata.gauth
+		import gdata.spreadsheets.client
+		from oauth2client.file import Storage
+		from oauth2client.client import flow_from_clientsecrets
+		from oauth2client.tools import run_flow, argparser
 
 		# parse out our cmd-line params
 		parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -934,84 +1610,60 @@ class csv_remote(object):
 			print "Refreshed"
 
 		self.token = gdata.gauth.OAuth2TokenFromCredentials(credentials)
-		self.gclient = gdata.spreadsheets.client
-		self.g = self.gclient.SpreadsheetsClient()
+		self.g = gdata.spreadsheets.client.SpreadsheetsClient()
 
 	def load_by_url(self, url):
 		"Returns a list of suites from the specified spreadsheet URL."
 
-		sheets = self.g.get_worksheets(url, auth_token=self.token)
-		cnt = 0
-		data = []
-		self.sheets = {}
-		for sheet in enumerate(sheets.entry):
-			id = sheet[1].get_worksheet_id()
-
-			logging.info("Sheet %s (%s)" % (sheet[1].title.text, id))
-
-			cls = find_test_class(sheet[1].title.text)
-			if cls is None: continue
-
-			self.sheets[sheet[1].title.text] = id
-			tmp = {"worksheet_id":id, "data": [], 'cls': cls, 'file': sheet[1].title.text, 'name': sheet[1].title.text}
-			cnt = cnt + 1
-
-			w = self.g.get_worksheet(url, id, auth_token=self.token)
-			if w.row_count.text <= 0 or w.col_count.text <= 0: continue
-
-			# have to get column names via get_cells because the listfeed auto-changes names
-			fn = []
-			col = []
-		        feed = self.g.get_cells(url, id, auth_token=self.token)
-		        for row in enumerate(feed.entry):
-	        		if row[1].cell.text == "-": row[1].cell.text = ""  # workaround for get_cells() skipping blank cells
-			        if row[1].cell.row == "1":
-				        fn.append(row[1].cell.text)
-		        	else:
-	        	        	col.append(row[1].cell.text)
-	
-			        if len(col) == len(fn):
-					line = dict(zip(fn, col))
-        			        tmp["data"].append(line)
-                			col = []
-
-		        data.append(tmp)
+		loader = sheets.SheetLoader(self.g, self.token, self.concurrency, self.cache)
+		data, self.sheets = loader.load(url, find_test_class)
 
-		print "%d sheets loaded" % cnt
+		print "%d sheets loaded (%d unchanged)" % (len(data), loader.cached)
 
 		return data
 
 	def append_row(self, url, sheet_id, params):
+		self.append_rows(url, sheet_id, [params])
+
+	def append_rows(self, url, sheet_id, rows):
+		"""
+		Adds rows (dicts of params) below the last used row of a worksheet with one batched cells update
 
-		if 'description' not in params: params['description'] = "ADDED BY TEST_RUNNER"
+		The cells feed of every column is read to find the header row and the last row used by
+		any column, the worksheet grows first if the new rows don't fit.  Params without a header
+		column are dropped.
+		"""
 
-		cell_query = gdata.spreadsheets.client.CellQuery( return_empty=False )
-		cells = self.g.GetCells(url, sheet_id, q=cell_query, auth_token=self.token) #, converter=None, desired_class=None)
-		row_id = 1
-		# add new cells for each in header row
-		headers = []
-		ent = cells.entry[0].cell
-		for c in cells.entry:
-			c = c.cell
-			if c.row > row_id: row_id = int(c.row)
-			if int(c.row) == 1: 
-				headers.append( c.input_value )
+		if len(rows) == 0: return 0
 
-		# add a new row
+		import gdata.spreadsheets.data
 
-		entry = gdata.spreadsheets.data.ListEntry()
-		for col in xrange(0, len(headers)):
-			
-			if headers[col] in params: val = params[headers[col]]
-			else: val = "-"
+		# a planner row can leave any column blank (USFPlanner rows mostly start empty), so the
+		# last row is the highest one with a cell in any column
+		cells = self.g.get_cells(url, sheet_id, auth_token=self.token).entry
+		headers = dict((int(c.cell.col), c.cell.input_value) for c in cells if int(c.cell.row) == 1)
+		last = max([int(c.cell.row) for c in cells] + [1])
 
-			if type(val) == list and len(val) == 1: val = val[0]
+		w = self.g.get_worksheet(url, sheet_id, auth_token=self.token)
+		if int(w.row_count.text) < last + len(rows):
+			w.row_count.text = str(last + len(rows))
+			self.g.update(w, auth_token=self.token)
 
-			name = headers[col].lower().replace('_', '').replace(' ', '')
-			entry.set_value(name, str(val))
+		batch = gdata.spreadsheets.data.BuildBatchCellsUpdate(url, sheet_id)
+		for n, params in enumerate(rows):
+			if 'description' not in params: params['description'] = "ADDED BY TEST_RUNNER"
 
-		#print str(entry)
-		self.g.add_list_entry(entry, url, sheet_id, auth_token=self.token)
+			for col in sorted(headers):
+				if headers[col] in params: val = params[headers[col]]
+				else: val = "-"  # get_cells() skips blank cells
+
+				if type(val) == list and len(val) == 1: val = val[0]
+
+				batch.add_set_cell(last + n + 1, col, str(val))
+
+		self.g.batch(batch, force=True, auth_token=self.token)
+
+		return len(rows)
 
 
 # MAIN CODE
@@ -1026,16 +1678,93 @@ if __name__ == "__main__":
                         help="Enable fetching CSV parameters remotely from Google Spreadsheet (requires client_secrets.json)")
     parser.add_argument('-U', '--url', help="URL/Key to Google Spreadsheet with suite parameters (implies -R)")
 
+    parser.add_argument('--sheet-cache',
+                        help="Path to the cache of remote sheet contents, reused while a sheet is unchanged "
+                             "(default ./sheets.db, empty to disable)")
+
     parser.add_argument('-t', '--template-path', help="Path to test suite template(s)")
     parser.add_argument('-c', '--csv-path', help="Path to test suite CSV file(s)")
 
     parser.add_argument('-r', '--report-path', help="Path to write test suite report(s)")
+    parser.add_argument('--results-path',
+                        help="Path to append each line's results to as JSONL (default: report path with .jsonl)")
+    parser.add_argument('--junit-path', help="Also write the results as JUnit XML to this path")
+    parser.add_argument('--json-path', help="Also write the results in the compact JSON format to this path")
+    parser.add_argument('--timing-path',
+                        help="Path to write fetch timings as JSON (default: report path with _timing.json)")
+    parser.add_argument('--manifest-path',
+                        help="Path of the run manifest (default: report path with _manifest.json)")
+
+    parser.add_argument('--changed-only', action='store_true',
+                        help="Only run lines whose params or OTP server/graph changed since the manifest was written")
+    parser.add_argument('--failed-only', action='store_true',
+                        help="Only run lines that failed, errored or were not run in the manifest's last run")
     # parser.add_argument('-b', '--base-dir', help="Base directory for file operations")
 
+    parser.add_argument('--history-db',
+                        help="Keep a history of runs in this database (default: no history)")
+    parser.add_argument('--compare', metavar='BASELINE[,RUN]',
+                        help="Flag regressions of this run against a stored run id or 'previous'; with a second id "
+                             "compare two stored runs (or 'previous' and the run before it) without testing")
+    parser.add_argument('--regression-threshold', type=float,
+                        help="Relative change flagged as a regression by --compare (default 0.2)")
+    parser.add_argument('--list-runs', action='store_true', help="List the runs in --history-db and quit")
+
+    parser.add_argument('--shard', metavar='K/N',
+                        help="Only run the CSV lines of shard K of N (lines are split by a stable hash)")
+    parser.add_argument('--merge', nargs='+', metavar='RESULTS',
+                        help="Merge the JSONL results files of several shards into one report and quit")
+
     parser.add_argument('--date', help="Set date for service tests")
 
-    # XXX maybe disable cache for call_otp?
-    # parser.add_argument('-s', '--stress', action='store_true', help="Enable stress testing mode (XXX)")
+    parser.add_argument('-s', '--stress', action='store_true',
+                        help="Load test the planner with the USFPlanner CSV lines (caches disabled) instead of testing")
+    parser.add_argument('--stress-concurrency', type=int, help="Concurrent requests in stress mode (default 4)")
+    parser.add_argument('--stress-iterations', type=int, help="Times each line is requested in stress mode (default 1)")
+    parser.add_argument('--stress-duration', type=float,
+                        help="Keep replaying lines for this many seconds in stress mode (overrides iterations)")
+
+    parser.add_argument('-w', '--workers', type=int,
+                        help="Number of CSV lines to run concurrently (default 1)")
+
+    parser.add_argument('--processes', type=int,
+                        help="Check the responses of CSV lines in this many worker processes; the responses are "
+                             "fetched by --prefetch-concurrency threads (default 1, no worker processes)")
+
+    parser.add_argument('-P', '--prefetch', action='store_true',
+                        help="Fetch every suite URL concurrently before running the tests")
+    parser.add_argument('--prefetch-concurrency', type=int, help="Max concurrent requests while prefetching (default 8)")
+
+    store_mode = parser.add_mutually_exclusive_group()
+    store_mode.add_argument('--record', action='store_true', help="Save every OTP/OneBusAway response to --cache-db")
+    store_mode.add_argument('--replay', action='store_true',
+                            help="Only use responses saved in --cache-db, never call the servers "
+                                 "(lines without a date plan for the recording's day)")
+    parser.add_argument('--cache-db', help="Path to the persistent response store (default ./responses.db)")
+    parser.add_argument('--cache-ttl', type=int,
+                        help="Reuse responses in --cache-db younger than this many seconds (ignored by --replay)")
+
+    parser.add_argument('--cache-mb', type=float, help="Max size of the in-memory response cache in MB (default 256)")
+    parser.add_argument('--cache-memory-ttl', type=int, help="Expire in-memory responses after this many seconds")
+    parser.add_argument('--cache-compress', action='store_true', help="zlib compress in-memory responses")
+
+    parser.add_argument('--timeout', type=float, help="Per-request HTTP timeout in seconds (default 45)")
+    parser.add_argument('--retries', type=int,
+                        help="Retry requests failing with a connection error, timeout or 5xx this many times "
+                             "(default 0)")
+    parser.add_argument('--retry-backoff', type=float,
+                        help="Seconds before the first retry, doubled for every further one (default 0.5)")
+    parser.add_argument('--failure-ttl', type=int,
+                        help="Seconds a failed request is remembered and not sent again (default 300, 0 never)")
+    parser.add_argument('--timeout-multiplier', type=float,
+                        help="Opt in to adaptive timeouts: time out requests to an endpoint after this many times "
+                             "its observed p99 latency, at most --timeout (default 0, off: always wait --timeout)")
+    parser.add_argument('--breaker-threshold', type=int,
+                        help="Stop calling a host after this many consecutive failed requests (default 5, 0 never)")
+    parser.add_argument('--breaker-cooldown', type=float,
+                        help="Seconds before a stopped host gets another request (default 60)")
+    parser.add_argument('--pool-size', type=int,
+                        help="Max keep-alive connections per host (default: number of workers, at least 4)")
 
     parser.add_argument('-d', '--debug', action='store_true', help="Enable debug mode")
     parser.add_argument('--log-level',
@@ -1048,6 +1777,9 @@ if __name__ == "__main__":
     parser.add_argument('--add', dest='add_url', help="Add URL parameters to required CSV file or remote sheet")
     parser.add_argument('--add-class', dest='add_class', help="Specify the test class that should be used")
     parser.add_argument('--add-sheet', dest='add_sheet', help="The filename of the CSV file, or the full Google Sheet URL")
+    parser.add_argument('--add-file', dest='add_file',
+                        help="Add every distinct plan URL in an OTP request log or URL list (.gz ok, - for stdin) "
+                             "to the CSV file or remote sheet of --add-class (default USFPlanner)")
 
     parser.set_defaults(
         otp_url=envvar('OTP_URL', 'http://localhost:8080/otp/'),
@@ -1057,6 +1789,23 @@ if __name__ == "__main__":
         report_path=envvar('OTP_REPORT', './report/otp_report.html'),
         url="1f_CTDgQfey5mY1eMO03D7UZ8855D-mxHsfYfsA3c4Zw",  # Google doc key to USF file
         log_level="WARNING",
+        workers=int(envvar('OTP_WORKERS', 1)),
+        processes=1,
+        timeout=45,
+        timeout_multiplier=0,
+        retries=0,
+        retry_backoff=0.5,
+        failure_ttl=300,
+        breaker_threshold=5,
+        breaker_cooldown=60,
+        prefetch_concurrency=8,
+        stress_concurrency=4,
+        stress_iterations=1,
+        cache_db=envvar('OTP_CACHE_DB', './responses.db'),
+        sheet_cache=envvar('OTP_SHEET_CACHE', './sheets.db'),
+        history_db=envvar('OTP_HISTORY_DB'),
+        regression_threshold=0.2,
+        cache_mb=256,
         skip_class=[None],
         only_class=[False])
 
@@ -1081,6 +1830,92 @@ if __name__ == "__main__":
 
     logging.basicConfig(level=lev)
 
+    # one shared keep-alive connection pool for every OTP / OneBusAway call
+    concurrency = max(args.workers, args.prefetch_concurrency if args.prefetch else 0,
+                      args.stress_concurrency if args.stress else 0, 4)
+    http_client.configure(pool_size=args.pool_size or concurrency, timeout=args.timeout)
+
+    configure_cache(int(args.cache_mb * 1024 * 1024), args.cache_memory_ttl, args.cache_compress)
+    configure_breaker(args.breaker_threshold, args.breaker_cooldown, args.timeout, args.timeout_multiplier)
+    configure_failures(args.failure_ttl, args.retries, args.retry_backoff)
+
+    if args.record:
+        open_store(args.cache_db, 'record', args.cache_ttl)
+    elif args.replay:
+        open_store(args.cache_db, 'replay')
+    elif args.cache_ttl is not None:
+        open_store(args.cache_db, 'cache', args.cache_ttl)
+
+    # RUN HISTORY - list or compare stored runs without testing
+
+    history = run_store.RunStore(args.history_db) if args.history_db else None
+
+    if (args.list_runs or args.compare is not None) and history is None:
+        parser.error("--list-runs and --compare need --history-db")
+
+    if args.list_runs:
+        for id, started, otp_url, version, count, passed in history.runs():
+            print "%5d  %s  %-12s %5d/%-5d lines passed  %s" % (id, time.strftime("%Y-%m-%d %H:%M", time.localtime(started)),
+                                                                version or "-", passed, count, otp_url)
+        sys.exit(0)
+
+    compare = None
+    if args.compare is not None:
+        try:
+            compare = [v if n == 0 and v == 'previous' else int(v) for n, v in enumerate(args.compare.split(','))]
+        except ValueError:
+            compare = []
+        if len(compare) not in (1, 2):
+            parser.error("--compare takes BASELINE[,RUN] run ids, BASELINE can be 'previous'")
+
+    if compare is not None and len(compare) == 2:
+        baseline = history.previous(compare[1]) if compare[0] == 'previous' else compare[0]
+        if baseline is None:
+            print "No run before run %d to compare with" % compare[1]
+        else:
+            print_regressions(history, baseline, compare[1], args.regression_threshold)
+        sys.exit(0)
+
+    # MERGE - combine the results files of several shards into one report, without testing
+
+    try:
+        shard = sharding.parse(args.shard) if args.shard is not None else None
+    except ValueError as ex:
+        parser.error(str(ex))
+
+    if args.merge is not None:
+        results_path = args.results_path or os.path.splitext(args.report_path)[0] + ".jsonl"
+        if os.path.abspath(results_path) in [os.path.abspath(m) for m in args.merge]:
+            parser.error("--merge would overwrite its input %s, set --results-path or --report-path" % results_path)
+
+        writers = [report_writer.ResultWriter(results_path)]
+        if args.junit_path is not None: writers.append(exporters.JUnitWriter(args.junit_path))
+        if args.json_path is not None: writers.append(exporters.CompactJSONWriter(args.json_path))
+
+        report = Report()
+        try:
+            for rec in sharding.merged_records(args.merge):
+                report.add(rec)
+                for w in writers: w.write(rec)
+        finally:
+            for w in writers: w.close()
+
+        fp = open(args.report_path, "w")
+        fp.write(report.render(args.template_path, fetch_stats=None))
+        fp.close()
+
+        summary = report.summary()
+        fp = open(os.path.splitext(args.report_path)[0] + "_summary.json", "w")
+        json.dump(summary, fp, indent=1, sort_keys=True)
+        fp.close()
+
+        for name in sorted(summary['classes']):
+            c = summary['classes'][name]
+            print "%-24s %6d pass %6d failures %6d errors %6d skipped" % (name, c['pass'], c['failures'], c['errors'],
+                                                                         c['skipped'])
+        print "Merged %d results files into %s" % (len(args.merge), args.report_path)
+        sys.exit(0)
+
     # set base parameters for tests from environment
     p = {'otp_url': args.otp_url}
     if args.date is not None: p['date'] = args.date
@@ -1089,7 +1924,7 @@ if __name__ == "__main__":
 
     # Load test parameters via google sheet
     if args.remote is True or args.url <> parser.get_default("url"):	
-	r = csv_remote(sys.argv[1:], parser)
+	r = csv_remote(sys.argv[1:], parser, cache_path=args.sheet_cache or None, concurrency=concurrency)
         test_suites = r.load_by_url(args.url)
     else:
         # Load tests from CSV files on disk
@@ -1126,130 +1961,140 @@ if __name__ == "__main__":
 
     	sys.exit(0)
 
+    # Bulk add the plan requests of a log, skipping the ones the suite already has
+    if args.add_file is not None:
+	cls = find_test_class(args.add_class or "USFPlanner")
+	if cls is None or "valid_url_parameters" not in dir(cls):
+		print "Not implemented for %s" % (args.add_class or "USFPlanner")
+		sys.exit(1)
 
-    for key, s in enumerate(test_suites):
-        i = 0
-        s["lines"] = []
-        for row in s['data']:
-            i += 1
-
-            # Skip test class if user chose to
-            if s['name'].lower() in args.skip_class: continue
-
-            # If user specified ONLY classes, skip anything not provided
-            if args.only_class is not False and s['name'].lower() not in args.only_class:
-                args.skip_class.append(s['name'].lower())
-                continue
+	# rows keep following --otp-url / OTP_URL instead of pinning the current one
+	base = dict((k, v) for k, v in p.items() if k != 'otp_url')
+	existing = [row for s in test_suites if s['cls'] is cls for row in s['data']]
+	log = ingest.Ingest(cls, base, existing)
 
-            # Override CSV parameters with cmd-line (unless they are defaults), and perform other initialization
-            for k in p:
-                if k in row and not p[k] == parser.get_default(k):
-                    row[k] = p[k]  # XXX ENVVAR will now be 'default' and not override csv ...
-                elif k not in row:
-                    row[k] = p[k]
-
-            # Convert strings into python literals where applicable (lists)
-            for k in row:
-                if len(row[k]) > 0 and row[k][0] == '[': row[k] = ast.literal_eval(row[k])
+	fp = ingest.open_log(args.add_file)
+	rows = list(log.rows(fp))
+	if fp is not sys.stdin: fp.close()
 
-            # Create TestSuites from loaded TestCases
+	if args.remote is True or args.url <> parser.get_default("url"):
+		added = r.append_rows(args.url, r.sheets[cls.__name__], rows)
+	else:
+		added = add_test_rows(args.csv_path, cls, rows)
 
-            obj = {}
-            obj['suite'] = USFTestSuite()
-            obj['result'] = TestResultSuccess()
-            obj['csv_line_number'] = i
-            obj['param'] = row
+	print "%d plan requests, %d duplicates, %d rows added" % (log.found, log.duplicates, added)
 
-            # s.addTests( OTPVersion.add_with_param(OTPVersion, {'major':1, 'minor':0}) )
-            obj['suite'].addTests(s['cls'].add_with_param(s['cls'], row))
-            s['lines'].append(obj)
+	sys.exit(0)
 
-    # RUN TESTS
 
-    report_data = {}
-    failures = 0
+    # light (suite, csv line number, params) tuples, streamed from the loaded suites, the
+    # suites themselves are built while running
+    lines = load_lines(test_suites, p, dict((k, parser.get_default(k)) for k in p), args.skip_class,
+                       args.only_class)
 
-    print "Running tests...",
+    if shard is not None:
+        lines = sharding.select(lines, shard[0], shard[1])
+        print "shard %d/%d..." % shard,
 
-    for s in test_suites:
+    # STRESS TEST - replay the planner requests without caching, then quit
 
-        # Skip test class if user chose to
-        if s['name'].lower() in args.skip_class: continue
+    if args.stress:
+        requests = stress_requests(lines)
 
-        if s['file'] not in report_data: report_data[s['file']] = {'run': 0, 'total': 0,
-                                                                    'skipped': {}, 'failures': {},
-                                                                   'errors': {}, 'pass': {}, 'param': {}}
-        data = {}
-        row = {}
-        row['suite'] = s
-        row['tests'] = []
-        row['stats'] = {'run':0, 'total':0, 'skipped':0, 'failures':0, 'errors':0, 'pass':0}
+        print "Stress testing %d planner requests..." % len(requests)
 
-        # for each line in the CSV files, run the suite and collect the results
-        for line in s['lines']:
+        run = stress.StressRun(requests, args.stress_concurrency, args.stress_iterations, args.stress_duration,
+                               args.timeout)
+        print run.run().report()
 
-            line['suite'].run(line['result'])
-            if line['result'].testsRun == 0: continue
+        sys.exit(0)
 
-            # with the result captured and for those tests that actually had tests to run, prepare the data for the template
+    # INCREMENTAL RUN - lines not selected by --changed-only / --failed-only reuse their last record
 
-            row['stats']['run'] += line['result'].testsRun
+    run_manifest = manifest.Manifest(args.manifest_path or os.path.splitext(args.report_path)[0] + "_manifest.json")
+    # only incremental runs need to know whether the server changed since a line's last run
+    identity = manifest.server_identity(fetch, args.otp_url) if args.changed_only or args.failed_only else None
 
-	    report_data[s['file']]['total'] += line['result'].testsRun
-	    report_data[s['file']]['run'] += line['result'].testsRun
-	    #report_data[s['file']]['total'] -= len(line['result'].skipped)
-	    #report_data[s['file']]['run'] -= len(line['result'].skipped)
+    digests = {}  # (file, line) -> digest of the lines in flight, until their record is written
+    counts = {'lines': 0, 'reused': 0}
 
-            desc = "%d (%s)" % (line['csv_line_number'], line['param']['description']) if 'description' in line[
-                   'param'] else "%d" % line['csv_line_number']
+    def reuse(lines):
+        """ (suite, line number, params, last record if it is reused, else None) """
+        for s, i, row in lines:
+            digest = manifest.row_digest(s['name'], row)
+            digests[(s['file'], i)] = digest
+            counts['lines'] += 1
 
-            f = []
+            rec = None
+            if args.changed_only or args.failed_only:
+                rec = run_manifest.record(s['file'], i)
+                if rec is not None and args.changed_only and run_manifest.changed(s['file'], i, digest, identity): rec = None
+                if rec is not None and args.failed_only and run_manifest.failed(s['file'], i): rec = None
+                if rec is not None:
+                    # not a result of this run, e.g. the run history skips it
+                    rec = dict(rec, reused=True)
+                    counts['reused'] += 1
 
-            # shouldStop, testsRun, unexpectedSuccesses
-            for status in ['errors', 'failures', 'skipped', 'expectedFailures']:
-                for test in getattr(line['result'], status):
-                    # tuple - test class, traceback
+            yield s, i, row, rec
 
-                    name = test[0].id().split('.')[-1]  # get the test name from the full python path (__file__.class.methodName)
-                    # get the data to output - either the full traceback, or the last line (assertionerror)
-                    if not args.debug:
-                        output = test[1].strip().split('\n')[-1]
-                    else:
-                        output = test[1]
+    lines = reuse(lines)
 
-		    if status in report_data[s['file']] and type(report_data[s['file']][status]) == dict: 
-			    report_data[s['file']][status]["%s:%s" % (desc, name)] = output
-                    row['tests'].append( {'name':name, 'output':output, 'status':status, 'line_number':line['csv_line_number']} )
+    # req_ prerequisites run on demand, once each, the first time a line needs them
 
-            """
-            failures += len(line['result'].failures)
+    # RUN TESTS
 
-            # XXX
-            for r in line['result'].expectedFailures:
-                report_data[s['file']]['pass']["%s:%s" % (r[0].methodName, line['csv_line_number'])] = {"note":"Expected Failure"}
-            """
+    print "Running tests...",
 
-    	    # build distinct set of tests run for template
-            tests = set()
-            for r in line['suite']:
-                tests.add(r.methodName)
-                if r.success == False: continue
+    if args.prefetch:
+        # prefetching is a phase of its own, it needs every line before the first one runs
+        lines = list(lines)
+        prefetch([(s, i, row) for s, i, row, rec in lines if rec is None], args.prefetch_concurrency)
+
+    # each line is built, run and reduced to a record on the worker pool, at most a window of
+    # lines is in flight and records still arrive in CSV line order.  Records are written out
+    # as they arrive, the report path holds a progressive page until the final report replaces it
+    results_path = args.results_path or os.path.splitext(args.report_path)[0] + ".jsonl"
+
+    writers = [report_writer.ResultWriter(results_path, args.report_path)]
+    if args.junit_path is not None: writers.append(exporters.JUnitWriter(args.junit_path))
+    if args.json_path is not None: writers.append(exporters.CompactJSONWriter(args.json_path))
+    if history is not None:
+        run_id = history.start(args.otp_url, run_store.otp_version(fetch, args.otp_url))
+        writers.append(run_store.HistoryWriter(history, run_id, lambda rec: _fetch_stats.elapsed(rec['url'])))
+
+    def run_or_reuse(line):
+        s, i, row, rec = line
+        return rec or run_line(s, i, row, args.debug)
+
+    if args.processes > 1:
+        records = run_lines_in_processes(lines, args.processes, args.prefetch_concurrency, args.debug)
+    else:
+        records = workers.imap(run_or_reuse, lines, args.workers)
 
-                # r.__class__.__name__
-                report_data[s['file']]['pass']["%s:%s" % (line['csv_line_number'], r.methodName)] = {"param":r.param}
+    try:
+        for rec in records:
+            digest = digests.pop((rec['file'], rec['line']))
 
-                name = r.methodName
-                output = {'param': r.param}
-                # XXX abstract this to the test class so e.g USFPlanner can output a link to view itinerary
+            # the network time of the line's url in this run, whichever line fetched it, None if
+            # it was never fetched from the network (e.g. replayed or from the response store)
+            if not rec.get('reused'): rec['response_time'] = _fetch_stats.elapsed(rec['url'])
 
-                row['tests'].append( {'name':name, 'output':output, 'status':'pass', 'line_number': line['csv_line_number']} )
+            # responses in debug output can hold any bytes, every writer and the manifest get unicode
+            rec = report_writer.safe_record(rec)
+            for w in writers: w.write(rec)
+            run_manifest.update(rec, digest, identity)
+    finally:
+        for w in writers: w.close()
+        run_manifest.save()
 
-        data[s['name']] = row
+    print "Done"
 
-        report_data[s['file']]['param'] = line['param']
-        report_data[s['file']]['tests'] = tests
+    if args.changed_only or args.failed_only:
+        print "%d of %d lines reused from the last run" % (counts['reused'], counts['lines'])
 
-    print "Done"
+    report = Report()
+    for rec in report_writer.load_records(results_path):
+        report.add(rec)
 
     # REPORT
 
@@ -1261,15 +2106,24 @@ if __name__ == "__main__":
 
     # simple_template.html
 
-    from mako import exceptions
-
-    report_template = Template(filename=args.template_path)
-
-    try:
-        r = report_template.render(data=data, test_suites=report_data, all_passed=True if failures <= 0 else False)
-    except:
-        r = exceptions.html_error_template().render()
+    unavailable = _breaker.unavailable()
+    r = report.render(args.template_path, fetch_stats=_fetch_stats.summary(), unavailable=unavailable)
 
     fp = open(args.report_path, "w")
     fp.write(r)
     fp.close()
+
+    _fetch_stats.write_json(args.timing_path or os.path.splitext(args.report_path)[0] + "_timing.json")
+
+    print _cache.summary()
+
+    for u in unavailable:
+        print "Endpoint unavailable: %s - %d requests not sent after %d failures (%s)" % (u['host'], u['rejected'],
+                                                                                       u['failures'], u['error'])
+
+    if compare is not None:
+        baseline = history.previous(run_id) if compare[0] == 'previous' else compare[0]
+        if baseline is None:
+            print "No earlier run to compare with"
+        else:
+            print_regressions(history, baseline, run_id, args.regression_threshold)
@@ -0,0 +1,118 @@
+import os
+import sys
+import socket
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import breaker
+import http_client
+
+
+URL = 'http://otp.example.com:8080/otp/routers/default/plan?fromPlace=1,2'
+
+
+class IsFailureTest(unittest.TestCase):
+
+    def test_server_errors(self):
+        self.assertTrue(breaker.is_failure(http_client.HTTPError(URL, 503, "")))
+        self.assertTrue(breaker.is_failure(socket.timeout("timed out")))
+        self.assertTrue(breaker.is_failure(socket.error(111, "Connection refused")))
+
+    def test_request_errors(self):
+        self.assertFalse(breaker.is_failure(http_client.HTTPError(URL, 404, "")))
+        self.assertFalse(breaker.is_failure(breaker.EndpointUnavailable(URL, 'otp.example.com:8080', "down")))
+
+
+class CircuitBreakerTest(unittest.TestCase):
+
+    def test_opens_after_threshold(self):
+        b = breaker.CircuitBreaker(threshold=2, cooldown=60)
+        b.failure(URL, socket.timeout())
+        b.check(URL)
+        b.failure(URL, socket.timeout())
+        self.assertRaises(breaker.EndpointUnavailable, b.check, URL)
+        self.assertRaises(breaker.EndpointUnavailable, b.check, 'http://otp.example.com:8080/otp/other')
+        b.check('http://otp2.example.com/otp/')
+
+        u = b.unavailable()
+        self.assertEqual([(h['host'], h['trips'], h['rejected'], h['open']) for h in u],
+                         [('otp.example.com:8080', 1, 2, True)])
+
+    def test_success_resets(self):
+        b = breaker.CircuitBreaker(threshold=2)
+        b.failure(URL, socket.timeout())
+        b.success(URL)
+        b.failure(URL, socket.timeout())
+        b.check(URL)
+        b.failure(URL, http_client.HTTPError(URL, 400, ""))
+        b.failure(URL, socket.timeout())
+        b.check(URL)
+
+    def test_probe_after_cooldown(self):
+        b = breaker.CircuitBreaker(threshold=1, cooldown=0)
+        b.failure(URL, socket.timeout())
+        b.check(URL)  # the probe
+        self.assertRaises(breaker.EndpointUnavailable, b.check, URL)
+        b.success(URL)
+        b.check(URL)
+        self.assertFalse(b.unavailable()[0]['open'])
+
+    def test_probe_cut_short(self):
+        b = breaker.CircuitBreaker(threshold=1, cooldown=0)
+        b.failure(URL, socket.timeout())
+        b.check(URL)  # the probe, cut short by its adaptive timeout
+        b.release(URL)
+        b.check(URL)  # another probe after the cooldown
+        b.success(URL)
+        b.check(URL)
+        self.assertFalse(b.unavailable()[0]['open'])
+
+    def test_release_keeps_open(self):
+        b = breaker.CircuitBreaker(threshold=1, cooldown=60)
+        b.failure(URL, socket.timeout())
+        b.hosts['otp.example.com:8080']['opened'] -= 60
+        b.check(URL)
+        b.release(URL)
+        self.assertRaises(breaker.EndpointUnavailable, b.check, URL)
+        self.assertEqual(b.hosts['otp.example.com:8080']['failures'], 1)
+
+    def test_threshold_zero_never_opens(self):
+        b = breaker.CircuitBreaker(threshold=0)
+        for i in range(10): b.failure(URL, socket.timeout())
+        b.check(URL)
+        self.assertEqual(b.unavailable(), [])
+
+
+class AdaptiveTimeoutTest(unittest.TestCase):
+
+    def test_off_by_default(self):
+        t = breaker.AdaptiveTimeout(cap=45)
+        for i in range(20): t.add(URL, 0.1)
+        self.assertEqual(t.timeout(URL), 45)
+        self.assertFalse(t.cut_short(socket.timeout(), t.timeout(URL)))
+
+    def test_multiple_of_p99(self):
+        t = breaker.AdaptiveTimeout(cap=45, multiplier=4, floor=0.5, min_samples=10)
+        for i in range(9): t.add(URL, 1.0)
+        self.assertEqual(t.timeout(URL), 45)
+        t.add(URL, 2.0)
+        self.assertEqual(t.timeout(URL), 8.0)
+        self.assertEqual(t.timeout('http://otp.example.com:8080/otp/routers/default/plan?toPlace=3,4'), 8.0)
+
+    def test_floor_and_cap(self):
+        t = breaker.AdaptiveTimeout(cap=5, multiplier=4, floor=2.0, min_samples=1)
+        t.add(URL, 0.01)
+        self.assertEqual(t.timeout(URL), 2.0)
+        t.add(URL, 10)
+        self.assertEqual(t.timeout(URL), 5)
+
+    def test_cut_short(self):
+        t = breaker.AdaptiveTimeout(cap=45, multiplier=4)
+        self.assertTrue(t.cut_short(socket.timeout(), 8.0))
+        self.assertFalse(t.cut_short(socket.timeout(), 45))
+        self.assertFalse(t.cut_short(socket.error(111, "Connection refused"), 8.0))
+
+
+if __name__ == '__main__':
+    unittest.main()
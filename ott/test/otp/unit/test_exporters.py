@@ -0,0 +1,72 @@
+import os
+import sys
+import json
+import logging
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import report_writer
+import exporters
+
+
+def rec(line, desc, *tests, **kw):
+    r = {'file': 'planner.csv', 'name': 'USFPlanner', 'line': line, 'desc': desc, 'run': len(tests), 'time': 0.5,
+         'response_time': 0.2, 'url': 'http://otp/plan?fromPlace=1,2',
+         'tests': [{'name': n, 'status': s, 'output': o, 'time': 0.1} for n, s, o in tests]}
+    r.update(kw)
+    return r
+
+
+RECORDS = [rec(1, "1 (caf\xc3\xa9)", ('test_a', 'pass', None), ('test_b', 'failures', 'AssertionError: x < 1'),
+               ('test_c', 'run', None)),
+           rec(2, "2", ('test_a', 'errors', 'body \xff\xfe'), ('test_b', 'skipped', 'suppress'), response_time=None),
+           rec(3, "3", run=0)]
+
+
+class ExportersTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        logging.disable(logging.WARNING)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+        shutil.rmtree(self.dir)
+
+    def path(self, name):
+        return os.path.join(self.dir, name)
+
+    def write(self, writer):
+        # test_runner hands every writer the safe_record() of a line
+        for r in RECORDS: writer.write(report_writer.safe_record(r))
+        writer.close()
+
+    def test_junit(self):
+        self.write(exporters.JUnitWriter(self.path('j.xml')))
+
+        import xml.etree.ElementTree as ElementTree
+        suite = ElementTree.parse(self.path('j.xml')).getroot().find('testsuite')
+        self.assertEqual([suite.get(a) for a in ('name', 'tests', 'failures', 'errors', 'skipped')],
+                         ['planner.csv', '4', '1', '1', '1'])
+        self.assertEqual(suite.findall('testcase')[1].find('failure').get('message'), 'AssertionError: x < 1')
+
+        latency = [[p.get('value') for p in case.iter('property') if p.get('name') == 'response_time']
+                   for case in suite.findall('testcase')]
+        self.assertEqual(latency, [['0.200'], ['0.200'], [], []])
+
+    def test_compact_json(self):
+        self.write(exporters.CompactJSONWriter(self.path('c.json')))
+
+        doc = json.load(open(self.path('c.json')))
+        self.assertEqual(doc['version'], 1)
+        self.assertEqual([l['line'] for l in doc['lines']], [1, 2])
+        self.assertEqual([l['response_time'] for l in doc['lines']], [0.2, None])
+        self.assertEqual(doc['lines'][0]['tests'], [['test_a', 'p', 0.1, None],
+                                                    ['test_b', 'f', 0.1, 'AssertionError: x < 1']])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import os
+import sys
+import logging
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import http_client
+import metrics
+import stub_server
+import test_runner
+
+
+class SharedFlightTest(unittest.TestCase):
+
+    def setUp(self):
+        logging.disable(logging.ERROR)
+        test_runner.configure_cache()
+        test_runner.configure_failures()
+        test_runner._fetch_stats = metrics.FetchRecorder()
+
+    def tearDown(self):
+        http_client.get_client().close()
+        self.stub.stop()
+        logging.disable(logging.NOTSET)
+
+    def fetch_concurrently(self, n=5):
+        url = self.stub.otp_url + 'routers/default/plan?fromPlace=28.06,-82.41&toPlace=28.05,-82.43'
+
+        def call():
+            try:
+                test_runner.fetch(url, 'xml', 'USFPlanner')
+            except Exception:
+                pass
+
+        threads = [threading.Thread(target=call) for i in range(n)]
+        for t in threads: t.start()
+        for t in threads: t.join()
+        return test_runner._fetch_stats.summary()['suites']['USFPlanner']
+
+    def test_followers_counted_as_hits(self):
+        self.stub = stub_server.StubServer(latency=0.3).start()
+        stats = self.fetch_concurrently()
+        self.assertEqual((stats['fetches'], stats['hits'], stats['errors']), (1, 4, 0))
+        self.assertEqual(self.stub.stats()['total'], 1)
+
+    def test_followers_counted_as_errors(self):
+        self.stub = stub_server.StubServer(latency=0.3, error_rate=1).start()
+        stats = self.fetch_concurrently()
+        self.assertEqual(stats['errors'], 5)
+        self.assertEqual(self.stub.stats()['total'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
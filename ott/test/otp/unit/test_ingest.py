@@ -0,0 +1,68 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ingest
+
+
+class ParamKeyTest(unittest.TestCase):
+
+    def test_order_and_encoding_independent(self):
+        a = {'fromPlace': ['28.06,-82.41'], 'toPlace': '28.05,-82.43', 'mode': 'TRANSIT,WALK'}
+        b = {'mode': ['transit', 'walk'], 'toPlace': '28.05%2C-82.43', 'fromPlace': '28.06,-82.41 '}
+        self.assertEqual(ingest.param_key(a), ingest.param_key(b))
+
+    def test_normalized_like_cache_keys(self):
+        a = {'fromPlace': '28.06,-82.41', 'toPlace': '28.05,-82.43', 'mode': 'WALK,BUS', 'arriveBy': 'false'}
+        b = {'fromPlace': '28.060000,-82.410000', 'toPlace': '28.0500001,-82.43', 'mode': 'BUS,WALK'}
+        self.assertEqual(ingest.param_key(a), ingest.param_key(b))
+        self.assertNotEqual(ingest.param_key(a), ingest.param_key(dict(b, toPlace='28.051,-82.43')))
+
+    def test_blank_values_dropped(self):
+        self.assertEqual(ingest.param_key({'mode': 'WALK', 'arriveBy': ''}), ingest.param_key({'mode': 'WALK'}))
+
+    def test_expectations_ignored(self):
+        row = {'fromPlace': '1,2', 'toPlace': '3,4'}
+        expect = dict(row, otp_url='http://x/otp/', description='row 7', duration='600', distance='1000',
+                      num_legs='1|3', not_expected='error')
+        self.assertEqual(ingest.param_key(row), ingest.param_key(expect))
+
+    def test_request_params_differ(self):
+        self.assertNotEqual(ingest.param_key({'fromPlace': '1,2', 'mode': 'WALK'}),
+                            ingest.param_key({'fromPlace': '1,2', 'mode': 'BICYCLE'}))
+
+
+class ExtractQueriesTest(unittest.TestCase):
+
+    def test_log_lines(self):
+        lines = ['127.0.0.1 - - [07/Jul/2014] "GET /otp/routers/default/plan?fromPlace=1,2&toPlace=3,4 HTTP/1.1" 200',
+                 'http://host:8080/otp/routers/default/plan?mode=WALK',
+                 'GET /otp/routers/default/index/stops 200']
+        self.assertEqual(list(ingest.extract_queries(lines)), ['fromPlace=1,2&toPlace=3,4', 'mode=WALK'])
+
+
+class Planner(object):
+
+    @staticmethod
+    def valid_url_parameters(p):
+        return dict((k, v) for k, v in p.items() if k in ('otp_url', 'fromPlace', 'toPlace', 'mode', 'duration'))
+
+
+class IngestTest(unittest.TestCase):
+
+    def test_duplicates_dropped(self):
+        existing = [{'fromPlace': '1,2', 'toPlace': '3,4', 'duration': '600', 'description': 'old'}]
+        i = ingest.Ingest(Planner, base={'otp_url': 'http://x/otp/'}, existing=existing)
+        rows = list(i.rows(['/otp/plan?fromPlace=1,2&toPlace=3,4',
+                            '/otp/plan?toPlace=3,4&fromPlace=1%2C2',
+                            '/otp/plan?fromPlace=5,6&toPlace=7,8',
+                            '/otp/plan?fromPlace=5,6&toPlace=7,8']))
+        self.assertEqual([r['fromPlace'] for r in rows], [['5,6']])
+        self.assertEqual(rows[0]['otp_url'], 'http://x/otp/')
+        self.assertEqual((i.found, i.duplicates), (4, 3))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import os
+import sys
+import logging
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import manifest
+
+
+def rec(line, *statuses):
+    return {'file': 'planner.csv', 'name': 'USFPlanner', 'line': line, 'run': len(statuses),
+            'tests': [{'name': 't%d' % n, 'status': s} for n, s in enumerate(statuses)]}
+
+
+class RowDigestTest(unittest.TestCase):
+
+    def test_stable(self):
+        a = manifest.row_digest('USFPlanner', {'mode': 'WALK', 'fromPlace': '1,2'}, 'srv')
+        b = manifest.row_digest('USFPlanner', dict([('fromPlace', '1,2'), ('mode', 'WALK')]), 'srv')
+        self.assertEqual(a, b)
+
+    def test_changes(self):
+        a = manifest.row_digest('USFPlanner', {'mode': 'WALK'}, 'srv')
+        self.assertNotEqual(a, manifest.row_digest('USFPlanner', {'mode': 'BICYCLE'}, 'srv'))
+        self.assertNotEqual(a, manifest.row_digest('Geocoder', {'mode': 'WALK'}, 'srv'))
+        self.assertNotEqual(a, manifest.row_digest('USFPlanner', {'mode': 'WALK'}, 'other'))
+
+
+class ServerIdentityTest(unittest.TestCase):
+
+    def setUp(self):
+        logging.disable(logging.WARNING)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_identity(self):
+        bodies = {'http://otp/': '{"serverVersion": {"version": "1.0"}}', 'http://otp/routers/default/metadata': '{}'}
+        fetch = lambda url, type, suite: (bodies[url], 0)
+        self.assertIsNotNone(manifest.server_identity(fetch, 'http://otp/'))
+
+        bodies['http://otp/routers/default/metadata'] = '{"lowerLeftLatitude": 27.5}'
+        self.assertNotEqual(manifest.server_identity(fetch, 'http://otp/'),
+                            manifest.server_identity(lambda url, type, suite: ('{}', 0), 'http://otp/'))
+
+    def test_unavailable(self):
+        def fetch(url, type, suite):
+            raise IOError("connection refused")
+
+        self.assertIsNone(manifest.server_identity(fetch, 'http://otp/'))
+
+
+class ManifestTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'manifest.json')
+        logging.disable(logging.WARNING)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+        shutil.rmtree(self.dir)
+
+    def test_passed(self):
+        self.assertTrue(manifest.passed(rec(1, 'pass', 'skipped')))
+        self.assertFalse(manifest.passed(rec(1, 'pass', 'failures')))
+        self.assertFalse(manifest.passed(rec(1, 'errors')))
+        self.assertFalse(manifest.passed(rec(1)))
+        self.assertFalse(manifest.passed(None))
+
+    def test_changed(self):
+        m = manifest.Manifest(self.path)
+        self.assertTrue(m.changed('planner.csv', 1, 'd1', 'srv'))
+
+        m.update(rec(1, 'pass'), 'd1', 'srv')
+        self.assertFalse(m.changed('planner.csv', 1, 'd1', 'srv'))
+        self.assertTrue(m.changed('planner.csv', 1, 'd2', 'srv'))
+        self.assertTrue(m.changed('planner.csv', 1, 'd1', 'other'))
+        self.assertTrue(m.changed('planner.csv', 1, 'd1', None))
+        self.assertTrue(m.changed('planner.csv', 2, 'd1', 'srv'))
+
+    def test_reused_keeps_entry(self):
+        m = manifest.Manifest(self.path)
+        m.update(rec(1, 'pass'), 'd1', 'old')
+        m.update(dict(m.record('planner.csv', 1), reused=True), 'd1', 'new')
+
+        self.assertTrue(m.changed('planner.csv', 1, 'd1', 'new'))
+        self.assertNotIn('reused', m.record('planner.csv', 1))
+
+    def test_saved(self):
+        m = manifest.Manifest(self.path)
+        m.update(rec(1, 'pass'), 'd1', 'srv')
+        m.update(rec(2, 'failures'), 'd2', 'srv')
+        m.save()
+
+        m = manifest.Manifest(self.path)
+        self.assertEqual(m.record('planner.csv', 1)['tests'][0]['status'], 'pass')
+        self.assertFalse(m.failed('planner.csv', 1))
+        self.assertTrue(m.failed('planner.csv', 2))
+        self.assertTrue(m.failed('planner.csv', 3))
+        self.assertIsNone(m.record('planner.csv', 3))
+        self.assertEqual(os.listdir(self.dir), ['manifest.json'])
+
+    def test_unreadable(self):
+        with open(self.path, 'w') as fp: fp.write('{"rows": ')
+        self.assertEqual(manifest.Manifest(self.path).rows, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
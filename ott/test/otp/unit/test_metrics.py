@@ -0,0 +1,74 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import metrics
+
+
+class PercentileTest(unittest.TestCase):
+
+    def test_empty(self):
+        self.assertIsNone(metrics.percentile([], 50))
+
+    def test_nearest_rank(self):
+        self.assertEqual(metrics.percentile(range(1, 11), 50), 5)
+        self.assertEqual(metrics.percentile(range(1, 11), 90), 9)
+        self.assertEqual(metrics.percentile(range(1, 101), 99), 99)
+        self.assertEqual(metrics.percentile(range(1, 101), 100), 100)
+
+    def test_between_ranks(self):
+        self.assertEqual(metrics.percentile(range(1, 11), 55), 6)
+        self.assertEqual(metrics.percentile([7], 50), 7)
+        self.assertEqual(metrics.percentile([1, 2, 3], 0), 1)
+
+
+class HistogramTest(unittest.TestCase):
+
+    def test_hits_and_errors_are_not_samples(self):
+        h = metrics.Histogram()
+        h.add(0.02, 100)
+        h.add(0, hit=True)
+        h.add(0.5, error=Exception("down"))
+
+        st = h.summary()
+        self.assertEqual((st['fetches'], st['hits'], st['errors'], st['bytes']), (1, 1, 1, 100))
+        self.assertEqual(st['p50'], 0.02)
+
+
+class FetchRecorderTest(unittest.TestCase):
+
+    URL = 'http://localhost:8080/otp/routers/default/plan?fromPlace=1,2'
+
+    def test_record(self):
+        r = metrics.FetchRecorder()
+        r.record(self.URL, 'USFPlanner', 0.2, 1000)
+        r.record(self.URL, 'USFPlanner', hit=True)
+        r.record(self.URL + '&mode=WALK', 'USFPlanner', 0.1, error=Exception("down"))
+
+        st = r.summary()
+        self.assertEqual(st['endpoints'].keys(), ['http://localhost:8080/otp/routers/default/plan'])
+        self.assertEqual([(s['fetches'], s['hits'], s['errors']) for s in st['suites'].values()], [(1, 1, 1)])
+        self.assertEqual(r.elapsed(self.URL), 0.2)
+        self.assertEqual([u['url'] for u in st['slowest']], [self.URL])
+        self.assertIsNone(r.log)
+
+    def test_replay_log(self):
+        worker = metrics.FetchRecorder(log=True)
+        worker.record(self.URL, 'USFPlanner', hit=True)
+        worker.record(self.URL, 'USFPlanner', 0, error=Exception("down"))
+        log = worker.take_log()
+        self.assertEqual(worker.take_log(), [])
+
+        parent = metrics.FetchRecorder()
+        parent.record(self.URL, 'USFPlanner', 0.2, 1000)
+        parent.replay(log)
+
+        st = parent.summary()['suites']['USFPlanner']
+        self.assertEqual((st['fetches'], st['hits'], st['errors']), (1, 1, 1))
+        self.assertEqual(parent.elapsed(self.URL), 0.2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import os
+import sys
+import json
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import planner_model
+
+
+XML = """<?xml version="1.0" encoding="UTF-8"?>
+<response xmlns="http://opentripplanner.org/">
+  <plan>
+    <itineraries>
+      <itinerary>
+        <duration>1200</duration>
+        <startTime>2014-07-07T08:00:00-04:00</startTime>
+        <endTime>2014-07-07T08:20:00-04:00</endTime>
+        <walkDistance>350.5</walkDistance>
+        <legs>
+          <leg mode="WALK"><distance>350.5</distance></leg>
+          <leg mode="BUS" route="5"><distance>4000</distance></leg>
+        </legs>
+      </itinerary>
+      <itinerary>
+        <duration>1500</duration>
+        <legs><leg mode="WALK"><distance>bad</distance></leg></legs>
+      </itinerary>
+    </itineraries>
+  </plan>
+</response>
+"""
+
+XML_ERROR = """<response><error><id>404</id><msg>No trip found</msg></error></response>"""
+
+
+class ParseXmlTest(unittest.TestCase):
+
+    def test_itineraries(self):
+        res = planner_model.parse(XML)
+        self.assertIsNone(res.parse_error)
+        self.assertEqual([it.duration for it in res.itineraries], [1200, 1500])
+
+        it = res.itineraries[0]
+        self.assertEqual((it.walk_distance, it.distance, it.modes), (350.5, 4350.5, ['WALK', 'BUS']))
+        self.assertEqual(planner_model.clock(it.start_time), (8, 0, 0))
+        self.assertEqual(res.modes, ['WALK', 'BUS', 'WALK'])
+        self.assertEqual(res.routes('BUS'), ['5'])
+        self.assertEqual(res.itineraries[1].distance, 0.0)
+
+    def test_errors(self):
+        res = planner_model.parse(XML_ERROR)
+        self.assertEqual((res.itineraries, res.errors), ([], [('404', 'No trip found')]))
+
+        res = planner_model.parse("<response><plan>")
+        self.assertIsNotNone(res.parse_error)
+
+
+class ParseJsonTest(unittest.TestCase):
+
+    def test_same_model_as_xml(self):
+        body = json.dumps({'plan': {'itineraries': [
+            {'duration': 1200, 'walkDistance': 350.5, 'legs': [{'mode': 'WALK', 'distance': 350.5},
+                                                               {'mode': 'BUS', 'route': '5', 'distance': 4000}]},
+            {'duration': 1500, 'legs': [{'mode': 'WALK', 'distance': None}]}]}})
+
+        a = planner_model.parse(body, 'json')
+        b = planner_model.parse(XML)
+        self.assertEqual([(it.duration, it.distance, it.modes) for it in a.itineraries],
+                         [(it.duration, it.distance, it.modes) for it in b.itineraries])
+        self.assertEqual(a.routes(), [None, '5', None])
+
+    def test_errors(self):
+        res = planner_model.parse('{"error": {"id": 404, "msg": "No trip found"}, "plan": null}', 'json')
+        self.assertEqual((res.itineraries, res.errors), ([], [(404, 'No trip found')]))
+        self.assertIsNotNone(planner_model.parse('<html>', 'json').parse_error)
+
+
+class ClockTest(unittest.TestCase):
+
+    def test_clock(self):
+        self.assertIsNone(planner_model.clock(None))
+        self.assertEqual(planner_model.clock('2014-07-07T23:59:58Z'), (23, 59, 58))
+        self.assertEqual(len(planner_model.clock(1404733294000)), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
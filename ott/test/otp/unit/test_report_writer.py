@@ -0,0 +1,73 @@
+import os
+import sys
+import json
+import logging
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import report_writer
+
+
+def rec(line, desc, *tests, **kw):
+    r = {'file': 'planner.csv', 'name': 'USFPlanner', 'line': line, 'desc': desc, 'run': len(tests), 'time': 0.5,
+         'response_time': 0.2, 'url': 'http://otp/plan?fromPlace=1,2',
+         'tests': [{'name': n, 'status': s, 'output': o, 'time': 0.1} for n, s, o in tests]}
+    r.update(kw)
+    return r
+
+
+RECORDS = [rec(1, "1 (caf\xc3\xa9)", ('test_a', 'pass', None), ('test_b', 'failures', 'AssertionError: x < 1'),
+               ('test_c', 'run', None)),
+           rec(2, "2", ('test_a', 'errors', 'body \xff\xfe'), ('test_b', 'skipped', 'suppress')),
+           rec(3, "3", run=0)]
+
+
+class SafeRecordTest(unittest.TestCase):
+
+    def test_decoded(self):
+        r = report_writer.safe_record({'a': ['caf\xc3\xa9', ('\xff',)], 'n': 1, u'u': None})
+        self.assertEqual(r, {u'a': [u'caf\xe9', [u'\ufffd']], u'n': 1, u'u': None})
+        json.dumps(r)
+
+    def test_counts(self):
+        self.assertEqual(report_writer.counts(RECORDS[0]),
+                         {'pass': 1, 'failures': 1, 'errors': 0, 'skipped': 0, 'expectedFailures': 0})
+
+
+class WritersTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        logging.disable(logging.WARNING)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+        shutil.rmtree(self.dir)
+
+    def path(self, name):
+        return os.path.join(self.dir, name)
+
+    def write(self, writer):
+        # test_runner hands every writer the safe_record() of a line
+        for r in RECORDS: writer.write(report_writer.safe_record(r))
+        writer.close()
+
+    def test_results_round_trip(self):
+        self.write(report_writer.ResultWriter(self.path('r.jsonl'), self.path('r.html')))
+        with open(self.path('r.jsonl'), 'a') as fp: fp.write('{"truncated')
+
+        records = list(report_writer.load_records(self.path('r.jsonl')))
+        self.assertEqual([r['line'] for r in records], [1, 2, 3])
+        self.assertEqual(records[0]['desc'], u"1 (caf\xe9)")
+
+        html = open(self.path('r.html')).read()
+        self.assertEqual(html.count('<tr><td>'), 2)
+        self.assertIn("caf\xc3\xa9", html)
+        self.assertIn("3 lines finished", html)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,162 @@
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import response_cache
+
+
+PLAN = 'http://localhost:8080/otp/routers/default/plan'
+
+
+class CoordinateTest(unittest.TestCase):
+
+    def test_rounded(self):
+        self.assertEqual(response_cache._coordinate('28.0587,-82.4139'), '28.058700,-82.413900')
+        self.assertEqual(response_cache._coordinate('28.05870004,-82.41389996'), '28.058700,-82.413900')
+
+    def test_named_place(self):
+        self.assertEqual(response_cache._coordinate('USF Library::28.0587,-82.4139'),
+                         'USF Library::28.058700,-82.413900')
+
+    def test_not_a_coordinate(self):
+        for v in ('', 'USF Library', '1:2', '28.0587', '28.0587,-82.4139,3', 'a,b'):
+            self.assertEqual(response_cache._coordinate(v), v)
+
+
+class CanonicalUrlTest(unittest.TestCase):
+
+    def test_param_order_and_case(self):
+        self.assertEqual(response_cache.canonical_url('HTTP://LocalHost:8080/otp/x?b=2&a=1'),
+                         response_cache.canonical_url('http://localhost:8080/otp/x?a=1&b=2'))
+
+    def test_plan_spellings(self):
+        a = PLAN + '?fromPlace=28.0587,-82.4139&toPlace=27.95,-82.45&mode=WALK,TRANSIT'
+        b = PLAN + '?toPlace=27.950000001,-82.45&mode=transit, walk&arriveBy=false&fromPlace=28.0587,-82.4139'
+        self.assertEqual(response_cache.canonical_url(a), response_cache.canonical_url(b))
+
+    def test_non_default_kept(self):
+        self.assertNotEqual(response_cache.canonical_url(PLAN + '?arriveBy=true&mode=WALK'),
+                            response_cache.canonical_url(PLAN + '?mode=WALK'))
+        self.assertNotEqual(response_cache.canonical_url(PLAN + '?fromPlace=28.0587,-82.4139'),
+                            response_cache.canonical_url(PLAN + '?fromPlace=28.0588,-82.4139'))
+
+    def test_defaults_only_dropped_for_plan(self):
+        url = 'http://localhost:8080/otp/routers/default/index/stops?mode=TRANSIT,WALK'
+        self.assertIn('mode=', response_cache.canonical_url(url))
+
+    def test_blank_values_kept(self):
+        self.assertEqual(response_cache.canonical_url(PLAN + '?date=&mode=WALK'), PLAN + '?date=&mode=WALK')
+
+
+class LRUCacheTest(unittest.TestCase):
+
+    def test_least_recently_used_evicted(self):
+        c = response_cache.LRUCache(max_bytes=6)
+        c.set('a', 'aa')
+        c.set('b', 'bb')
+        c.set('c', 'cc')
+        self.assertEqual(c.get('a'), 'aa')
+        c.set('d', 'dd')
+        self.assertIsNone(c.get('b'))
+        self.assertEqual([c.get(k) for k in 'acd'], ['aa', 'cc', 'dd'])
+        self.assertEqual((c.bytes, c.evictions), (6, 1))
+
+    def test_too_large_not_stored(self):
+        c = response_cache.LRUCache(max_bytes=4)
+        c.set('a', 'aaaaa')
+        self.assertEqual(len(c), 0)
+
+    def test_expired(self):
+        c = response_cache.LRUCache(ttl=-1)
+        c.set('a', 'aa')
+        c.set('b', 'bb', ttl=60)
+        self.assertIsNone(c.get('a'))
+        self.assertEqual(c.get('b'), 'bb')
+        self.assertEqual((c.hits, c.misses, c.expired), (1, 1, 1))
+
+    def test_uncounted_lookup(self):
+        c = response_cache.LRUCache()
+        self.assertIsNone(c.get('a', count=False))
+        c.set('a', 'aa')
+        self.assertEqual(c.get('a', count=False), 'aa')
+        self.assertEqual((c.hits, c.misses), (0, 0))
+
+    def test_compressed(self):
+        c = response_cache.LRUCache(compress=True)
+        body = 'x' * 4096
+        c.set('a', body)
+        self.assertLess(c.bytes, len(body))
+        self.assertEqual(c.get('a'), body)
+
+
+class NegativeCacheTest(unittest.TestCase):
+
+    def test_failure_remembered(self):
+        c = response_cache.NegativeCache()
+        self.assertIsNone(c.get('k'))
+
+        ex = ValueError("connection refused")
+        ex.status = None
+        c.set('k', ex)
+        failed = c.get('k')
+        self.assertIsInstance(failed, response_cache.CachedFailure)
+        self.assertEqual((failed.error_type, failed.status, failed.error), ('ValueError', None, 'connection refused'))
+
+    def test_cached_failure_keeps_original(self):
+        c = response_cache.NegativeCache()
+        c.set('k', response_cache.CachedFailure('u', 'HTTPError', 503, 'unavailable'))
+        self.assertEqual(response_cache.NegativeCache.entry(c.get('k')),
+                         {'type': 'HTTPError', 'status': 503, 'error': 'unavailable'})
+
+    def test_entry_dict(self):
+        c = response_cache.NegativeCache()
+        c.set('k', {'type': 'timeout', 'status': None, 'error': 'timed out'})
+        self.assertEqual(c.get('k').error_type, 'timeout')
+
+    def test_expired(self):
+        c = response_cache.NegativeCache(ttl=0.01)
+        c.set('k', ValueError())
+        time.sleep(0.02)
+        self.assertIsNone(c.get('k'))
+        self.assertEqual(len(c), 0)
+
+    def test_disabled(self):
+        c = response_cache.NegativeCache(ttl=0)
+        c.set('k', ValueError())
+        self.assertIsNone(c.get('k'))
+
+
+class DiskCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.store = response_cache.DiskCache(':memory:')
+
+    def tearDown(self):
+        self.store.close()
+
+    def test_any_spelling(self):
+        self.store.set(PLAN + '?fromPlace=28.0587,-82.4139&mode=WALK', 'xml', 'body')
+        self.assertEqual(self.store.get(PLAN + '?mode=walk&fromPlace=28.05870000,-82.4139&arriveBy=false', 'xml'),
+                         'body')
+        self.assertIsNone(self.store.get(PLAN + '?fromPlace=28.0587,-82.4139&mode=WALK', 'json'))
+
+    def test_delete(self):
+        for version in ('v1', 'v2', 'v3'):
+            self.store.set('sheet:KEY/od6', version, version)
+        self.store.set('sheet:KEY/od7', 'v1', 'other')
+
+        self.assertEqual(self.store.delete('sheet:KEY/od6', keep='v3'), 2)
+        self.assertEqual((self.store.get('sheet:KEY/od6', 'v1'), self.store.get('sheet:KEY/od6', 'v3')), (None, 'v3'))
+        self.assertEqual(self.store.get('sheet:KEY/od7', 'v1'), 'other')
+
+    def test_meta(self):
+        self.assertIsNone(self.store.get_meta('date'))
+        self.store.set_meta('date', '2014-07-07')
+        self.assertEqual(self.store.get_meta('date'), '2014-07-07')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import os
+import sys
+import logging
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import run_store
+
+
+def rec(line, status='pass', metrics=None, otp_url='http://otp1/otp/', **kw):
+    r = {'file': 'planner.csv', 'name': 'USFPlanner', 'line': line, 'desc': "%d" % line, 'run': 1,
+         'param': {'fromPlace': '%d,2' % line, 'otp_url': otp_url}, 'metrics': metrics,
+         'tests': [{'name': 'test_trip_duration', 'status': status}]}
+    r.update(kw)
+    return r
+
+
+class OtpVersionTest(unittest.TestCase):
+
+    def setUp(self):
+        logging.disable(logging.WARNING)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_versions(self):
+        v = lambda body: run_store.otp_version(lambda url, type, suite: (body, 0), 'http://otp/')
+        self.assertEqual(v('{"serverVersion": {"version": "0.19.0"}}'), '0.19.0')
+        self.assertEqual(v('{"serverVersion": {"major": 1, "minor": 0}}'), '1.0.0')
+        self.assertIsNone(v('{}'))
+        self.assertIsNone(v('not json'))
+
+
+class RunStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.store = run_store.RunStore(':memory:')
+
+    def tearDown(self):
+        self.store.close()
+
+    def run_with(self, *records, **kw):
+        run = self.store.start('http://otp/', '1.0')
+        for r in records: self.store.add(run, r, kw.get('latency', {}).get(r['line']))
+        self.store.finish(run)
+        return run
+
+    def test_runs(self):
+        a = self.run_with(rec(1), rec(2, 'failures'))
+        b = self.run_with(rec(1), rec(2), rec(3, run=0))
+        self.assertEqual([(r[0], r[4], r[5]) for r in self.store.runs()], [(b, 2, 2), (a, 2, 1)])
+        self.assertEqual(self.store.previous(b), a)
+        self.assertIsNone(self.store.previous(a))
+
+    def test_reused_records_skipped(self):
+        run = self.run_with(rec(1), rec(2, reused=True))
+        self.assertEqual(self.store.runs()[0][4], 1)
+
+    def test_compare(self):
+        a = self.run_with(rec(1), rec(2, metrics={'itineraries': 3, 'duration': 600.0, 'distance': 1000.0}),
+                          rec(3), rec(4), latency={3: 0.1, 4: 1.0})
+        b = self.run_with(rec(1, 'failures'), rec(2, metrics={'itineraries': 1, 'duration': 900.0, 'distance': 1100.0}),
+                          rec(3, otp_url='http://otp2/otp/'), rec(4), latency={3: 0.12, 4: 2.0})
+
+        found = sorted((r.line, r.metric) for r in self.store.compare(a, b, 0.2))
+        self.assertEqual(found, [(1, 'passed'), (2, 'duration'), (2, 'itineraries'), (4, 'latency')])
+
+    def test_changed_params_not_compared(self):
+        a = self.run_with(rec(1))
+        changed = rec(1, 'failures')
+        changed['param']['mode'] = 'WALK'
+        b = self.run_with(changed)
+        self.assertEqual(self.store.compare(a, b), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sharding
+
+
+class ParseTest(unittest.TestCase):
+
+    def test_valid(self):
+        self.assertEqual(sharding.parse('1/4'), (1, 4))
+        self.assertEqual(sharding.parse('4/4'), (4, 4))
+
+    def test_invalid(self):
+        for v in ('', '1', '0/4', '5/4', '1/0', 'a/b', '1/2/3', None):
+            self.assertRaises(ValueError, sharding.parse, v)
+
+
+class KeyTest(unittest.TestCase):
+
+    def test_path_independent(self):
+        a = {'name': 'USFPlanner', 'file': '/home/a/suites/USFPlanner/planner.csv'}
+        b = {'name': 'USFPlanner', 'file': 'suites/USFPlanner/planner.csv'}
+        self.assertEqual(sharding.key(a, 3), 'USFPlanner/planner.csv:3')
+        self.assertEqual(sharding.key(a, 3), sharding.key(b, 3))
+        self.assertNotEqual(sharding.key(a, 3), sharding.key(a, 4))
+        self.assertEqual(sharding.shard(a, 3, 7), sharding.shard(b, 3, 7))
+
+    def test_select_partitions(self):
+        s = {'name': 'USFPlanner', 'file': 'planner.csv'}
+        lines = [(s, i, {}) for i in range(1, 101)]
+        picked = [[i for _, i, _ in sharding.select(iter(lines), k, 3)] for k in (1, 2, 3)]
+        self.assertEqual(sorted(sum(picked, [])), range(1, 101))
+        self.assertTrue(all(len(p) > 0 for p in picked))
+
+
+class MergedRecordsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def results(self, name, records):
+        path = os.path.join(self.dir, name)
+        with open(path, 'w') as fp:
+            for r in records: fp.write(json.dumps(r) + "\n")
+        return path
+
+    @staticmethod
+    def rec(file, line, status='pass', name='USFPlanner'):
+        return {'file': file, 'name': name, 'line': line, 'run': 1, 'tests': [{'name': 't', 'status': status}]}
+
+    def test_ordered_and_last_record_kept(self):
+        a = self.results('a.jsonl', [self.rec('p.csv', 3), self.rec('p.csv', 1, 'errors')])
+        b = self.results('b.jsonl', [self.rec('p.csv', 2), self.rec('p.csv', 1)])
+        merged = list(sharding.merged_records([a, b]))
+        self.assertEqual([(r['line'], r['tests'][0]['status']) for r in merged], [(1, 'pass'), (2, 'pass'), (3, 'pass')])
+
+    def test_shards_from_different_paths(self):
+        a = self.results('a.jsonl', [self.rec('/host1/suites/USFPlanner/p.csv', 1, 'errors'),
+                                     self.rec('/host1/suites/USFPlanner/p.csv', 2)])
+        b = self.results('b.jsonl', [self.rec('/host2/checkout/USFPlanner/p.csv', 1),
+                                     self.rec('/host2/checkout/USFPlanner/p.csv', 3)])
+        merged = list(sharding.merged_records([a, b]))
+        self.assertEqual([(r['file'], r['line'], r['tests'][0]['status']) for r in merged],
+                         [('/host1/suites/USFPlanner/p.csv', 1, 'pass'), ('/host1/suites/USFPlanner/p.csv', 2, 'pass'),
+                          ('/host1/suites/USFPlanner/p.csv', 3, 'pass')])
+
+    def test_suites_kept_apart(self):
+        a = self.results('a.jsonl', [self.rec('p.csv', 1), self.rec('p.csv', 1, name='Geocoder')])
+        self.assertEqual(len(list(sharding.merged_records([a]))), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sheets
+
+
+URL = 'https://spreadsheets.google.com/feeds/KEY'
+
+PLANNER = [['description', 'fromPlace', 'toPlace', 'mode'],
+           ['', '28.0587,-82.4139', '27.95,-82.45', 'WALK'],
+           ['row 3', '28.06,-82.41', '-', '']]
+
+
+def find_class(title):
+    return title if title in ('USFPlanner', 'Geocoder') else None
+
+
+class RowsFromCellsTest(unittest.TestCase):
+
+    def test_blank_and_placeholder_cells(self):
+        rows = sheets.rows_from_cells(sheets.LocalSheets([('USFPlanner', PLANNER)]).get_cells(URL, 'od6').entry)
+        self.assertEqual(rows, [{'description': '', 'fromPlace': '28.0587,-82.4139', 'toPlace': '27.95,-82.45',
+                                 'mode': 'WALK'},
+                                {'description': 'row 3', 'fromPlace': '28.06,-82.41', 'toPlace': '', 'mode': ''}])
+
+
+class SheetLoaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.cache = sheets.SheetCache(os.path.join(self.dir, 'sheets.db'))
+        self.client = sheets.LocalSheets([('USFPlanner', PLANNER), ('notes', [['x']]), ('Geocoder', [])])
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.dir)
+
+    def load(self):
+        loader = sheets.SheetLoader(self.client, concurrency=2, cache=self.cache)
+        suites, ids = loader.load(URL, find_class)
+        return loader, suites, ids
+
+    def test_load(self):
+        loader, suites, ids = self.load()
+        self.assertEqual(ids, {'USFPlanner': 'od6', 'Geocoder': 'od8'})
+        self.assertEqual([(s['name'], s['cls'], len(s['data'])) for s in suites], [('USFPlanner', 'USFPlanner', 2)])
+        self.assertEqual(suites[0]['data'][0]['mode'], 'WALK')
+        self.assertEqual(self.client.get_cells_calls, 1)
+
+    def test_unchanged_sheet_not_downloaded(self):
+        first = self.load()[1]
+        loader, suites, ids = self.load()
+        self.assertEqual((loader.downloaded, loader.cached), (0, 2))
+        self.assertEqual(self.client.get_cells_calls, 1)
+        self.assertEqual(suites, first)
+        self.assertIsInstance(suites[0]['data'][0]['mode'], str)
+
+    def test_changed_sheet_replaces_cached_version(self):
+        self.load()
+        self.client.set_rows('USFPlanner', PLANNER[:2])
+        loader, suites, ids = self.load()
+        self.assertEqual((loader.downloaded, loader.cached), (1, 1))
+        self.assertEqual(len(suites[0]['data']), 1)
+        self.assertEqual(len(self.cache.store), 1)
+
+    def test_without_cache(self):
+        loader = sheets.SheetLoader(self.client)
+        loader.load(URL, find_class)
+        loader.load(URL, find_class)
+        self.assertEqual(self.client.get_cells_calls, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import http_client
+import stress
+import stub_server
+import test_runner
+
+
+class StressRunTest(unittest.TestCase):
+
+    def setUp(self):
+        self.stub = stub_server.StubServer().start()
+
+    def tearDown(self):
+        http_client.get_client().close()
+        self.stub.stop()
+
+    def lines(self):
+        planner = {'file': 'planner.csv', 'name': 'USFPlanner', 'cls': test_runner.USFPlanner}
+        geocoder = {'file': 'geocoder.csv', 'name': 'USFGeocoder', 'cls': test_runner.USFGeocoder}
+        otp = self.stub.otp_url
+        return [(planner, 2, {'otp_url': otp, 'fromPlace': '28.0587,-82.4139', 'toPlace': '27.95,-82.45',
+                              'mode': 'WALK', 'date': '2014-07-07'}),
+                (geocoder, 2, {'otp_url': otp, 'address': 'USF'}),
+                (planner, 3, {'otp_url': otp, 'fromPlace': '28.06,-82.41', 'toPlace': '28.05,-82.43',
+                              'mode': 'TRANSIT,WALK', 'date': '2014-07-07'})]
+
+    def test_planner_lines_only(self):
+        requests = test_runner.stress_requests(self.lines())
+        self.assertEqual([(r['suite'], r['line'], r['type']) for r in requests],
+                         [('planner.csv', 2, 'xml'), ('planner.csv', 3, 'xml')])
+        self.assertIn('fromPlace=28.06%2C-82.41', requests[1]['url'])
+
+    def test_run(self):
+        run = stress.StressRun(test_runner.stress_requests(self.lines()), concurrency=2, iterations=3).run()
+
+        self.assertEqual(run.total.count, 6)
+        self.assertEqual(run.total.errors, 0)
+        self.assertEqual(sorted((k, s.count) for k, s in run.lines.items()),
+                         [(('planner.csv', 2), 3), (('planner.csv', 3), 3)])
+        self.assertEqual(self.stub.stats()['total'], 6)
+        self.assertIn("planner.csv:3", run.report())
+
+
+if __name__ == '__main__':
+    unittest.main()
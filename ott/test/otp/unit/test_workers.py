@@ -0,0 +1,96 @@
+import os
+import sys
+import time
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import workers
+
+
+class SingleFlightTest(unittest.TestCase):
+
+    def run_concurrently(self, flights, key, func, n=5):
+        results = []
+        lock = threading.Lock()
+
+        def call():
+            try:
+                r = flights.do(key, func)
+            except Exception as ex:
+                r = ex
+            with lock:
+                results.append(r)
+
+        threads = [threading.Thread(target=call) for i in range(n)]
+        for t in threads: t.start()
+        for t in threads: t.join()
+        return results
+
+    def test_concurrent_calls_share_one_result(self):
+        calls = []
+        release = threading.Event()
+
+        def slow():
+            calls.append(1)
+            release.wait(5)
+            return 'body'
+
+        flights = workers.SingleFlight()
+        t = threading.Timer(0.2, release.set)
+        t.start()
+        results = self.run_concurrently(flights, 'k', slow)
+        t.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(results), [('body', False)] + [('body', True)] * 4)
+
+    def test_error_shared(self):
+        release = threading.Event()
+
+        def fail():
+            release.wait(5)
+            raise ValueError("down")
+
+        flights = workers.SingleFlight()
+        t = threading.Timer(0.2, release.set)
+        t.start()
+        results = self.run_concurrently(flights, 'k', fail)
+        t.join()
+
+        self.assertEqual(len(results), 5)
+        self.assertTrue(all(isinstance(r, ValueError) for r in results))
+
+    def test_sequential_calls_not_shared(self):
+        calls = []
+        flights = workers.SingleFlight()
+        for i in range(3):
+            self.assertEqual(flights.do('k', lambda: calls.append(1) or len(calls)), (i + 1, False))
+        self.assertEqual(flights.flights, {})
+
+    def test_keys_independent(self):
+        flights = workers.SingleFlight()
+        self.assertEqual(flights.do('a', lambda: flights.do('b', lambda: 2)), ((2, False), False))
+
+
+class ImapTest(unittest.TestCase):
+
+    def test_ordered(self):
+        def f(i):
+            time.sleep(0.01 * (5 - i))
+            return i * i
+
+        self.assertEqual(list(workers.imap(f, xrange(5), workers=3)), [0, 1, 4, 9, 16])
+        self.assertEqual(list(workers.imap(f, xrange(5))), [0, 1, 4, 9, 16])
+
+    def test_error_raised(self):
+        def f(i):
+            if i == 2: raise ValueError(i)
+            return i
+
+        self.assertRaises(ValueError, list, workers.imap(f, xrange(5), workers=2))
+
+
+if __name__ == '__main__':
+    unittest.main()
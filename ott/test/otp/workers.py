@@ -0,0 +1,157 @@
+"""
+Bounded thread and process pool helpers for the OTP test runner
+
+Results are always handed back in the order the items were submitted, so
+callers can treat imap() and process_imap() as drop-ins for itertools.imap().
+"""
+
+import sys
+import threading
+import Queue
+import multiprocessing
+
+
+class WorkerPool(object):
+    """ Fixed-size pool of daemon threads pulling (func, args) jobs from a queue """
+
+    def __init__(self, workers=1):
+        self.workers = max(1, int(workers))
+        self.jobs = Queue.Queue()
+        self.threads = []
+
+        for i in xrange(self.workers):
+            t = threading.Thread(target=self._work, name="otp-worker-%d" % i)
+            t.daemon = True
+            t.start()
+            self.threads.append(t)
+
+    def _work(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+
+            func, args, slot = job
+            try:
+                slot['value'] = func(*args)
+            except BaseException:
+                slot['error'] = sys.exc_info()
+            slot['done'].set()
+
+    def submit(self, func, *args):
+        """ queue func(*args), returns a slot to pass to wait() """
+        slot = {'done': threading.Event()}
+        self.jobs.put((func, args, slot))
+        return slot
+
+    @staticmethod
+    def wait(slot):
+        """ block until the slot finishes, re-raising any exception from the worker """
+        # Event.wait() without a timeout can't be interrupted by ^C on python 2
+        while not slot['done'].wait(0.5):
+            pass
+
+        if 'error' in slot:
+            raise slot['error'][0], slot['error'][1], slot['error'][2]
+
+        return slot['value']
+
+    def close(self):
+        for t in self.threads:
+            self.jobs.put(None)
+        for t in self.threads:
+            t.join()
+
+
+class SingleFlight(object):
+    """
+    Coalesces concurrent calls per key: while func runs for a key, other threads asking
+    for the same key wait for its result (or exception) instead of calling func again
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flights = {}  # key -> slot, see WorkerPool.submit()
+
+    def do(self, key, func, *args):
+        """ returns (func(*args), shared), shared is True if another thread's call was waited for """
+
+        with self.lock:
+            slot = self.flights.get(key)
+            leader = slot is None
+            if leader:
+                slot = {'done': threading.Event()}
+                self.flights[key] = slot
+
+        if not leader:
+            return WorkerPool.wait(slot), True
+
+        try:
+            slot['value'] = func(*args)
+        except BaseException:
+            slot['error'] = sys.exc_info()
+        finally:
+            with self.lock:
+                del self.flights[key]
+            slot['done'].set()
+
+        return WorkerPool.wait(slot), False
+
+
+def imap(func, items, workers=1, window=None):
+    """
+    Ordered, lazy map of func over items using up to 'workers' threads
+
+    At most 'window' items (default 2x workers) are in flight at any time, so
+    items can be a generator and memory stays bounded by the window.
+    """
+
+    if workers <= 1:
+        for item in items:
+            yield func(item)
+        return
+
+    if window is None:
+        window = workers * 2
+
+    pool = WorkerPool(workers)
+    pending = []
+    try:
+        for item in items:
+            pending.append(pool.submit(func, item))
+            if len(pending) >= window:
+                yield pool.wait(pending.pop(0))
+
+        while len(pending) > 0:
+            yield pool.wait(pending.pop(0))
+    finally:
+        pool.close()
+
+
+def process_imap(func, items, processes=2, window=None, initializer=None, initargs=()):
+    """
+    Ordered, lazy map of func over items on a pool of 'processes' worker processes
+
+    func and the items must be picklable, func a module-level function.  Like imap(),
+    at most 'window' items (default 4x processes) are in flight, unlike Pool.imap() which
+    queues every item up front.  initializer(*initargs) runs once in each worker.
+    """
+
+    if window is None:
+        window = processes * 4
+
+    pool = multiprocessing.Pool(processes, initializer, initargs)
+    pending = []
+    try:
+        for item in items:
+            pending.append(pool.apply_async(func, (item,)))
+            if len(pending) >= window:
+                yield pending.pop(0).get()
+
+        while len(pending) > 0:
+            yield pending.pop(0).get()
+
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()